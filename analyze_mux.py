@@ -1,84 +1,29 @@
 import os
 import sys
-import m3u8
-import requests
-import subprocess
-import json
 import shutil
-from urllib.parse import urljoin
 from tabulate import tabulate
+from segment_fetcher import SegmentFetcher, resolve_uri, segment_jobs
+from gop_forensics import analyze_segments, summarize
+import ts_parser
+from probe_service import ProbeService
 
 # ==============================================================================
 #  MUX FORENSIC ANALYZER (ROBUST VERSION)
 # ==============================================================================
 
-def get_ffprobe_data(file_path):
-    """Deep analysis using ffprobe"""
-    cmd = [
-        "ffprobe", "-v", "quiet",
-        "-print_format", "json",
-        "-show_format",
-        "-show_streams",
-        "-show_frames",
-        "-select_streams", "v:0",  # Video only for frames
-        "-read_intervals", "%+#100", # Read first 100 frames/packets only to be fast
-        file_path
-    ]
-    # إضافة shell=False للأمان وتوافق أفضل
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    try:
-        return json.loads(result.stdout)
-    except Exception as e:
-        # طباعة الخطأ إذا فشل ffprobe في إخراج JSON سليم
-        # print(f"JSON Error: {e}") 
-        return None
-
-def analyze_gop(frames):
-    """Analyze Group of Pictures structure with SAFE timestamp extraction"""
-    if not frames:
+def analyze_gop(gop):
+    """GOP string, GOP duration and I count of one segment from its packet forensics"""
+    if not gop or not gop['packets']:
         return "N/A", 0, 0
-    
-    i_frames = [f for f in frames if f.get('pict_type') == 'I']
-    p_frames = [f for f in frames if f.get('pict_type') == 'P']
-    b_frames = [f for f in frames if f.get('pict_type') == 'B']
-    
-    # دالة مساعدة لاستخراج التوقيت بأمان
-    def get_ts(f):
-        # 1. نحاول الحصول على PTS (وقت العرض)
-        t = f.get('pkt_pts_time')
-        # 2. إذا لم يوجد، نحاول الحصول على DTS (وقت فك التشفير)
-        if not t:
-            t = f.get('pkt_dts_time')
-        # 3. تحويله لرقم أو إرجاع صفر
-        try:
-            return float(t) if t else 0.0
-        except:
-            return 0.0
 
-    # حساب طول الـ GOP
-    gop_len_sec = 0
-    if len(i_frames) >= 2:
-        # المسافة الزمنية بين أول إطارين I
-        gop_len_sec = get_ts(i_frames[1]) - get_ts(i_frames[0])
-    elif frames:
-        # تقدير بناء على مدة العينة المحللة بالكامل إذا لم نجد I-Frames كافية
-        gop_len_sec = get_ts(frames[-1]) - get_ts(frames[0])
+    if gop['intervals']:
+        # متوسط المسافة الزمنية بين إطارات I داخل المقطع
+        gop_len_sec = sum(gop['intervals']) / len(gop['intervals'])
+    else:
+        # إطار I واحد فقط: الـ GOP يغطي المقطع بالكامل
+        gop_len_sec = gop['duration']
 
-    return f"I={len(i_frames)}, P={len(p_frames)}, B={len(b_frames)}", gop_len_sec, len(i_frames)
-
-def download_file(url, folder, filename):
-    local_path = os.path.join(folder, filename)
-    try:
-        # timeout مضاف لتجنب التعليق
-        r = requests.get(url, stream=True, timeout=15)
-        if r.status_code == 200:
-            with open(local_path, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=1024):
-                    f.write(chunk)
-            return local_path
-    except Exception as e:
-        print(f"   ⚠️ Error downloading segment: {e}")
-    return None
+    return f"I={gop['I']}, P={gop['P']}, B={gop['B']}", gop_len_sec, gop['I']
 
 def main():
     if len(sys.argv) < 2:
@@ -95,9 +40,12 @@ def main():
 
     print(f"🚀 Connecting to Mux: {master_url[:60]}...")
     
+    fetcher = SegmentFetcher()
+    probes = ProbeService()
+
     # 1. Fetch Master
     try:
-        master_playlist = m3u8.load(master_url)
+        master_playlist = fetcher.load_playlist(master_url)
     except Exception as e:
         print(f"❌ Failed to load master: {e}")
         sys.exit(1)
@@ -112,6 +60,8 @@ def main():
     print(f"✅ Master loaded. Found {len(master_playlist.playlists)} quality variants.")
 
     report_data = []
+    summary_data = []
+    ts_data = []
 
     # 2. Iterate Variants
     for i, playlist in enumerate(master_playlist.playlists):
@@ -127,13 +77,11 @@ def main():
         print(f"\n--- Analyzing Variant {i+1}: {res} ({bw} bps) ---")
         
         # Resolve Variant URL (Handle Relative Paths)
-        variant_url = playlist.uri
-        if not variant_url.startswith('http'):
-            variant_url = urljoin(master_url, variant_url)
+        variant_url = resolve_uri(master_url, playlist.uri)
 
         # Download Variant Playlist
         try:
-            var_m3u8_obj = m3u8.load(variant_url)
+            var_m3u8_obj = fetcher.load_playlist(variant_url)
         except:
             print(f"   ❌ Failed to load variant playlist.")
             continue
@@ -141,18 +89,25 @@ def main():
         # Analyze first few segments
         segments_to_check = var_m3u8_obj.segments[:12] # First 3 is enough for pattern
         
-        for seg_idx, seg in enumerate(segments_to_check):
-            seg_url = seg.uri
-            if not seg_url.startswith('http'):
-                seg_url = urljoin(variant_url, seg_url)
-            
-            fname = f"{res}_{seg_idx}.ts"
-            print(f"   Downloading Segment {seg_idx} ...", end="\r")
-            local_ts = download_file(seg_url, work_dir, fname)
-            
-            if local_ts:
+        # Download all segments of this variant in parallel over the pooled session
+        # (byte-range fMP4 renditions: each fragment is stored with its init section as one .mp4)
+        jobs = segment_jobs(var_m3u8_obj, variant_url, work_dir, range(len(segments_to_check)),
+                            name=f"{res}_{{}}")
+        results = fetcher.fetch_all(jobs)
+        fetcher.report(results, res)
+
+        fetched_paths = [r['path'] for r in results if r]
+        fetched_idx = [i for i, r in enumerate(results) if r]   # playlist position of each fetched segment
+        # Packet-level GOP forensics of every fetched segment (memoized ffprobe per segment, in parallel)
+        gops = dict(zip(fetched_paths, analyze_segments(fetched_paths, probes=probes)))
+        # Container/stream headers: one batched, memoized ffprobe per segment
+        probes.probe_many(fetched_paths)
+
+        for seg_idx, fetched in enumerate(results):
+            if fetched:
+                local_ts = fetched['path']
                 # Run Forensics
-                data = get_ffprobe_data(local_ts)
+                data = probes.probe(local_ts)
                 if data:
                     # Extract Metrics
                     fmt = data.get('format', {})
@@ -168,14 +123,11 @@ def main():
                         level = v_stream.get('level', 'N/A')
                         
                         # GOP Analysis
-                        gop_struct, gop_time, i_count = analyze_gop(data.get('frames', []))
-                        
-                        # Keyframe Check (Does it start with I frame?)
-                        first_frame_type = '?'
-                        if data.get('frames') and len(data['frames']) > 0:
-                            first_frame_type = data['frames'][0].get('pict_type', '?')
+                        gop = gops.get(local_ts)
+                        gop_struct, gop_time, i_count = analyze_gop(gop)
                         
-                        is_independent = "YES" if first_frame_type == 'I' else "NO"
+                        # Keyframe Check (Does the first packet carry the keyframe flag?)
+                        is_independent = "YES" if gop and gop['starts_on_idr'] else "NO"
 
                         report_data.append([
                             res, 
@@ -190,16 +142,54 @@ def main():
                         ])
             print(f"   ✅ Analyzed Segment {seg_idx}          ")
 
+        # Rendition-level keyframe cadence (intervals stitched across adjacent segment boundaries)
+        summary = summarize(list(gops.values()), fetched_idx)
+        hist = ", ".join(f"{k:.2f}s x{v}" for k, v in summary['keyint_hist'].items()) or "N/A"
+        summary_data.append([
+            res,
+            summary['segments'],
+            f"{summary['idr_start_pct']:.0f}%",
+            f"{summary['keyint_min']:.2f} / {summary['keyint_mean']:.2f} / {summary['keyint_max']:.2f}s",
+            hist,
+            f"{summary['b_pct']:.0f}%",
+        ])
+
+        # Packet-level byte accounting + peak segment bitrate vs advertised BANDWIDTH
+        fetched_durs = [seg.duration for seg, r in zip(segments_to_check, results) if r]
+        ts = ts_parser.summarize(ts_parser.analyze_files(fetched_paths), fetched_durs, bw, fetched_idx)
+        ts_data.append([
+            res,
+            f"{ts['video_pct']:.1f}% / {ts['audio_pct']:.1f}% / {ts['overhead_pct']:.1f}%",
+            f"{ts['null_pct']:.1f}%",
+            f"{ts['avg_bitrate'] / 1000:.0f} k",
+            f"{ts['peak_bitrate'] / 1000:.0f} k (Seg {ts['peak_segment']})",
+            f"{bw / 1000:.0f} k" if bw else "N/A",
+            f"{ts['peak_vs_bandwidth'] * 100:.0f}%" if bw else "N/A",
+            f"{ts['pcr_interval_max_ms']:.0f} ms / "
+            + (f"{ts['pcr_accuracy_max_ms']:.2f} ms" if ts['pcr_accuracy_max_ms'] is not None else "VBR")
+            if ts['container'] == "ts" else f"fMP4 (init {ts['init_bytes'] / 1024:.1f} KB)",
+        ])
+
     # 3. Final Report
     print("\n\n" + "="*100)
     print("                              MUX FORENSIC REPORT")
     print("="*100)
     headers = ["Res", "Seg", "Dur", "Size", "Bitrate", "Profile", "GOP (I/P/B)", "GOP Dur", "Starts with I?"]
     print(tabulate(report_data, headers=headers, tablefmt="grid"))
+    print("\n--- KEYFRAME CADENCE PER RENDITION ---")
+    summary_headers = ["Res", "Segs", "IDR Starts", "Keyint min/mean/max", "Keyint Histogram", "B-Frames"]
+    print(tabulate(summary_data, headers=summary_headers, tablefmt="grid"))
+    print("\n--- CONTAINER ANATOMY (MPEG-TS / fMP4) ---")
+    ts_headers = ["Res", "Video / Audio / Overhead", "Null Pkts", "Avg Bitrate", "Peak Segment",
+                  "BANDWIDTH", "Peak / BW", "PCR Max Gap / Accuracy (CBR)"]
+    print(tabulate(ts_data, headers=ts_headers, tablefmt="grid"))
     print("\nANALYSIS TIPS:")
-    print("1. GOP Dur: If close to 6.00s, switch your SEG_TIME to 6.")
+    print("1. GOP Dur: If close to 6.00s, switch your SEG_TIME to 6. A single keyframe interval in the histogram = fixed GOP.")
     print("2. Bitrate: Compare Mux's REAL bitrate with your TARGET bitrate.")
-    print("3. B-Frames: If Mux has many B-frames (e.g. I=1, P=XX, B=XX), ensure you don't disable them.")
+    print("3. Peak / BW: Above 100% means the advertised BANDWIDTH lies; players will stall on that segment.")
+    print("4. PCR: Gaps over 40 ms fail TR 101 290 (100 ms is the hard limit). Accuracy beyond ~0.5 ms matters only")
+    print("   for CBR muxes; HLS TS from ffmpeg is VBR, shown as such (TS only; fMP4 has no PCR).")
+    print("5. B-Frames: If Mux has many B-frames (e.g. I=1, P=XX, B=XX), ensure you don't disable them.")
     print("="*100)
 
 if __name__ == "__main__":
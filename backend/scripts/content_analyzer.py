@@ -0,0 +1,123 @@
+import argparse
+import subprocess
+import numpy as np
+
+# ==============================================================================
+#  CONTENT ANALYZER: LOW-RES LUMA PASS -> STATIC / SCREENCAST / MOTION
+# ==============================================================================
+#
+# ffmpeg decodes the source once at a few fps straight into 160x90 grey frames;
+# NumPy differences consecutive frames in batches, so an hour of video is a
+# few hundred MB of reads and never more than one batch in memory.
+#
+#   static      slides: most frames identical to the previous one
+#   screencast  cursor / typing / scrolling: small, local changes
+#   motion      camera footage or animation: the fixed ladder's home turf
+
+ANALYSIS_SIZE = (160, 90)
+ANALYSIS_FPS = 5
+BATCH_FRAMES = 512
+STATIC_MAD = 0.5       # mean |diff| (0-255) below which a frame counts as unchanged
+SCENE_CUT_MAD = 20.0   # mean |diff| above which a frame is a cut / slide change
+SEG_TIME = 4
+
+# Encoder parameters per class (bitrate_scale applies to bitrate, maxrate and bufsize)
+PROFILES = {
+    "static":     {"preset": "medium",   "tune": "stillimage", "crf": 32, "bitrate_scale": 0.4},
+    "screencast": {"preset": "slow",     "tune": "animation",  "crf": 30, "bitrate_scale": 0.7},
+    "motion":     {"preset": "veryslow", "tune": "animation",  "crf": 28, "bitrate_scale": 1.0},
+}
+
+
+def luma_batches(path, fps=ANALYSIS_FPS, size=ANALYSIS_SIZE):
+    """Yields (n, h, w) uint8 arrays of downscaled luma straight from an ffmpeg pipe"""
+    w, h = size
+    cmd = [
+        "ffmpeg", "-v", "error", "-nostdin", "-i", path, "-an",
+        "-vf", f"fps={fps},scale={w}:{h}:flags=area,format=gray",
+        "-f", "rawvideo", "-pix_fmt", "gray", "-",
+    ]
+    frame_bytes = w * h
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    try:
+        while True:
+            buf = proc.stdout.read(frame_bytes * BATCH_FRAMES)
+            n = len(buf) // frame_bytes
+            if n == 0:
+                break
+            yield np.frombuffer(buf[:n * frame_bytes], dtype=np.uint8).reshape(n, h, w)
+    finally:
+        proc.stdout.close()
+        proc.wait()
+
+
+def frame_features(batches):
+    """Per-frame temporal activity: mean |diff| against the previous frame"""
+    motion = []
+    prev = None
+    for frames in batches:
+        f = frames.astype(np.int16)
+        if prev is not None:
+            f = np.concatenate([prev[None], f])
+        diffs = np.abs(np.diff(f, axis=0)).mean(axis=(1, 2))
+        motion.append(diffs if prev is not None else np.concatenate([[0.0], diffs]))
+        prev = f[-1]
+    if not motion:
+        return np.empty(0)
+    return np.concatenate(motion)
+
+
+def classify_window(motion):
+    if not len(motion):
+        return "motion"
+    if np.mean(motion < STATIC_MAD) >= 0.8:
+        return "static"
+    if np.median(motion) < 3.0:
+        return "screencast"
+    return "motion"
+
+
+def analyze(path, fps=ANALYSIS_FPS, seg_time=SEG_TIME):
+    """Title class, per-segment classes and the stats behind them"""
+    motion = frame_features(luma_batches(path, fps))
+    per_seg = max(1, int(round(fps * seg_time)))
+    segments = [classify_window(motion[i:i + per_seg]) for i in range(0, len(motion), per_seg)]
+
+    share = {c: segments.count(c) / len(segments) if segments else 0.0 for c in PROFILES}
+    # Bits go where the motion is: a little of it already drives the ladder
+    if share["motion"] >= 0.2 or not segments:
+        title = "motion"
+    elif share["static"] >= 0.6:
+        title = "static"
+    else:
+        title = "screencast"
+
+    return {
+        "class": title,
+        "profile": PROFILES[title],
+        "segments": segments,
+        "share": share,
+        "frames": int(len(motion)),
+        "static_frames_pct": float(100.0 * np.mean(motion < STATIC_MAD)) if len(motion) else 0.0,
+        "scene_cuts": int(np.sum(motion > SCENE_CUT_MAD)),
+        "mean_motion": float(motion.mean()) if len(motion) else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify a video as static / screencast / motion")
+    parser.add_argument("input")
+    parser.add_argument("--fps", type=float, default=ANALYSIS_FPS, help="Analysis frame rate")
+    args = parser.parse_args()
+
+    report = analyze(args.input, args.fps)
+    print(f"Class:        {report['class']}  ->  {report['profile']}")
+    print(f"Frames:       {report['frames']} @ {args.fps} fps")
+    print(f"Static:       {report['static_frames_pct']:.1f}% of frames")
+    print(f"Scene cuts:   {report['scene_cuts']}")
+    print(f"Mean motion:  {report['mean_motion']:.2f}")
+    print("Segments:     " + ", ".join(f"{c} {100 * s:.0f}%" for c, s in report['share'].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -13,8 +13,14 @@ fi
 # 2. إعداد المسارات
 export LC_NUMERIC="C"
 
-INPUT_FILE=$(realpath "$1")
-FILENAME=$(basename -- "$INPUT_FILE")
+# المدخل قد يكون ملفاً محلياً أو رابط HTTP موقّعاً (بث المصدر مباشرة من S3)
+if [[ "$1" =~ ^https?:// ]]; then
+    INPUT_FILE="$1"
+    FILENAME=$(basename -- "${1%%\?*}")
+else
+    INPUT_FILE=$(realpath "$1")
+    FILENAME=$(basename -- "$INPUT_FILE")
+fi
 BASENAME="${FILENAME%.*}"
 
 # استخدام المجلد الحالي
@@ -35,23 +41,34 @@ calc() { awk "BEGIN { print $* }" 2>/dev/null || echo "0"; }
 # --- 3. تحليل المصدر ---
 echo ">> [1/3] Analyzing Source DNA..."
 
-SRC_SIZE=$(stat --printf="%s" "$INPUT_FILE")
-SRC_DUR=$(ffprobe -v error -show_entries format=duration -of default=noprint_wrappers=1:nokey=1 "$INPUT_FILE")
-if [ -z "$SRC_DUR" ]; then SRC_DUR=1; fi
+# SRC_SIZE_BYTES is passed by the worker when the source is streamed (nothing to stat)
+SRC_SIZE=${SRC_SIZE_BYTES:-$(stat --printf="%s" "$INPUT_FILE")}
+# One ffprobe for every source field (format + first video stream), read as key=value lines
+SRC_PROBE=$(ffprobe -v error -select_streams v:0 \
+    -show_entries format=duration:stream=r_frame_rate,width,height \
+    -of default=noprint_wrappers=1 "$INPUT_FILE")
+probe_field() { echo "$SRC_PROBE" | awk -F= -v k="$1" '$1 == k { print $2; exit }'; }
+
+SRC_DUR=$(probe_field duration)
+if [ -z "$SRC_DUR" ] || [ "$SRC_DUR" == "N/A" ]; then SRC_DUR=1; fi
 
-SRC_FPS=$(ffprobe -v error -select_streams v:0 -show_entries stream=r_frame_rate -of default=noprint_wrappers=1:nokey=1 "$INPUT_FILE" | bc -l)
+SRC_FPS=$(probe_field r_frame_rate | bc -l)
 if [ -z "$SRC_FPS" ]; then SRC_FPS=30; fi
 
-SRC_W=$(ffprobe -v error -select_streams v:0 -show_entries stream=width -of csv=s=x:p=0 "$INPUT_FILE")
-SRC_H=$(ffprobe -v error -select_streams v:0 -show_entries stream=height -of csv=s=x:p=0 "$INPUT_FILE")
+SRC_W=$(probe_field width)
+SRC_H=$(probe_field height)
 
 SRC_BITRATE=$(calc "int($SRC_SIZE * 8 / $SRC_DUR)")
 
 # --- 4. إعدادات الترميز (Fast Start Optimized) ---
 SEG_TIME=4
-GOP_SIZE=$(calc "int($SRC_FPS * $SEG_TIME)")
-PRESET="veryslow"
-TUNE="animation"
+# SEGMENT_TYPE=fmp4: one CMAF file per rung + EXT-X-BYTERANGE playlists (ts: a file per segment)
+SEGMENT_TYPE=${SEGMENT_TYPE:-ts}
+# LEAD_SEGMENTS=N: fast start - the first N segments are LEAD_TIME sec (then SEG_TIME),
+# EVENT playlists and a master published as soon as the lowest rung has its first segments
+LEAD_SEGMENTS=${LEAD_SEGMENTS:-0}
+LEAD_TIME=${LEAD_TIME:-2}
+# GOP = FPS * SEG_TIME, preset/tune/CRF and the ladder live in ladder_encoder.py
 
 # كتابة رأس التقرير
 {
@@ -64,6 +81,10 @@ TUNE="animation"
     echo "  • Resolution: ${SRC_W}x${SRC_H}"
     echo "  • FPS:        $SRC_FPS"
     echo "  • Bitrate:    $(numfmt --to=iec-i --suffix=bps $SRC_BITRATE)"
+    echo "  • Segments:   $SEGMENT_TYPE"
+    if [ "$LEAD_SEGMENTS" -gt 0 ]; then
+        echo "  • Fast Start: ${LEAD_SEGMENTS} x ${LEAD_TIME}s lead, then ${SEG_TIME}s"
+    fi
     echo "======================================================================"
     echo "EFFICIENCY MATRIX:"
     printf "| %-8s | %-10s | %-10s | %-7s | %-6s | %-8s | %-4s |\n" \
@@ -72,53 +93,49 @@ TUNE="animation"
            "----------" "----------" "----------" "-------" "------" "--------" "----"
 } > "$REPORT_FILE"
 
-# مصفوفة الجودات
-declare -a QUALITIES
-if [ "$SRC_H" -ge 1080 ]; then QUALITIES+=("1080p 1920 2500k 3000k 6000k"); fi
-if [ "$SRC_H" -ge 720 ]; then QUALITIES+=("720p 1280 1400k 1800k 3600k"); fi
-QUALITIES+=("480p 854 600k 900k 1800k");
-
-# تنظيف الماستر وإنشاء الهيدر
-rm -f "$OUTPUT_DIR/master.m3u8"
-echo "#EXTM3U" > "$OUTPUT_DIR/master.m3u8"
-echo "#EXT-X-VERSION:3" >> "$OUTPUT_DIR/master.m3u8"
+# مصفوفة الجودات (never-upscale ladder, defined once in ladder_encoder.py)
+SCRIPT_DIR=$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)
+LADDER_ENCODER="$SCRIPT_DIR/ladder_encoder.py"
+# LADDER_FILE=ladder.json (from per_title.py) replaces the fixed ladder
+LADDER_ARGS=()
+if [ -n "$LADDER_FILE" ]; then LADDER_ARGS=(--ladder "$LADDER_FILE"); fi
+mapfile -t QUALITIES < <(python3 "$LADDER_ENCODER" "$INPUT_FILE" --print-ladder --src-height "${SRC_H:-0}" "${LADDER_ARGS[@]}")
 
-echo ">> [2/3] Transcoding (Fast Start Mode)..."
+echo ">> [2/3] Transcoding (Fast Start Mode, single decode)..."
 
 # [TIMER START]
 START_TIME=$(date +%s)
 
+# One FFmpeg: split -> per-rung lanczos scale -> HLS per rung (+ master.m3u8)
+# Progress goes to stdout once a second as "PROGRESS {json}" lines (the worker parses them)
+# CHUNK_SEGMENTS=N splits long sources into N-segment chunks encoded in parallel
+# CONTENT_PROFILE=auto classifies slides/screencasts/motion and picks preset/tune/CRF/bitrates;
+# it is opt-in (default off) until bench_suite / per_title VMAF runs back the per-class profiles
+# FFMPEG_THREADS=N is the core budget the worker's scheduler granted this job (0 = all cores)
+python3 "$LADDER_ENCODER" "$INPUT_FILE" --out "$OUTPUT_DIR" --seg-time "$SEG_TIME" \
+    --chunk-segments "${CHUNK_SEGMENTS:-0}" --content "${CONTENT_PROFILE:-off}" \
+    --threads "${FFMPEG_THREADS:-0}" --segment-type "$SEGMENT_TYPE" \
+    --lead-segments "$LEAD_SEGMENTS" --lead-time "$LEAD_TIME" "${LADDER_ARGS[@]}" || exit 1
+
 for quality in "${QUALITIES[@]}"; do
     read -r NAME WIDTH TARGET_BITRATE MAXRATE BUFSIZE <<< "$quality"
-    
-    echo "   -> Processing: $NAME ($WIDTH width)..."
-    
-    # تنفيذ FFmpeg
-    ffmpeg -y -hide_banner -loglevel warning -nostdin \
-        -i "$INPUT_FILE" \
-        -vf "scale=w=${WIDTH}:h=-2:flags=lanczos" \
-        -c:v libx264 -profile:v high -preset "$PRESET" -tune "$TUNE" -crf 28 \
-        -b:v "$TARGET_BITRATE" -maxrate "$MAXRATE" -bufsize "$BUFSIZE" \
-        -g "$GOP_SIZE" -keyint_min "$GOP_SIZE" -sc_threshold 0 \
-        -force_key_frames "expr:gte(t,n_forced*$SEG_TIME)" \
-        -c:a aac -b:a 128k -ac 2 \
-        -flags +cgop \
-        -hls_time "$SEG_TIME" \
-        -hls_playlist_type vod \
-        -hls_segment_type mpegts \
-        -hls_flags independent_segments \
-        -hls_segment_filename "$OUTPUT_DIR/${NAME}_%03d.ts" \
-        "$OUTPUT_DIR/${NAME}.m3u8" < /dev/null
 
     # --- 5. التحليلات ---
-    FILE_COUNT=$(ls "$OUTPUT_DIR"/${NAME}_*.ts 2>/dev/null | wc -l)
-    
-    if [ "$FILE_COUNT" -eq 0 ]; then
+    if [ "$SEGMENT_TYPE" == "fmp4" ]; then
+        # ملف واحد لكل جودة: عدد المقاطع من قائمة التشغيل
+        SEG_FILES=("$OUTPUT_DIR/${NAME}.mp4")
+        FILE_COUNT=$(grep -c '^#EXTINF' "$OUTPUT_DIR/${NAME}.m3u8" 2>/dev/null)
+    else
+        SEG_FILES=("$OUTPUT_DIR"/${NAME}_*.ts)
+        FILE_COUNT=$(ls "${SEG_FILES[@]}" 2>/dev/null | wc -l)
+    fi
+
+    if [ "${FILE_COUNT:-0}" -eq 0 ] || [ ! -f "${SEG_FILES[0]}" ]; then
         echo "      [ERROR] No Output Files for $NAME!"
         continue
     fi
-    
-    TOTAL_SIZE=$(stat -c%s "$OUTPUT_DIR"/${NAME}_*.ts 2>/dev/null | awk '{s+=$1} END {print s+0}')
+
+    TOTAL_SIZE=$(stat -c%s "${SEG_FILES[@]}" 2>/dev/null | awk '{s+=$1} END {print s+0}')
     
     if [ "$TOTAL_SIZE" -gt 0 ]; then
         ACTUAL_BITRATE=$(calc "int(($TOTAL_SIZE * 8) / $SRC_DUR)")
@@ -128,14 +145,15 @@ for quality in "${QUALITIES[@]}"; do
 
     REDUCTION_PCT=$(calc "100 - ($TOTAL_SIZE * 100 / $SRC_SIZE)")
 
-    FIRST_SEG=$(ls "$OUTPUT_DIR"/${NAME}_*.ts | head -n 1)
-    ACTUAL_H=$(ffprobe -v error -select_streams v:0 -show_entries stream=height -of csv=s=x:p=0 "$FIRST_SEG")
+    FIRST_SEG="${SEG_FILES[0]}"
+    # Height + stream bitrate of the first segment (the whole rung in fMP4 mode) in a single ffprobe
+    read -r ACTUAL_H STREAM_BITRATE <<< "$(ffprobe -v error -select_streams v:0 \
+        -show_entries stream=height,bit_rate -of csv=s=' ':p=0 "$FIRST_SEG")"
     if [ -z "$ACTUAL_H" ]; then ACTUAL_H=1; fi
     
     PIXELS=$(calc "$WIDTH * $ACTUAL_H")
     BPP=$(calc "$ACTUAL_BITRATE / ($PIXELS * $SRC_FPS)")
 
-    STREAM_BITRATE=$(ffprobe -v error -select_streams v:0 -show_entries stream=bit_rate -of default=noprint_wrappers=1:nokey=1 "$FIRST_SEG")
     if [ -z "$STREAM_BITRATE" ] || [ "$STREAM_BITRATE" == "N/A" ]; then 
         OVERHEAD_PCT="0.00%"
     else
@@ -155,11 +173,6 @@ for quality in "${QUALITIES[@]}"; do
     printf "| %-8s | %-10s | %-10s | %-7s | %-6s | %-8s | %-4d |\n" \
         "$NAME" "$F_SIZE" "$F_BITRATE" "$F_REDUCT" "$F_BPP" "$OVERHEAD_PCT" "$FILE_COUNT" >> "$REPORT_FILE"
 
-    # --- إنشاء الماستر الآمن ---
-    CLEAN_BW=$(echo "${MAXRATE}" | tr -d 'k')000
-    printf "#EXT-X-STREAM-INF:BANDWIDTH=%s,RESOLUTION=%sx%s\n%s.m3u8\n" \
-        "$CLEAN_BW" "$WIDTH" "$ACTUAL_H" "$NAME" >> "$OUTPUT_DIR/master.m3u8"
-
 done
 
 # [TIMER END] حساب الوقت وإضافته للتقرير فقط
@@ -169,8 +182,11 @@ FORMATTED_TIME=$(printf '%02dh:%02dm:%02ds\n' $(($ELAPSED_TIME/3600)) $(($ELAPSE
 
 if [ "$ELAPSED_TIME" -gt 0 ]; then
     SPEED_FACTOR=$(calc "$SRC_DUR / $ELAPSED_TIME")
+    # Source frames per wall second (every rung encodes each of them once)
+    THROUGHPUT_FPS=$(calc "int($SRC_DUR * $SRC_FPS / $ELAPSED_TIME)")
 else
     SPEED_FACTOR="N/A"
+    THROUGHPUT_FPS="N/A"
 fi
 
 # الكتابة داخل الملف فقط
@@ -179,15 +195,8 @@ fi
     echo "PERFORMANCE METRICS:"
     echo "  • Total Time:   $ELAPSED_TIME seconds ($FORMATTED_TIME)"
     echo "  • Speed Factor: ${SPEED_FACTOR}x (Higher is faster)"
+    echo "  • Throughput:   ${THROUGHPUT_FPS} fps x ${#QUALITIES[@]} rungs"
     echo "======================================================================"
 } >> "$REPORT_FILE"
 
-# ------------------------------------------------------------------
-# SAFETY FILTER
-# ------------------------------------------------------------------
-echo ">> [INFO] Sanitizing Master Playlist..."
-
-sed -i '/^$/d' "$OUTPUT_DIR/master.m3u8"
-sed -i '/^[0-9]\+$/d' "$OUTPUT_DIR/master.m3u8"
-
 echo ">> [3/3] Done. Check Report: $REPORT_FILE"
\ No newline at end of file
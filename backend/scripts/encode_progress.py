@@ -0,0 +1,169 @@
+import os
+import sys
+import glob
+import json
+import time
+import threading
+
+# ==============================================================================
+#  ENCODE PROGRESS: FFMPEG `-progress` KEY=VALUE BLOCKS -> ONE JSON LINE / SECOND
+# ==============================================================================
+#
+# ffmpeg writes a block of key=value lines (frame, fps, stream_0_N_q, bitrate,
+# out_time_us, speed, ... progress=continue|end) every -stats_period seconds.
+# EncodeProgress keeps the latest block of every running ffmpeg (one for the
+# single-decode encode, one per chunk in chunked mode), adds per-rung output
+# bitrate from the segment bytes already on disk, and prints
+#
+#   PROGRESS {"percent": 42.1, "fps": 118.0, "speed": 3.9, "eta_s": 97, ...}
+#
+# on stdout. The worker turns these lines into job.updateProgress() and
+# Prometheus metrics; everything else on stdout stays plain log output.
+
+PREFIX = "PROGRESS "
+STATS_PERIOD = 1.0   # seconds between ffmpeg progress blocks (and emitted lines)
+
+
+def ffmpeg_opts(target="pipe:1"):
+    """Output options that make ffmpeg report to `target` (a pipe or a file) instead of stderr stats"""
+    return ["-progress", target, "-stats_period", str(STATS_PERIOD), "-nostats"]
+
+
+def parse_blocks(lines):
+    """Yields one dict per complete `progress=` block from an iterable of key=value lines"""
+    block = {}
+    for line in lines:
+        key, sep, value = line.strip().partition("=")
+        if not sep:
+            continue
+        block[key] = value.strip()
+        if key == "progress":
+            yield block
+            block = {}
+
+
+def _float(value, default=0.0):
+    try:
+        return float(str(value).rstrip("x"))
+    except (TypeError, ValueError):
+        return default   # "N/A" before the first frame is out
+
+
+def out_seconds(block):
+    """Media time written so far (out_time_us; out_time_ms is also microseconds in ffmpeg)"""
+    us = block.get("out_time_us", block.get("out_time_ms"))
+    return max(0.0, _float(us) / 1e6)
+
+
+class EncodeProgress:
+    """
+    Aggregates the progress blocks of one encode (single decode or a set of chunks).
+
+    Each ffmpeg is registered with add_source(key, start, length) so its out_time
+    is capped to its own window; rungs are the encoded Rung objects (the video
+    stream index of each rung follows build_command's -map order), seg_dirs the
+    directories their segments land in.
+    """
+
+    def __init__(self, duration, rungs, seg_dirs, has_audio, preset="", stream=sys.stdout):
+        self.duration = max(duration, 1e-6)
+        self.rungs = rungs
+        self.seg_dirs = seg_dirs
+        self.stride = 2 if has_audio else 1
+        self.preset = preset
+        self.stream = stream
+        self.blocks = {}
+        self.windows = {}
+        self.started = time.monotonic()
+        self.last_emit = 0.0
+        self.lock = threading.Lock()
+
+    def add_source(self, key, start=0.0, length=None):
+        self.windows[key] = (start, length if length else self.duration - start)
+
+    def update(self, key, block):
+        with self.lock:
+            self.blocks[key] = block
+        now = time.monotonic()
+        if now - self.last_emit >= STATS_PERIOD or block.get("progress") == "end":
+            self.last_emit = now
+            self.emit()
+
+    # --- SNAPSHOT ---
+    def rung_bytes(self, name):
+        """Bytes written so far: TS segments, or the single growing CMAF file (fMP4 mode)"""
+        return sum(os.path.getsize(p) for d in self.seg_dirs
+                   for pattern in (f"{name}_*.ts", f"{name}.mp4") for p in glob.glob(os.path.join(d, pattern)))
+
+    def snapshot(self):
+        with self.lock:
+            blocks = dict(self.blocks)
+        done = sum(min(out_seconds(b), self.windows.get(k, (0, self.duration))[1]) for k, b in blocks.items())
+        fps = sum(_float(b.get("fps")) for b in blocks.values() if b.get("progress") != "end")
+        wall = time.monotonic() - self.started
+        # Chunks run side by side, so aggregate speed is media done over wall time, not one ffmpeg's speed=
+        speed = done / wall if wall > 0 else 0.0
+        if len(blocks) == 1:
+            speed = _float(next(iter(blocks.values())).get("speed")) or speed
+        remaining = max(0.0, self.duration - done)
+        finished = bool(blocks) and all(b.get("progress") == "end" for b in blocks.values())
+
+        rungs = {}
+        for i, r in enumerate(self.rungs):
+            q = [_float(b.get(f"stream_0_{i * self.stride}_q"), None) for b in blocks.values()]
+            q = [v for v in q if v is not None and v >= 0]
+            rungs[r.name] = {
+                "bitrate_kbps": round(self.rung_bytes(r.name) * 8 / done / 1000, 1) if done > 0 else 0.0,
+                "target_kbps": r.bandwidth // 1000,
+                "q": round(sum(q) / len(q), 1) if q else None,
+            }
+
+        return {
+            "state": "done" if finished else "encoding",
+            "percent": round(min(100.0, 100.0 * done / self.duration), 2),
+            "out_time_s": round(done, 2),
+            "duration_s": round(self.duration, 2),
+            "elapsed_s": round(wall, 1),
+            "fps": round(fps, 2),
+            "speed": round(speed, 3),
+            "eta_s": int(remaining / speed) if speed > 0 else None,
+            "frames": sum(int(_float(b.get("frame"))) for b in blocks.values()),
+            "workers": len(blocks),
+            "preset": self.preset,
+            "rungs": rungs,
+        }
+
+    def emit(self):
+        self.stream.write(PREFIX + json.dumps(self.snapshot(), separators=(",", ":")) + "\n")
+        self.stream.flush()
+
+    # --- FEEDERS ---
+    def follow_pipe(self, key, pipe):
+        """Reads a `-progress pipe:1` stream until ffmpeg closes it"""
+        for block in parse_blocks(iter(pipe.readline, "")):
+            self.update(key, block)
+
+    def follow_files(self, paths, stop, interval=STATS_PERIOD):
+        """
+        Tails `-progress <file>` outputs of processes we don't own the stdout of
+        (chunk encodes in the process pool) until `stop` is set.
+        """
+        offsets = {}
+        while True:
+            for key, path in paths.items():
+                try:
+                    with open(path) as f:
+                        f.seek(offsets.get(key, 0))
+                        data = f.read()
+                except OSError:
+                    continue   # chunk not started yet
+                last = data.rfind("progress=")
+                end = data.find("\n", last) if last >= 0 else -1
+                if end < 0:
+                    continue   # no complete block since the last read
+                offsets[key] = offsets.get(key, 0) + end + 1   # ASCII: chars == bytes
+                for block in parse_blocks(data[:end + 1].splitlines()):
+                    self.update(key, block)
+            if stop.is_set():
+                break   # one last pass after the encodes finished
+            stop.wait(interval)
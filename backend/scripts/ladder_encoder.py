@@ -0,0 +1,610 @@
+import os
+import sys
+import math
+import json
+import time
+import shutil
+import argparse
+import threading
+import subprocess
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from encode_progress import EncodeProgress, ffmpeg_opts as progress_opts
+
+# ==============================================================================
+#  LADDER ENCODER: ONE DECODE -> EVERY HLS RENDITION + MASTER PLAYLIST
+# ==============================================================================
+#
+# The source is decoded once and fanned out with `split`; each branch gets its
+# own lanczos scale and x264 instance, and -var_stream_map writes one HLS
+# playlist per rung. Keyframes are forced on the SEG_TIME grid so every segment
+# of every rung starts on an aligned IDR.
+#
+# Fast start (--lead-segments N): the first N segments are LEAD_TIME long, then
+# the grid continues at SEG_TIME. The playlists are written as EVENT, and the
+# master is published as soon as the lowest rung has READY_SEGMENTS segments,
+# so playback can start while the rest of the title is still encoding.
+
+SEG_TIME = 4
+PRESET = "veryslow"
+TUNE = "animation"
+CRF = 28
+AUDIO_BITRATE = "128k"
+# "ts": one MPEG-TS file per segment; "fmp4": one CMAF file per rung, segments
+# addressed with EXT-X-BYTERANGE and a shared EXT-X-MAP init section
+SEGMENT_TYPES = ("ts", "fmp4")
+LEAD_TIME = 2          # fast start: length of the short lead segments
+READY_SEGMENTS = 2     # fast start: lowest-rung segments on disk before the master is published
+
+
+@dataclass
+class Rung:
+    name: str
+    width: int
+    min_height: int     # source height needed before this rung is produced (never upscale)
+    bitrate: str
+    maxrate: str
+    bufsize: str
+    crf: int = None     # per-rung CRF (per-title ladders); None = the global CRF
+
+    def height(self, src_w, src_h):
+        """Output height of scale=w=WIDTH:h=-2 (aspect kept, rounded to even)"""
+        if not src_w or not src_h:
+            return self.min_height
+        return int(round(self.width * src_h / src_w / 2)) * 2
+
+    def scaled(self, factor):
+        """Same rung with bitrate/maxrate/bufsize scaled (content profiles)"""
+        k = lambda rate: f"{max(1, int(round(int(rate.rstrip('k')) * factor)))}k"
+        return Rung(self.name, self.width, self.min_height, k(self.bitrate), k(self.maxrate), k(self.bufsize), self.crf)
+
+    @property
+    def bandwidth(self):
+        """Peak bps advertised in the master playlist (maxrate, like the shell encoder)"""
+        return int(self.maxrate.rstrip("k")) * 1000
+
+
+LADDER = [
+    Rung("1080p", 1920, 1080, "2500k", "3000k", "6000k"),
+    Rung("720p", 1280, 720, "1400k", "1800k", "3600k"),
+    Rung("480p", 854, 0, "600k", "900k", "1800k"),   # always produced
+]
+LADDER_MIN_HEIGHT = {r.width: r.min_height for r in LADDER}
+
+
+def select_ladder(src_height, ladder=LADDER):
+    """Rungs the source can feed without upscaling (the lowest rung always stays)"""
+    return [r for r in ladder if src_height >= r.min_height]
+
+
+def load_ladder(path):
+    """
+    Ladder JSON from per_title.py: [{"name", "width", "bitrate", "maxrate", "bufsize", "crf"}, ...].
+    Rungs wider than the source are dropped later by the same never-upscale rule.
+    """
+    with open(path) as f:
+        rungs = json.load(f)
+    return [Rung(r["name"], int(r["width"]), LADDER_MIN_HEIGHT.get(int(r["width"]), 0),
+                 r["bitrate"], r["maxrate"], r["bufsize"], r.get("crf")) for r in rungs]
+
+
+# --- SOURCE ANALYSIS ---
+def probe_source(path):
+    """Duration, fps, dimensions and audio presence from a single ffprobe"""
+    cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    data = json.loads(result.stdout or "{}")
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    num, _, den = video.get("r_frame_rate", "30/1").partition("/")
+    try:
+        fps = float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        fps = 30.0
+    return {
+        "duration": float(data.get("format", {}).get("duration", 0) or 0),
+        "fps": fps or 30.0,
+        "width": int(video.get("width", 0)),
+        "height": int(video.get("height", 0)),
+        "has_audio": any(s.get("codec_type") == "audio" for s in streams),
+    }
+
+
+# --- COMMAND ---
+def source_input_opts(input_path):
+    """HTTP(S) sources (presigned S3 URLs) are read with range requests; survive dropped connections"""
+    if input_path.startswith(("http://", "https://")):
+        return ["-reconnect", "1", "-reconnect_on_network_error", "1", "-reconnect_delay_max", "10"]
+    return []
+
+
+def hls_output_opts(out_dir, segment_type):
+    if segment_type == "fmp4":
+        # single_file: every rung is one growing .mp4 (init + fragments), so it is published
+        # once at the end instead of segment by segment
+        return [
+            "-hls_segment_type", "fmp4",
+            "-hls_flags", "independent_segments+single_file",
+            "-hls_segment_filename", os.path.join(out_dir, "%v.mp4"),
+        ]
+    return [
+        "-hls_segment_type", "mpegts",
+        # temp_file: segments appear under their final name only once complete (the publisher uploads on rename)
+        "-hls_flags", "independent_segments+temp_file",
+        "-hls_segment_filename", os.path.join(out_dir, "%v_%03d.ts"),
+    ]
+
+
+def keyframe_expr(seg_time, lead_segments=0, lead_time=LEAD_TIME):
+    """
+    -force_key_frames grid: every seg_time, or lead_segments x lead_time first and
+    then every seg_time. The same expression drives every rung, so IDRs stay aligned.
+    """
+    if not lead_segments:
+        return f"expr:gte(t,n_forced*{seg_time})"
+    lead_end = lead_segments * lead_time
+    return (f"expr:if(lt(n_forced,{lead_segments}),gte(t,n_forced*{lead_time}),"
+            f"gte(t,{lead_end}+(n_forced-{lead_segments})*{seg_time}))")
+
+
+def build_command(input_path, out_dir, rungs, src, seg_time=SEG_TIME, preset=PRESET, tune=TUNE, crf=CRF,
+                  input_opts=(), output_opts=(), segment_type="ts", lead_segments=0, lead_time=LEAD_TIME):
+    gop_size = int(src["fps"] * seg_time)
+    n = len(rungs)
+
+    graph = [f"[0:v]split={n}" + "".join(f"[v{i}]" for i in range(n))]
+    for i, r in enumerate(rungs):
+        graph.append(f"[v{i}]scale=w={r.width}:h=-2:flags=lanczos[v{i}out]")
+
+    cmd = [
+        "ffmpeg", "-y", "-hide_banner", "-loglevel", "warning", "-nostdin",
+        *source_input_opts(input_path), *input_opts, "-i", input_path,
+        "-filter_complex", ";".join(graph),
+    ]
+    for i, r in enumerate(rungs):
+        cmd += ["-map", f"[v{i}out]"]
+        if src["has_audio"]:
+            cmd += ["-map", "0:a:0"]
+
+    # Shared x264 settings, then per-rung rate control
+    cmd += [
+        "-c:v", "libx264", "-profile:v", "high", "-preset", preset, "-tune", tune, "-crf", str(crf),
+        "-g", str(gop_size), "-keyint_min", str(gop_size), "-sc_threshold", "0",
+        "-force_key_frames", keyframe_expr(seg_time, lead_segments, lead_time),
+        "-flags", "+cgop",
+        *output_opts,
+    ]
+    for i, r in enumerate(rungs):
+        cmd += [f"-b:v:{i}", r.bitrate, f"-maxrate:v:{i}", r.maxrate, f"-bufsize:v:{i}", r.bufsize]
+        if r.crf is not None:
+            cmd += [f"-crf:v:{i}", str(r.crf)]
+    if src["has_audio"]:
+        cmd += ["-c:a", "aac", "-b:a", AUDIO_BITRATE, "-ac", "2"]
+
+    stream_map = " ".join(
+        f"v:{i},a:{i},name:{r.name}" if src["has_audio"] else f"v:{i},name:{r.name}"
+        for i, r in enumerate(rungs)
+    )
+    # hlsenc cuts at the first keyframe past hls_time * segment number, so with the
+    # lead time as hls_time the forced keyframes alone decide where segments end
+    cmd += [
+        "-f", "hls",
+        "-hls_time", str(lead_time if lead_segments else seg_time),
+        "-hls_playlist_type", "event" if lead_segments else "vod",
+        *hls_output_opts(out_dir, segment_type),
+        "-var_stream_map", stream_map,
+        os.path.join(out_dir, "%v.m3u8"),
+    ]
+    return cmd
+
+
+# --- MASTER PLAYLIST ---
+def write_master(out_dir, rungs, src, segment_type="ts", lowest_first=False):
+    """
+    Writes master.m3u8 through a rename, so the publisher never sees half a file.
+    lowest_first lists the lowest rung first: players start on the first variant.
+    """
+    # fMP4 media playlists use EXT-X-MAP, which needs version 7 (6 for byte ranges + map)
+    version = 7 if segment_type == "fmp4" else 3
+    lines = ["#EXTM3U", f"#EXT-X-VERSION:{version}", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for r in (rungs[::-1] if lowest_first else rungs):
+        lines.append(f"#EXT-X-STREAM-INF:BANDWIDTH={r.bandwidth},"
+                     f"RESOLUTION={r.width}x{r.height(src['width'], src['height'])}")
+        lines.append(f"{r.name}.m3u8")
+    path = os.path.join(out_dir, "master.m3u8")
+    with open(path + ".tmp", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def publish_master_early(out_dir, rungs, src, stop, ready_segments=READY_SEGMENTS, interval=0.2):
+    """
+    Fast start: writes the master as soon as every rung has a segment and the
+    lowest rung has `ready_segments`, while ffmpeg keeps appending to the EVENT
+    playlists. Gives up quietly when the encode ends first.
+    """
+    started = time.monotonic()
+    while not stop.is_set():
+        counts = []
+        for r in rungs:
+            try:
+                counts.append(len(read_media_playlist(os.path.join(out_dir, f"{r.name}.m3u8"))))
+            except OSError:
+                counts.append(0)   # no segment closed yet
+        if min(counts) > 0 and counts[-1] >= ready_segments:
+            write_master(out_dir, rungs, src, lowest_first=True)
+            print(f"   -> Master published after {time.monotonic() - started:.1f}s "
+                  f"({counts[-1]} {rungs[-1].name} segments ready)", flush=True)
+            return
+        stop.wait(interval)
+
+
+def finalize_event_playlists(out_dir, rungs):
+    """EVENT -> VOD once ffmpeg has written #EXT-X-ENDLIST (the title no longer changes)"""
+    for r in rungs:
+        path = os.path.join(out_dir, f"{r.name}.m3u8")
+        with open(path) as f:
+            text = f.read()
+        with open(path + ".tmp", "w") as f:
+            f.write(text.replace("#EXT-X-PLAYLIST-TYPE:EVENT", "#EXT-X-PLAYLIST-TYPE:VOD"))
+        os.replace(path + ".tmp", path)
+
+
+def content_profile(input_path, content, seg_time=SEG_TIME):
+    """
+    Encoder parameters for a content class ("static", "screencast", "motion"), or
+    "auto" to classify the source with content_analyzer first. None = fixed defaults.
+    """
+    if not content or content == "off":
+        return None
+    import content_analyzer  # NumPy is only needed when a profile is requested
+    if content == "auto":
+        report = content_analyzer.analyze(input_path, seg_time=seg_time)
+        share = ", ".join(f"{c} {100 * v:.0f}%" for c, v in report["share"].items())
+        print(f"   -> Content: {report['class']} ({share})")
+        content = report["class"]
+    return content_analyzer.PROFILES[content]
+
+
+def apply_profile(profile, rungs, preset, tune, crf):
+    if not profile:
+        return rungs, preset, tune, crf
+    return ([r.scaled(profile["bitrate_scale"]) for r in rungs],
+            profile["preset"], profile["tune"], profile["crf"])
+
+
+def thread_opts(threads, n_rungs):
+    """
+    Keeps one ffmpeg inside a core budget: the decoder gets the whole budget, and
+    it is split across the per-rung x264 instances (0 = ffmpeg's own defaults).
+    """
+    if not threads:
+        return [], []
+    return (["-threads", str(threads)],
+            ["-threads", str(max(1, threads // n_rungs)), "-filter_complex_threads", str(threads)])
+
+
+def encode_ladder(input_path, out_dir, seg_time=SEG_TIME, preset=PRESET, tune=TUNE, crf=CRF, src=None,
+                  ladder=LADDER, content=None, threads=0, segment_type="ts", lead_segments=0,
+                  lead_time=LEAD_TIME):
+    src = src or probe_source(input_path)
+    rungs = select_ladder(src["height"], ladder)
+    rungs, preset, tune, crf = apply_profile(content_profile(input_path, content, seg_time), rungs, preset, tune, crf)
+    os.makedirs(out_dir, exist_ok=True)
+
+    print(f"   -> Encoding {len(rungs)} rungs from one decode: {', '.join(r.name for r in rungs)}")
+    input_threads, output_threads = thread_opts(threads, len(rungs))
+    cmd = build_command(input_path, out_dir, rungs, src, seg_time, preset, tune, crf,
+                        input_opts=input_threads, output_opts=[*output_threads, *progress_opts("pipe:1")],
+                        segment_type=segment_type, lead_segments=lead_segments, lead_time=lead_time)
+    progress = EncodeProgress(src["duration"], rungs, [out_dir], src["has_audio"], preset)
+    progress.add_source("main")
+
+    # Early master only for TS: a CMAF rung is one file that is published once the encode is done
+    stop = threading.Event()
+    early = None
+    if lead_segments and segment_type == "ts":
+        print(f"   -> Fast start: {lead_segments} x {lead_time}s lead segments, then {seg_time}s")
+        early = threading.Thread(target=publish_master_early, args=(out_dir, rungs, src, stop), daemon=True)
+        early.start()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    try:
+        progress.follow_pipe("main", proc.stdout)
+        returncode = proc.wait()
+    finally:
+        stop.set()
+        if early:
+            early.join()
+    if returncode != 0:
+        raise RuntimeError(f"ffmpeg ladder encode failed with exit code {returncode}")
+    if lead_segments:
+        finalize_event_playlists(out_dir, rungs)
+    write_master(out_dir, rungs, src, segment_type, lowest_first=bool(lead_segments))
+    return rungs
+
+
+# ==============================================================================
+#  CHUNKED MODE: GOP-ALIGNED CHUNKS ENCODED IN PARALLEL, THEN STITCHED
+# ==============================================================================
+#
+# Chunk k covers [k*N*SEG_TIME, (k+1)*N*SEG_TIME). Every boundary is on the
+# forced-keyframe grid, so a chunk is exactly N segments of the full encode.
+# Each chunk seeks its own window (-ss before -i), runs the identical ladder
+# command (video only), and shifts its timestamps with -output_ts_offset so the
+# stitched video plays as one continuous stream with no discontinuities.
+#
+# Audio is NOT encoded per chunk: AAC restarts its priming and its 1024-sample
+# frame grid at every -ss, which leaves a gap or click at each stitch point.
+# It is encoded once over the whole source, next to the chunks, and muxed into
+# every rung afterwards with a copy-only HLS remux (same keyframe grid, so the
+# segment boundaries do not move). verify_audio checks the joins.
+
+AUDIO_GAP_TOLERANCE = 0.005   # seconds two consecutive segments' audio may be apart
+
+def chunk_windows(duration, seg_time, chunk_segments):
+    """(start, duration) of every chunk; the last one runs to the end of the source"""
+    chunk_len = seg_time * chunk_segments
+    count = max(1, math.ceil(duration / chunk_len)) if duration > 0 else 1
+    return [(k * chunk_len, chunk_len if k < count - 1 else None) for k in range(count)]
+
+
+def encode_chunk(task):
+    """Encodes the video of one chunk of every rung (module-level so the process pool can pickle it)"""
+    input_path, chunk_dir, rungs, src, seg_time, preset, tune, crf, start, length, threads = task
+    os.makedirs(chunk_dir, exist_ok=True)
+    input_threads, output_threads = thread_opts(threads, len(rungs))
+    input_opts = [*input_threads, "-ss", f"{start:.3f}"] + (["-t", f"{length:.3f}"] if length else [])
+    output_opts = [*output_threads, "-output_ts_offset", f"{start:.3f}",
+                   *progress_opts(os.path.join(chunk_dir, ".progress"))]
+    video_only = {**src, "has_audio": False}   # audio: encode_audio, once for the whole source
+    cmd = build_command(input_path, chunk_dir, rungs, video_only, seg_time, preset, tune, crf,
+                        input_opts, output_opts)
+    return subprocess.run(cmd).returncode
+
+
+def encode_audio(input_path, out_path):
+    """The whole audio track as one continuous AAC stream (a single priming, one frame grid)"""
+    cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "warning", "-nostdin",
+           *source_input_opts(input_path), "-i", input_path,
+           "-map", "0:a:0", "-vn", "-c:a", "aac", "-b:a", AUDIO_BITRATE, "-ac", "2", out_path]
+    return subprocess.run(cmd).returncode
+
+
+def mux_audio(video_dir, out_dir, rungs, audio_path, seg_time):
+    """
+    Muxes the single audio encode into every rung: the stitched video playlist is
+    re-segmented with -c copy, so segments still cut on the same forced keyframes.
+    The video-only segments stay in the (hidden) work dir: the publisher only
+    ever sees the final, muxed ones, each appearing through temp_file's rename.
+    """
+    def mux(r):
+        cmd = ["ffmpeg", "-y", "-hide_banner", "-loglevel", "warning", "-nostdin",
+               "-i", os.path.join(video_dir, f"{r.name}.m3u8"), "-i", audio_path,
+               "-map", "0:v:0", "-map", "1:a:0", "-c", "copy",
+               "-f", "hls", "-hls_time", str(seg_time), "-hls_playlist_type", "vod",
+               "-hls_flags", "independent_segments+temp_file",
+               "-hls_segment_filename", os.path.join(out_dir, f"{r.name}_%03d.ts"),
+               os.path.join(out_dir, f"{r.name}.m3u8")]
+        return subprocess.run(cmd).returncode
+
+    with ThreadPoolExecutor(max_workers=len(rungs)) as pool:
+        codes = list(pool.map(mux, rungs))
+    failed = [r.name for r, code in zip(rungs, codes) if code != 0]
+    if failed:
+        raise RuntimeError(f"audio mux failed for {', '.join(failed)}")
+
+
+def read_media_playlist(path):
+    """[(EXTINF duration, segment uri)] of a VOD media playlist"""
+    entries, duration = [], None
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#EXTINF:"):
+                duration = float(line[len("#EXTINF:"):].split(",")[0])
+            elif line and not line.startswith("#") and duration is not None:
+                entries.append((duration, line))
+                duration = None
+    return entries
+
+
+def write_media_playlist(path, entries, seg_time):
+    target = max([math.ceil(d) for d, _ in entries] + [seg_time])
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{target}",
+             "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD", "#EXT-X-INDEPENDENT-SEGMENTS"]
+    for d, uri in entries:
+        lines += [f"#EXTINF:{d:.6f},", uri]
+    lines.append("#EXT-X-ENDLIST")
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def stitch_chunks(out_dir, chunk_dirs, rungs, seg_time):
+    """Moves chunk segments into one sequence per rung and writes its playlist"""
+    for r in rungs:
+        entries = []
+        for chunk_dir in chunk_dirs:
+            for d, uri in read_media_playlist(os.path.join(chunk_dir, f"{r.name}.m3u8")):
+                name = f"{r.name}_{len(entries):03d}.ts"
+                os.replace(os.path.join(chunk_dir, uri), os.path.join(out_dir, name))
+                entries.append((d, name))
+        write_media_playlist(os.path.join(out_dir, f"{r.name}.m3u8"), entries, seg_time)
+
+
+def starts_on_idr(path):
+    """True when the first video packet of a segment carries the keyframe flag"""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-read_intervals", "%+#1",
+           "-show_entries", "packet=flags", "-of", "csv=p=0", path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    first = result.stdout.strip().splitlines()[:1]
+    return bool(first) and "K" in first[0]
+
+
+def verify_idr(out_dir, rungs, max_workers=8):
+    """Segments (per rung) that do NOT open on an IDR; empty dict means the stitch is clean"""
+    bad = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for r in rungs:
+            uris = [uri for _, uri in read_media_playlist(os.path.join(out_dir, f"{r.name}.m3u8"))]
+            ok = pool.map(starts_on_idr, [os.path.join(out_dir, u) for u in uris])
+            failed = [u for u, good in zip(uris, ok) if not good]
+            if failed:
+                bad[r.name] = failed
+    return bad
+
+
+def audio_span(path):
+    """(first audio pts, end of the last audio packet) of a segment in seconds, None without audio"""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "a:0",
+           "-show_entries", "packet=pts_time,duration_time", "-of", "csv=p=0", path]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    packets = []
+    for line in result.stdout.split():
+        pts, _, dur = line.partition(",")
+        try:
+            packets.append((float(pts), float(dur or 0)))
+        except ValueError:
+            continue
+    if not packets:
+        return None
+    return packets[0][0], packets[-1][0] + packets[-1][1]
+
+
+def verify_audio(out_dir, rungs, tolerance=AUDIO_GAP_TOLERANCE, max_workers=8):
+    """Joins (per rung) where a segment's audio does not pick up where the previous one ended"""
+    bad = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for r in rungs:
+            uris = [uri for _, uri in read_media_playlist(os.path.join(out_dir, f"{r.name}.m3u8"))]
+            spans = list(pool.map(audio_span, [os.path.join(out_dir, u) for u in uris]))
+            failed = []
+            for k, (prev, cur) in enumerate(zip(spans, spans[1:]), 1):
+                if prev is None or cur is None:
+                    failed.append(f"{uris[k]} (no audio)")
+                elif abs(cur[0] - prev[1]) > tolerance:
+                    failed.append(f"{uris[k]} ({1000 * (cur[0] - prev[1]):+.1f} ms)")
+            if failed:
+                bad[r.name] = failed
+    return bad
+
+
+def encode_ladder_chunked(input_path, out_dir, chunk_segments, jobs=None, seg_time=SEG_TIME,
+                          preset=PRESET, tune=TUNE, crf=CRF, src=None, ladder=LADDER, content=None, threads=0):
+    src = src or probe_source(input_path)
+    rungs = select_ladder(src["height"], ladder)
+    rungs, preset, tune, crf = apply_profile(content_profile(input_path, content, seg_time), rungs, preset, tune, crf)
+    windows = chunk_windows(src["duration"], seg_time, chunk_segments)
+    cpus = threads or os.cpu_count() or 1
+    jobs = max(1, min(jobs or cpus, len(windows), cpus))
+    threads = max(1, cpus // jobs)
+
+    work = os.path.join(out_dir, ".chunks")
+    if os.path.exists(work):
+        shutil.rmtree(work)
+    chunk_dirs = [os.path.join(work, f"{k:04d}") for k in range(len(windows))]
+    tasks = [(input_path, d, rungs, src, seg_time, preset, tune, crf, start, length, threads)
+             for d, (start, length) in zip(chunk_dirs, windows)]
+    audio_path = os.path.join(work, "audio.m4a") if src["has_audio"] else None
+
+    print(f"   -> Encoding {len(windows)} chunks of {chunk_segments} segments "
+          f"({jobs} parallel x {threads} threads): {', '.join(r.name for r in rungs)}")
+    # Chunk processes report to per-chunk files; one thread here merges them into a single progress line
+    progress = EncodeProgress(src["duration"], rungs, chunk_dirs, False, preset)   # chunks carry no audio
+    for k, (start, length) in enumerate(windows):
+        progress.add_source(k, start, length)
+    stop = threading.Event()
+    follower = threading.Thread(target=progress.follow_files, daemon=True,
+                                args=({k: os.path.join(d, ".progress") for k, d in enumerate(chunk_dirs)}, stop))
+    follower.start()
+    try:
+        os.makedirs(work)
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            audio = pool.submit(encode_audio, input_path, audio_path) if audio_path else None
+            codes = list(pool.map(encode_chunk, tasks))
+            audio_code = audio.result() if audio else 0
+    finally:
+        stop.set()
+        follower.join()
+    failed = [k for k, code in enumerate(codes) if code != 0]
+    if failed:
+        raise RuntimeError(f"ffmpeg failed on chunk(s) {failed}")
+    if audio_code != 0:
+        raise RuntimeError(f"ffmpeg audio encode failed with exit code {audio_code}")
+
+    if audio_path:
+        video_dir = os.path.join(work, "video")
+        os.makedirs(video_dir)
+        stitch_chunks(video_dir, chunk_dirs, rungs, seg_time)
+        mux_audio(video_dir, out_dir, rungs, audio_path, seg_time)
+    else:
+        stitch_chunks(out_dir, chunk_dirs, rungs, seg_time)
+    shutil.rmtree(work)
+    write_master(out_dir, rungs, src)
+
+    bad = verify_idr(out_dir, rungs)
+    if bad:
+        details = "; ".join(f"{name}: {', '.join(segs)}" for name, segs in bad.items())
+        raise RuntimeError(f"segments not starting on an IDR after stitching: {details}")
+    if audio_path:
+        bad = verify_audio(out_dir, rungs)
+        if bad:
+            details = "; ".join(f"{name}: {', '.join(segs)}" for name, segs in bad.items())
+            raise RuntimeError(f"audio not continuous across segment boundaries: {details}")
+    print("   -> Stitched; every segment starts on an IDR" + (", audio continuous" if audio_path else ""))
+    return rungs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Single-decode HLS ladder encoder")
+    parser.add_argument("input")
+    parser.add_argument("--out", default=".", help="Output directory (default: current dir)")
+    parser.add_argument("--seg-time", type=int, default=SEG_TIME)
+    parser.add_argument("--chunk-segments", type=int, default=0,
+                        help="Chunked mode: encode N-segment chunks in parallel and stitch them (0 = off)")
+    parser.add_argument("--jobs", type=int, default=None, help="Parallel chunk encodes (default: CPU count)")
+    parser.add_argument("--segment-type", default="ts", choices=SEGMENT_TYPES,
+                        help="ts: a file per segment; fmp4: one CMAF file per rung with byte-range playlists")
+    parser.add_argument("--lead-segments", type=int, default=0,
+                        help="Fast start: first N segments are --lead-time long, EVENT playlists, "
+                             "master published early (0 = off)")
+    parser.add_argument("--lead-time", type=float, default=LEAD_TIME, help="Length of the lead segments")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="Core budget for the whole encode, split across rungs/chunks (0 = all cores)")
+    parser.add_argument("--ladder", default=None,
+                        help="Ladder JSON (e.g. from per_title.py) instead of the fixed ladder")
+    parser.add_argument("--content", default="off", choices=["off", "auto", "static", "screencast", "motion"],
+                        help="Content profile: auto-classify the source, force a class, or off (fixed settings)")
+    parser.add_argument("--print-ladder", action="store_true",
+                        help="Only print the selected rungs (NAME WIDTH BITRATE MAXRATE BUFSIZE) and exit")
+    parser.add_argument("--src-height", type=int, default=None,
+                        help="Source height when already known (skips the probe for --print-ladder)")
+    args = parser.parse_args()
+    ladder = load_ladder(args.ladder) if args.ladder else LADDER
+
+    if args.print_ladder:
+        height = args.src_height if args.src_height is not None else probe_source(args.input)["height"]
+        for r in select_ladder(height, ladder):
+            print(r.name, r.width, r.bitrate, r.maxrate, r.bufsize)
+        return
+
+    try:
+        if args.chunk_segments > 0:
+            if args.segment_type != "ts":
+                raise RuntimeError("chunked mode stitches per-segment files; use --segment-type ts")
+            if args.lead_segments:
+                raise RuntimeError("fast start needs the segments in encode order; drop --chunk-segments")
+            encode_ladder_chunked(args.input, os.path.abspath(args.out), args.chunk_segments,
+                                  jobs=args.jobs, seg_time=args.seg_time, ladder=ladder,
+                                  content=args.content, threads=args.threads)
+        else:
+            encode_ladder(args.input, os.path.abspath(args.out), seg_time=args.seg_time, ladder=ladder,
+                          content=args.content, threads=args.threads, segment_type=args.segment_type,
+                          lead_segments=args.lead_segments, lead_time=args.lead_time)
+    except RuntimeError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
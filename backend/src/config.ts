@@ -1,4 +1,5 @@
 import dotenv from "dotenv";
+import os from "os";
 dotenv.config();
 
 const checkEnv = (key: string) => {
@@ -18,5 +19,21 @@ export const config = {
     region: process.env.AWS_REGION || "auto",
     endpoint: checkEnv("AWS_ENDPOINT"),
     bucket: checkEnv("BUCKET_NAME"),
+    forcePathStyle: process.env.S3_FORCE_PATH_STYLE === "true",
+  },
+  // "stream": FFmpeg reads the source over a presigned URL while it arrives
+  // "download": full download first (the old behaviour)
+  ingestMode: process.env.INGEST_MODE === "download" ? "download" : "stream",
+  uploadConcurrency: Number(process.env.UPLOAD_CONCURRENCY || 8),
+  // Prometheus scrape port of the worker process
+  metricsPort: Number(process.env.METRICS_PORT || 9091),
+  // Worker admission budget: jobs run side by side while their estimated
+  // cores/memory fit (defaults: this machine, minus headroom for Node + uploads)
+  scheduler: {
+    cpus: Number(process.env.WORKER_CPUS) || os.availableParallelism(),
+    memoryMb:
+      Number(process.env.WORKER_MEMORY_MB) ||
+      Math.floor((os.totalmem() / (1024 * 1024)) * 0.8),
+    maxJobs: Number(process.env.WORKER_MAX_JOBS || 4),
   },
 };
@@ -1,7 +1,8 @@
 import Fastify, { FastifyRequest, FastifyReply } from "fastify";
 import cors from "@fastify/cors";
 import { query } from "./lib/db";
-import { generateUploadUrl } from "./lib/s3";
+import { generateUploadUrl, getObjectSize } from "./lib/s3";
+import { estimateFromSize, jobPriority } from "./lib/cost";
 import { videoQueue } from "./lib/queue";
 import { UploadRequestBody, ProcessRequestBody } from "./types";
 import { config } from "./config";
@@ -82,12 +83,26 @@ server.post(
       if (updateRes.rowCount === 0)
         return reply.code(404).send({ error: "Video not found" });
 
+      // الأولوية حسب حجم العمل المقدّر: فيديو قصير لا ينتظر خلف ساعة 1080p.
+      // من حجم الكائن فقط (HEAD واحد)؛ ffprobe والسلّم الفعلي يحسبهما العامل
+      let priority: number | undefined;
+      try {
+        const cost = estimateFromSize(await getObjectSize(s3Key));
+        priority = jobPriority(cost);
+        req.log.info(
+          `Video ${videoId}: ~${cost.cpuSeconds} cpu-s, priority ${priority}`,
+        );
+      } catch (err) {
+        req.log.warn(err, "Cost estimate failed, queueing without priority");
+      }
+
       await videoQueue.add(
         "transcode",
         { videoId, s3Key },
         {
           attempts: 3,
           backoff: { type: "exponential", delay: 1000 },
+          ...(priority !== undefined ? { priority } : {}),
         },
       );
 
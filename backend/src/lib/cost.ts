@@ -0,0 +1,186 @@
+import path from "path";
+import { spawn } from "child_process";
+
+// تقدير كلفة وظيفة الترميز قبل تشغيلها: كم نواة، كم ذاكرة، وكم ثانية تقريباً.
+// الأرقام تقريبية عن قصد؛ المهم أن تكون نسبية (وظيفة 480p قصيرة << ساعة 1080p)
+// وأن تُعايَر من مقاييس encode_media_seconds_total / encode_wall_seconds_total
+
+const LADDER_ENCODER = path.resolve(
+  __dirname,
+  "../../scripts/ladder_encoder.py",
+);
+
+// x264 veryslow: ~2 fps من 1080p لكل نواة ≈ 4 ميغا بكسل/ثانية/نواة
+const PIXELS_PER_CORE_SECOND = 4_000_000;
+// معدل البكسلات الذي يستحق نواة كاملة عند توزيع الأنوية (1080p+720p+480p @30 ≈ 6 أنوية)
+const PIXEL_RATE_PER_CORE = 17_000_000;
+// x264: lookahead (60 في veryslow) + مراجع + B-frames، بصيغة yuv420p (1.5 بايت/بكسل)
+const X264_FRAMES_IN_FLIGHT = 90;
+const DECODER_FRAMES = 16;
+const BASE_MEMORY_MB = 150;
+// عند فشل ffprobe: نفترض مصدر 1080p بمعدل 5 Mbps لتقدير المدة من الحجم
+const FALLBACK_BITRATE = 5_000_000;
+
+export interface MediaInfo {
+  durationS: number;
+  width: number;
+  height: number;
+  fps: number;
+}
+
+export interface RungShape {
+  name: string;
+  width: number;
+  height: number;
+}
+
+export interface JobCost {
+  cores: number; // الأنوية التي تستفيد منها الوظيفة فعلاً
+  memoryMb: number;
+  cpuSeconds: number; // زمن ترميز بنواة واحدة
+  estimatedSeconds: number; // الزمن الفعلي المتوقع على `cores` نواة
+  rungs: string[];
+}
+
+function run(cmd: string, args: string[], timeoutMs: number): Promise<string> {
+  return new Promise((resolve, reject) => {
+    const child = spawn(cmd, args, { stdio: ["ignore", "pipe", "ignore"] });
+    let out = "";
+    const timer = setTimeout(() => child.kill("SIGKILL"), timeoutMs);
+    child.stdout.on("data", (d) => (out += d.toString()));
+    child.on("error", reject);
+    child.on("close", (code) => {
+      clearTimeout(timer);
+      if (code === 0) resolve(out);
+      else reject(new Error(`${cmd} exited with code ${code}`));
+    });
+  });
+}
+
+// ffprobe واحد (يعمل على مسار محلي أو رابط موقّع؛ يقرأ الترويسة فقط)
+export async function probeMedia(input: string): Promise<MediaInfo> {
+  const out = await run(
+    "ffprobe",
+    [
+      "-v", "error",
+      "-select_streams", "v:0",
+      "-show_entries", "format=duration:stream=width,height,r_frame_rate",
+      "-of", "json",
+      input,
+    ],
+    30000,
+  );
+  const data = JSON.parse(out);
+  const video = data.streams?.[0] ?? {};
+  const [num = 30, den = 1] = String(video.r_frame_rate ?? "30/1")
+    .split("/")
+    .map(Number);
+  const fps = den ? num / den : num;
+  return {
+    durationS: Number(data.format?.duration) || 0,
+    width: Number(video.width) || 0,
+    height: Number(video.height) || 0,
+    fps: Number.isFinite(fps) && fps > 0 ? fps : 30,
+  };
+}
+
+// السلّم الفعلي لهذا المصدر من ladder_encoder.py نفسه (مصدر واحد للحقيقة، يحترم LADDER_FILE)
+export async function ladderFor(media: MediaInfo): Promise<RungShape[]> {
+  const args = [
+    LADDER_ENCODER,
+    "-",
+    "--print-ladder",
+    "--src-height",
+    String(media.height),
+  ];
+  if (process.env.LADDER_FILE) args.push("--ladder", process.env.LADDER_FILE);
+  const out = await run("python3", args, 10000);
+  return out
+    .trim()
+    .split("\n")
+    .filter(Boolean)
+    .map((line) => {
+      const [name = "", width] = line.split(/\s+/);
+      const w = Number(width);
+      const h = media.width
+        ? Math.round((w * media.height) / media.width / 2) * 2
+        : Math.round((w * 9) / 16);
+      return { name, width: w, height: h };
+    });
+}
+
+export function estimateCost(
+  media: MediaInfo,
+  rungs: RungShape[],
+  maxCores = Infinity,
+): JobCost {
+  const outPixels = rungs.reduce((sum, r) => sum + r.width * r.height, 0);
+  const pixelRate = outPixels * media.fps;
+  const cores = Math.max(
+    1,
+    Math.min(maxCores, Math.ceil(pixelRate / PIXEL_RATE_PER_CORE)),
+  );
+  const cpuSeconds = (media.durationS * pixelRate) / PIXELS_PER_CORE_SECOND;
+
+  const frameMb = (w: number, h: number) => (w * h * 1.5) / (1024 * 1024);
+  const memoryMb = Math.ceil(
+    BASE_MEMORY_MB +
+      frameMb(media.width, media.height) * DECODER_FRAMES +
+      rungs.reduce(
+        (sum, r) => sum + frameMb(r.width, r.height) * X264_FRAMES_IN_FLIGHT,
+        0,
+      ),
+  );
+
+  return {
+    cores,
+    memoryMb,
+    cpuSeconds: Math.round(cpuSeconds),
+    estimatedSeconds: Math.round(cpuSeconds / cores),
+    rungs: rungs.map((r) => r.name),
+  };
+}
+
+// عند تعذّر ffprobe: مدة تقديرية من حجم الملف، بسلّم 1080p كامل (الحالة الأسوأ)
+export function fallbackMedia(sizeBytes: number): MediaInfo {
+  return {
+    durationS: (sizeBytes * 8) / FALLBACK_BITRATE,
+    width: 1920,
+    height: 1080,
+    fps: 30,
+  };
+}
+
+// سلّم 1080p الكامل من ladder_encoder.LADDER (480p بنسبة 16:9)
+const FULL_LADDER: RungShape[] = [
+  { name: "1080p", width: 1920, height: 1080 },
+  { name: "720p", width: 1280, height: 720 },
+  { name: "480p", width: 854, height: 480 },
+];
+
+// تقدير من حجم الملف وحده، بلا ffprobe ولا python3: لمسار الـ API الذي
+// لا يجوز أن يُشغّل عمليات. يكفي للأولوية لأنها نسبية (الأصغر أولاً)
+export function estimateFromSize(sizeBytes: number): JobCost {
+  return estimateCost(fallbackMedia(sizeBytes), FULL_LADDER);
+}
+
+export async function estimateJob(
+  input: string,
+  sizeBytes: number,
+  maxCores = Infinity,
+): Promise<JobCost> {
+  let media: MediaInfo;
+  try {
+    media = await probeMedia(input);
+    if (!media.durationS || !media.height) throw new Error("incomplete probe");
+  } catch (err) {
+    console.warn(`[Cost] Probe failed, estimating from size:`, err);
+    media = fallbackMedia(sizeBytes);
+  }
+  return estimateCost(media, await ladderFor(media), maxCores);
+}
+
+// BullMQ: رقم أصغر = أولوية أعلى (1 .. 2^21). الأقل عملاً (دقائق-نواة) يُنفَّذ أولاً
+export function jobPriority(cost: JobCost): number {
+  return Math.min(2_097_152, Math.ceil(cost.cpuSeconds / 60) + 1);
+}
@@ -0,0 +1,127 @@
+import {
+  downloadFile,
+  generateDownloadUrl,
+  getObjectSize,
+  readRange,
+} from "./s3";
+import { config } from "../config";
+
+// كم بايت نقرأ من بداية الملف لمعرفة ترتيب الـ boxes (moov قبل mdat؟)
+const PROBE_BYTES = 64 * 1024;
+
+// أعمار الروابط الموقّعة (ثوانٍ):
+//   رابط الفحص يكفي ffprobe لقراءة الترويسة قبل انتظار المجدول
+//   رابط البث يُنشأ بعد الحصول على الأنوية ويجب أن يعيش طوال الترميز
+const PROBE_URL_TTL_S = 15 * 60;
+const MIN_STREAM_URL_TTL_S = 6 * 3600;
+const MAX_STREAM_URL_TTL_S = 7 * 24 * 3600; // الحد الأقصى في SigV4
+const STREAM_URL_MARGIN_S = 3600;
+
+export interface SourceInput {
+  input: string; // presigned URL (stream) أو مسار محلي (download)
+  mode: "stream" | "download";
+  sizeBytes: number;
+}
+
+// نتيجة فحص بداية الملف:
+//   "faststart"  -> MP4/MOV و moov قبل mdat: يمكن بثه مباشرة
+//   "moov-last"  -> MP4/MOV و mdat أولاً: FFmpeg يحتاج moov من آخر الملف
+//   "not-mp4"    -> TS/MKV/WebM...: صيغ متتابعة لا تحتاج فهرساً في البداية
+//   "unknown"    -> لم نصل إلى moov أو mdat داخل الجزء المقروء
+export type Layout = "faststart" | "moov-last" | "not-mp4" | "unknown";
+
+const TS_SYNC = 0x47;
+const TS_PACKET = 188;
+const EBML_MAGIC = 0x1a45dfa3; // Matroska / WebM
+
+// هل تبدو هذه الـ 8 بايت كرأس box؟
+// (الحجم 0 أو 1 أو >= 8، والنوع 4 حروف قابلة للطباعة)
+// ملفات QuickTime (.mov) القديمة لا تبدأ بـ ftyp بل بـ wide / free / mdat / moov
+function isBoxHeader(head: Buffer, offset: number): boolean {
+  const size = head.readUInt32BE(offset);
+  if (size !== 0 && size !== 1 && size < 8) return false;
+  for (let i = offset + 4; i < offset + 8; i++) {
+    const c = head[i]!;
+    // 0xa9 = "©" في أنواع QuickTime
+    if ((c < 0x20 || c > 0x7e) && c !== 0xa9) return false;
+  }
+  return true;
+}
+
+function isSequential(head: Buffer): boolean {
+  if (
+    head[0] === TS_SYNC &&
+    (head.length <= TS_PACKET || head[TS_PACKET] === TS_SYNC)
+  ) {
+    return true;
+  }
+  return head.length >= 4 && head.readUInt32BE(0) === EBML_MAGIC;
+}
+
+export function detectLayout(head: Buffer): Layout {
+  if (head.length < 8) return "unknown";
+  if (isSequential(head) || !isBoxHeader(head, 0)) return "not-mp4";
+
+  // نمشي على الـ boxes سواء وُجد ftyp أم لا (ftyp / wide / free / skip ... تُتخطى)
+  let offset = 0;
+  while (offset + 8 <= head.length) {
+    let size = head.readUInt32BE(offset);
+    const type = head.toString("latin1", offset + 4, offset + 8);
+    if (type === "moov") return "faststart";
+    if (type === "mdat") return "moov-last";
+    if (size === 1) {
+      // 64-bit largesize
+      if (offset + 16 > head.length) break;
+      size = Number(head.readBigUInt64BE(offset + 8));
+    }
+    if (size < 8) break; // size 0 = "to end of file" (لا يوجد box بعده)
+    offset += size;
+  }
+  return "unknown";
+}
+
+// رابط قصير العمر لتقدير الكلفة (ffprobe) قبل الدخول إلى المجدول
+export function probeUrl(s3Key: string): Promise<string> {
+  return generateDownloadUrl(s3Key, PROBE_URL_TTL_S);
+}
+
+// عمر رابط البث: ضعف زمن الترميز المتوقع + هامش، ضمن حدود S3
+export function streamUrlTtl(encodeSeconds: number): number {
+  const ttl = Math.ceil(encodeSeconds * 2) + STREAM_URL_MARGIN_S;
+  return Math.min(MAX_STREAM_URL_TTL_S, Math.max(MIN_STREAM_URL_TTL_S, ttl));
+}
+
+// تجهيز مدخل FFmpeg: بث مباشر عندما يسمح ترتيب الملف، وإلا تنزيل كامل
+// يُستدعى بعد الحصول على الـ lease: عمر الرابط يبدأ مع الترميز لا مع الانتظار،
+// والتنزيل الكامل لا يحجز القرص/الشبكة لوظائف ما زالت في الطابور
+export async function prepareSource(
+  s3Key: string,
+  localPath: string,
+  urlTtlS = MIN_STREAM_URL_TTL_S,
+): Promise<SourceInput> {
+  const sizeBytes = await getObjectSize(s3Key);
+
+  if (config.ingestMode === "stream" && sizeBytes > 0) {
+    const head = await readRange(
+      s3Key,
+      0,
+      Math.min(PROBE_BYTES, sizeBytes) - 1,
+    );
+    const layout = detectLayout(head);
+    console.log(`[Ingest] ${s3Key}: ${layout} (${sizeBytes} bytes)`);
+
+    if (layout === "faststart" || layout === "not-mp4") {
+      return {
+        input: await generateDownloadUrl(s3Key, urlTtlS),
+        mode: "stream",
+        sizeBytes,
+      };
+    }
+    // moov في النهاية (أو ترتيب لم نتأكد منه): القراءة عبر HTTP ستقفز بين آخر الملف
+    // وأوله لكل عينة في الملفات سيئة الـ interleaving، لذلك التنزيل الكامل أكثر أماناً
+    console.log(`[Ingest] ${layout}: falling back to full download`);
+  }
+
+  await downloadFile(s3Key, localPath);
+  return { input: localPath, mode: "download", sizeBytes };
+}
@@ -0,0 +1,103 @@
+import http from "http";
+
+// مقاييس بصيغة Prometheus النصية (text exposition 0.0.4) بدون مكتبات إضافية:
+// gauges للحالة اللحظية و counters تراكمية لحساب الإنتاجية الفعلية عبر rate()
+
+type Labels = Record<string, string>;
+
+const labelKey = (labels: Labels) =>
+  Object.keys(labels)
+    .sort()
+    .map((k) => `${k}="${String(labels[k]).replace(/["\\\n]/g, "\\$&")}"`)
+    .join(",");
+
+class Metric {
+  private values = new Map<string, number>();
+
+  constructor(
+    readonly name: string,
+    readonly help: string,
+    readonly type: "gauge" | "counter",
+  ) {}
+
+  set(labels: Labels, value: number) {
+    if (Number.isFinite(value)) this.values.set(labelKey(labels), value);
+  }
+
+  inc(labels: Labels, by = 1) {
+    if (!Number.isFinite(by) || by < 0) return;
+    const key = labelKey(labels);
+    this.values.set(key, (this.values.get(key) ?? 0) + by);
+  }
+
+  // تُحذف قيم الـ gauges الخاصة بوظيفة انتهت حتى لا تبقى معلّقة في اللوحة
+  remove(match: Labels) {
+    const parts = labelKey(match).split(",");
+    for (const key of [...this.values.keys()]) {
+      if (parts.every((p) => key.split(",").includes(p))) {
+        this.values.delete(key);
+      }
+    }
+  }
+
+  render(): string {
+    const lines = [
+      `# HELP ${this.name} ${this.help}`,
+      `# TYPE ${this.name} ${this.type}`,
+    ];
+    for (const [key, value] of this.values) {
+      lines.push(`${this.name}${key ? `{${key}}` : ""} ${value}`);
+    }
+    return lines.join("\n");
+  }
+}
+
+const registry: Metric[] = [];
+
+const gauge = (name: string, help: string) => {
+  const m = new Metric(name, help, "gauge");
+  registry.push(m);
+  return m;
+};
+const counter = (name: string, help: string) => {
+  const m = new Metric(name, help, "counter");
+  registry.push(m);
+  return m;
+};
+
+export const metrics = {
+  progress: gauge("encode_progress_ratio", "Fraction of the source encoded (0-1)"),
+  fps: gauge("encode_fps", "Source frames encoded per second (all ffmpeg processes of the job)"),
+  speed: gauge("encode_speed_ratio", "Media seconds encoded per wall-clock second"),
+  eta: gauge("encode_eta_seconds", "Estimated seconds until the encode finishes"),
+  rungBitrate: gauge("encode_rung_bitrate_kbps", "Output bitrate so far per rung, from segment bytes"),
+  rungQ: gauge("encode_rung_quantizer", "Current x264 quantizer per rung"),
+  mediaSeconds: counter("encode_media_seconds_total", "Media seconds encoded, by preset"),
+  wallSeconds: counter("encode_wall_seconds_total", "Wall-clock seconds spent encoding, by preset"),
+  frames: counter("encode_frames_total", "Source frames encoded, by preset"),
+  jobs: counter("transcode_jobs_total", "Finished transcode jobs by status"),
+  schedulerCpus: gauge("scheduler_cpus_in_use", "Cores granted to running jobs"),
+  schedulerMemory: gauge("scheduler_memory_mb_in_use", "Estimated MB of running jobs"),
+  schedulerRunning: gauge("scheduler_jobs_running", "Jobs admitted and encoding"),
+  schedulerWaiting: gauge("scheduler_jobs_waiting", "Jobs waiting for cores/memory"),
+};
+
+export function renderMetrics(): string {
+  return registry.map((m) => m.render()).join("\n") + "\n";
+}
+
+// خادم صغير لـ /metrics داخل عملية الوركر (لا يوجد Fastify هنا)
+export function startMetricsServer(port: number) {
+  const server = http.createServer((req, res) => {
+    if (req.url?.split("?")[0] !== "/metrics") {
+      res.writeHead(404).end();
+      return;
+    }
+    res.writeHead(200, { "Content-Type": "text/plain; version=0.0.4" });
+    res.end(renderMetrics());
+  });
+  server.listen(port, () =>
+    console.log(`[Metrics] Listening on :${port}/metrics`),
+  );
+  return server;
+}
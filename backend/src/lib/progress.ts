@@ -0,0 +1,63 @@
+import { EncodeProgress } from "../types";
+import { metrics } from "./metrics";
+
+const PREFIX = "PROGRESS ";
+
+// يعيد null لأي سطر ليس سطر تقدم (سجلات عادية من السكربت)
+export function parseProgressLine(line: string): EncodeProgress | null {
+  if (!line.startsWith(PREFIX)) return null;
+  try {
+    return JSON.parse(line.slice(PREFIX.length)) as EncodeProgress;
+  } catch {
+    return null;
+  }
+}
+
+/**
+ * يحوّل أسطر التقدم لوظيفة واحدة إلى مقاييس:
+ * - gauges لحالة الوظيفة الحالية (تُمسح عند الانتهاء)
+ * - counters تراكمية (ثواني وسائط / ثواني فعلية / إطارات) حسب الـ preset،
+ *   فنسبة rate(media) / rate(wall) هي السرعة الحقيقية لكل preset على هذه الآلة
+ */
+export class ProgressTracker {
+  private last = { media: 0, wall: 0, frames: 0 };
+
+  constructor(private videoId: string) {}
+
+  record(p: EncodeProgress) {
+    const job = { video: this.videoId };
+    metrics.progress.set(job, p.percent / 100);
+    metrics.fps.set(job, p.fps);
+    metrics.speed.set(job, p.speed);
+    if (p.eta_s !== null) metrics.eta.set(job, p.eta_s);
+    for (const [rung, r] of Object.entries(p.rungs)) {
+      metrics.rungBitrate.set({ ...job, rung }, r.bitrate_kbps);
+      if (r.q !== null) metrics.rungQ.set({ ...job, rung }, r.q);
+    }
+
+    // العدادات تزيد بالفرق منذ آخر سطر فقط
+    const preset = { preset: p.preset || "unknown" };
+    metrics.mediaSeconds.inc(preset, p.out_time_s - this.last.media);
+    metrics.wallSeconds.inc(preset, p.elapsed_s - this.last.wall);
+    metrics.frames.inc(preset, p.frames - this.last.frames);
+    this.last = {
+      media: Math.max(this.last.media, p.out_time_s),
+      wall: Math.max(this.last.wall, p.elapsed_s),
+      frames: Math.max(this.last.frames, p.frames),
+    };
+  }
+
+  clear() {
+    const job = { video: this.videoId };
+    for (const m of [
+      metrics.progress,
+      metrics.fps,
+      metrics.speed,
+      metrics.eta,
+      metrics.rungBitrate,
+      metrics.rungQ,
+    ]) {
+      m.remove(job);
+    }
+  }
+}
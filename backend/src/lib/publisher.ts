@@ -0,0 +1,191 @@
+import fs from "fs";
+import path from "path";
+import { uploadBody, uploadFile } from "./s3";
+
+// ملفات لا تُرفع أبداً: المصدر، الملفات المؤقتة لـ FFmpeg، ومجلد الـ chunks
+const SKIP = new Set(["source.mp4"]);
+const isTemp = (file: string) => file.endsWith(".tmp") || file.startsWith(".");
+
+// ترتيب الرفع النهائي: كل ما ليس قائمة تشغيل، ثم قوائم الجودات، ثم master.m3u8 أخيراً
+// (المشغّل لا يرى قائمة تشير إلى مقطع غير موجود بعد)
+function publishRank(file: string): number {
+  if (file === "master.m3u8") return 2;
+  if (file.endsWith(".m3u8")) return 1;
+  return 0;
+}
+
+// الملفات التي تشير إليها قائمة تشغيل: أسطر الـ URI و EXT-X-MAP
+export function playlistRefs(text: string): string[] {
+  const refs: string[] = [];
+  for (const raw of text.split("\n")) {
+    const line = raw.trim();
+    const map = /^#EXT-X-MAP:.*URI="([^"]+)"/.exec(line);
+    if (map?.[1]) refs.push(map[1]);
+    else if (line && !line.startsWith("#")) refs.push(line);
+  }
+  return refs;
+}
+
+/**
+ * يرفع مخرجات FFmpeg أثناء الترميز:
+ * - يراقب المجلد ويرفع كل .ts بمجرد أن يغلقه FFmpeg (hls_flags temp_file: يظهر الملف بالـ rename عند اكتماله)
+ * - عدد محدود من عمليات الرفع المتزامنة، وكل ملف يُرفع كـ stream (ذاكرة ثابتة)
+ * - finish() ينتظر انتهاء الطابور، يمسح المجلد لأي ملف فات المراقب، ثم يرفع القوائم
+ * - fast start: قوائم EVENT تُرفع أثناء الترميز بعد رفع كل المقاطع التي تذكرها،
+ *   و master.m3u8 بعد رفع كل قوائم الجودات التي يذكرها؛ onLive يُستدعى عند أول master
+ */
+export class SegmentPublisher {
+  private uploaded = new Set<string>();
+  private queued = new Set<string>();
+  private pending: string[] = [];
+  private active = 0;
+  private idleWaiters: Array<() => void> = [];
+  private watcher: fs.FSWatcher | null = null;
+  private error: Error | null = null;
+  // قوائم تغيّرت ولم تُرفع بعد، والقوائم التي رُفعت أثناء الترميز
+  private dirtyPlaylists = new Set<string>();
+  private livePlaylists = new Set<string>();
+  private liveUploads = new Map<string, Promise<void>>();
+  private live = false;
+
+  constructor(
+    private localDir: string,
+    private s3Prefix: string,
+    private concurrency = 8,
+    private onLive?: () => void,
+  ) {}
+
+  start() {
+    this.watcher = fs.watch(this.localDir, (_event, file) => {
+      if (!file) return;
+      const name = file.toString();
+      if (name.endsWith(".ts")) this.offer(name);
+      else if (name.endsWith(".m3u8")) {
+        this.dirtyPlaylists.add(name);
+        this.publishPlaylists();
+      }
+    });
+  }
+
+  stop() {
+    this.watcher?.close();
+    this.watcher = null;
+    this.dirtyPlaylists.clear();
+  }
+
+  get count() {
+    return this.uploaded.size;
+  }
+
+  private offer(file: string) {
+    if (SKIP.has(file) || isTemp(file)) return;
+    if (this.queued.has(file) || this.uploaded.has(file)) return;
+    if (!fs.existsSync(path.join(this.localDir, file))) return; // rename-away / deleted
+    this.queued.add(file);
+    this.pending.push(file);
+    this.pump();
+  }
+
+  private pump() {
+    while (this.active < this.concurrency && this.pending.length > 0) {
+      const file = this.pending.shift()!;
+      this.active++;
+      uploadFile(path.join(this.localDir, file), `${this.s3Prefix}/${file}`)
+        .then(() => {
+          this.uploaded.add(file);
+          this.publishPlaylists();
+        })
+        .catch((err) => {
+          console.error(`[Publisher] Upload failed for ${file}:`, err);
+          this.error = this.error ?? err;
+          this.queued.delete(file); // finish() will retry it once
+        })
+        .finally(() => {
+          this.active--;
+          this.pump();
+          if (this.active === 0 && this.pending.length === 0) {
+            this.idleWaiters.splice(0).forEach((resolve) => resolve());
+          }
+        });
+    }
+  }
+
+  // قائمة تُرفع فقط عندما يكون كل ما تشير إليه موجوداً على S3 (المشغّل لا يرى 404)
+  private publishPlaylists() {
+    if (!this.watcher) return;
+    for (const file of [...this.dirtyPlaylists]) {
+      if (this.liveUploads.has(file)) continue; // يُعاد فحصها عند انتهاء الرفع الجاري
+      let text: string;
+      try {
+        text = fs.readFileSync(path.join(this.localDir, file), "utf8");
+      } catch {
+        continue; // بين الـ rename والقراءة
+      }
+      const isMaster = file === "master.m3u8";
+      // قوائم VOD لا تُرفع قبل النهاية: بدون ENDLIST لا معنى لها للمشغّل
+      if (!isMaster && !text.includes("#EXT-X-PLAYLIST-TYPE:EVENT")) continue;
+      const ready = isMaster ? this.livePlaylists : this.uploaded;
+      if (!playlistRefs(text).every((ref) => ready.has(ref))) continue;
+
+      this.dirtyPlaylists.delete(file);
+      const upload = uploadBody(`${this.s3Prefix}/${file}`, text)
+        .then(() => {
+          this.livePlaylists.add(file);
+          if (isMaster && !this.live) {
+            this.live = true;
+            console.log("[Publisher] master.m3u8 is live (encode still running)");
+            this.onLive?.();
+          }
+        })
+        .catch((err) => {
+          // ليس خطأً قاتلاً: finish() يرفع القوائم النهائية في كل الأحوال
+          console.error(`[Publisher] Live upload failed for ${file}:`, err);
+          this.dirtyPlaylists.add(file);
+        })
+        .finally(() => {
+          this.liveUploads.delete(file);
+          this.publishPlaylists();
+        });
+      this.liveUploads.set(file, upload);
+    }
+  }
+
+  private drain(): Promise<void> {
+    if (this.active === 0 && this.pending.length === 0) return Promise.resolve();
+    return new Promise((resolve) => this.idleWaiters.push(resolve));
+  }
+
+  // يُستدعى بعد انتهاء FFmpeg
+  async finish() {
+    this.stop();
+    await this.drain();
+    // نسخة EVENT متأخرة لا يجب أن تصل بعد القائمة النهائية
+    await Promise.all(this.liveUploads.values());
+
+    // القوائم تُرفع دائماً من جديد: النسخة الحية قد تكون EVENT بدون ENDLIST
+    const files = fs
+      .readdirSync(this.localDir)
+      .filter((f) => !SKIP.has(f) && !isTemp(f))
+      .filter((f) => publishRank(f) > 0 || !this.uploaded.has(f))
+      .filter((f) => fs.lstatSync(path.join(this.localDir, f)).isFile());
+
+    this.error = null;
+    for (const rank of [0, 1, 2]) {
+      files
+        .filter((f) => publishRank(f) === rank)
+        .forEach((f) => {
+          this.queued.delete(f);
+          this.uploaded.delete(f);
+          this.offer(f);
+        });
+      await this.drain();
+      if (this.error) throw this.error;
+    }
+    console.log(`[Publisher] ${this.uploaded.size} files published`);
+  }
+}
+
+// رفع مجلد كامل دفعة واحدة (نفس الترتيب: المقاطع أولاً ثم القوائم)
+export async function uploadDirectory(localDir: string, s3Prefix: string) {
+  await new SegmentPublisher(localDir, s3Prefix).finish();
+}
@@ -2,10 +2,12 @@ import {
   S3Client,
   PutObjectCommand,
   GetObjectCommand,
+  HeadObjectCommand,
 } from "@aws-sdk/client-s3";
 import { getSignedUrl } from "@aws-sdk/s3-request-presigner";
 import fs from "fs";
-import path from "path";
+import http from "http";
+import https from "https";
 import { config } from "../config";
 
 const s3 = new S3Client({
@@ -15,6 +17,13 @@ const s3 = new S3Client({
     accessKeyId: config.aws.accessKeyId,
     secretAccessKey: config.aws.secretAccessKey,
   },
+  // MinIO / moto والبدائل المحلية تحتاج path-style URLs
+  forcePathStyle: config.aws.forcePathStyle,
+  // keep-alive: رفع مئات المقاطع الصغيرة بدون TLS handshake لكل ملف
+  requestHandler: {
+    httpAgent: new http.Agent({ keepAlive: true, maxSockets: 32 }),
+    httpsAgent: new https.Agent({ keepAlive: true, maxSockets: 32 }),
+  },
 });
 
 export const BUCKET = config.aws.bucket;
@@ -39,34 +48,71 @@ export async function downloadFile(
   });
 }
 
-// الدالة المصححة للرفع (تحدد Content-Type وتتجاهل الملف الأصلي)
-export async function uploadDirectory(localDir: string, s3Prefix: string) {
-  const files = fs.readdirSync(localDir);
-
-  for (const file of files) {
-    const fullPath = path.join(localDir, file);
-
-    // نتجاهل المجلدات والملف المصدري
-    if (fs.lstatSync(fullPath).isDirectory()) continue;
-    if (file === "source.mp4") continue;
+// رابط قراءة موقّع: يسمح لـ FFmpeg بقراءة المصدر مباشرة عبر HTTP (مع Range requests)
+export async function generateDownloadUrl(
+  key: string,
+  expiresIn = 6 * 3600,
+): Promise<string> {
+  const command = new GetObjectCommand({ Bucket: BUCKET, Key: key });
+  return getSignedUrl(s3, command, { expiresIn });
+}
 
-    const fileContent = fs.readFileSync(fullPath);
+export async function getObjectSize(key: string): Promise<number> {
+  const response = await s3.send(
+    new HeadObjectCommand({ Bucket: BUCKET, Key: key }),
+  );
+  return response.ContentLength ?? 0;
+}
 
-    // تحديد نوع الملف (السر في عمل الفيديو)
-    let contentType = "application/octet-stream";
-    if (file.endsWith(".m3u8")) contentType = "application/vnd.apple.mpegurl";
-    else if (file.endsWith(".ts")) contentType = "video/MP2T";
+// قراءة جزء من الملف فقط (bytes=start-end) بدون تنزيله بالكامل
+export async function readRange(
+  key: string,
+  start: number,
+  end: number,
+): Promise<Buffer> {
+  const command = new GetObjectCommand({
+    Bucket: BUCKET,
+    Key: key,
+    Range: `bytes=${start}-${end}`,
+  });
+  const response = await s3.send(command);
+  if (!response.Body) throw new Error("Empty response body");
+  return Buffer.from(await response.Body.transformToByteArray());
+}
 
-    console.log(`[S3] Uploading ${file} as ${contentType}`);
+// تحديد نوع الملف (السر في عمل الفيديو)
+export function contentTypeFor(file: string): string {
+  if (file.endsWith(".m3u8")) return "application/vnd.apple.mpegurl";
+  if (file.endsWith(".ts")) return "video/MP2T";
+  if (file.endsWith(".mp4")) return "video/mp4"; // CMAF: ملف واحد لكل جودة (byte ranges)
+  if (file.endsWith(".m4s")) return "video/iso.segment";
+  return "application/octet-stream";
+}
 
-    const command = new PutObjectCommand({
-      Bucket: BUCKET,
-      Key: `${s3Prefix}/${file}`,
-      Body: fileContent,
-      ContentType: contentType, // <--- هذا السطر هو الأهم
-      ACL: "public-read",
-    });
+// رفع ملف واحد كـ stream (لا يُحمّل الملف في الذاكرة مهما كان حجمه)
+export async function uploadFile(localPath: string, key: string) {
+  const { size } = await fs.promises.stat(localPath);
+  const command = new PutObjectCommand({
+    Bucket: BUCKET,
+    Key: key,
+    Body: fs.createReadStream(localPath),
+    ContentLength: size,
+    ContentType: contentTypeFor(localPath), // <--- هذا السطر هو الأهم
+    ACL: "public-read",
+  });
+  await s3.send(command);
+}
 
-    await s3.send(command);
-  }
+// رفع محتوى في الذاكرة (قوائم تشغيل EVENT أثناء الترميز): no-cache حتى لا
+// يحتفظ الـ CDN بنسخة قديمة من قائمة ما زالت تكبر
+export async function uploadBody(key: string, body: string) {
+  const command = new PutObjectCommand({
+    Bucket: BUCKET,
+    Key: key,
+    Body: body,
+    ContentType: contentTypeFor(key),
+    CacheControl: "no-cache",
+    ACL: "public-read",
+  });
+  await s3.send(command);
 }
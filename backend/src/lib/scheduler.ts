@@ -0,0 +1,105 @@
+import { JobCost } from "./cost";
+
+// قبول الوظائف داخل عملية الوركر حسب ميزانية أنوية/ذاكرة بدل concurrency: 1
+// - كل وظيفة تطلب cores + memoryMb من تقديرها، وتُقبل فقط إذا كان المتبقي يكفي
+// - الانتظار مرتّب: الأقل عملاً (cpuSeconds) أولاً، حتى لا تعلق الوظائف الصغيرة خلف ساعة 1080p
+// - وظيفة أكبر من الميزانية كلها تُقبل وحدها عندما يفرغ الجهاز (تُقصّ إلى الميزانية)
+
+export interface Budget {
+  cpus: number;
+  memoryMb: number;
+}
+
+export interface Lease {
+  threads: number; // قيمة FFMPEG_THREADS لهذه الوظيفة
+  memoryMb: number;
+  release: () => void;
+}
+
+interface Waiter {
+  id: string;
+  cost: JobCost;
+  since: number;
+  grant: (lease: Lease) => void;
+}
+
+// وظيفة طويلة لا تنتظر للأبد خلف تدفق مستمر من الوظائف القصيرة
+const MAX_WAIT_MS = 30 * 60 * 1000;
+
+export class ResourceScheduler {
+  private usedCpus = 0;
+  private usedMemoryMb = 0;
+  private running = 0;
+  private waiting: Waiter[] = [];
+
+  constructor(readonly budget: Budget) {}
+
+  get load() {
+    return {
+      cpus: this.usedCpus,
+      memoryMb: this.usedMemoryMb,
+      running: this.running,
+      waiting: this.waiting.length,
+    };
+  }
+
+  acquire(id: string, cost: JobCost): Promise<Lease> {
+    return new Promise((grant) => {
+      this.waiting.push({ id, cost, since: Date.now(), grant });
+      this.dispatch();
+    });
+  }
+
+  private fits(cores: number, memoryMb: number) {
+    if (this.running === 0) return true; // أكبر من الميزانية: يعمل وحده
+    return (
+      this.usedCpus + cores <= this.budget.cpus &&
+      this.usedMemoryMb + memoryMb <= this.budget.memoryMb
+    );
+  }
+
+  private dispatch() {
+    const now = Date.now();
+    // المتقادمة أولاً (حماية من التجويع)، ثم الأقصر
+    this.waiting.sort((a, b) => {
+      const aOld = now - a.since > MAX_WAIT_MS;
+      const bOld = now - b.since > MAX_WAIT_MS;
+      if (aOld !== bOld) return aOld ? -1 : 1;
+      return a.cost.cpuSeconds - b.cost.cpuSeconds;
+    });
+
+    for (let i = 0; i < this.waiting.length; ) {
+      const w = this.waiting[i]!;
+      const cores = Math.min(w.cost.cores, this.budget.cpus);
+      const memoryMb = Math.min(w.cost.memoryMb, this.budget.memoryMb);
+      if (!this.fits(cores, memoryMb)) {
+        // وظيفة متقادمة تحجز الدور: لا نتجاوزها بوظائف أصغر
+        if (now - w.since > MAX_WAIT_MS) break;
+        i++;
+        continue;
+      }
+      this.waiting.splice(i, 1);
+      this.usedCpus += cores;
+      this.usedMemoryMb += memoryMb;
+      this.running++;
+      console.log(
+        `[Scheduler] ${w.id}: ${cores} cores, ${memoryMb} MB ` +
+          `(~${w.cost.estimatedSeconds}s, ${this.usedCpus}/${this.budget.cpus} cores in use)`,
+      );
+
+      let released = false;
+      w.grant({
+        threads: cores,
+        memoryMb,
+        release: () => {
+          if (released) return;
+          released = true;
+          this.usedCpus -= cores;
+          this.usedMemoryMb -= memoryMb;
+          this.running--;
+          this.dispatch();
+        },
+      });
+    }
+  }
+}
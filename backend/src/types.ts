@@ -24,3 +24,25 @@ export interface ProcessRequestBody {
   videoId: string;
   s3Key: string;
 }
+
+// 4. سطر التقدم الذي يطبعه ladder_encoder.py ("PROGRESS {json}") مرة كل ثانية
+export interface RungProgress {
+  bitrate_kbps: number;
+  target_kbps: number;
+  q: number | null;
+}
+
+export interface EncodeProgress {
+  state: "encoding" | "done";
+  percent: number;
+  out_time_s: number;
+  duration_s: number;
+  elapsed_s: number;
+  fps: number;
+  speed: number;
+  eta_s: number | null;
+  frames: number;
+  workers: number;
+  preset: string;
+  rungs: Record<string, RungProgress>;
+}
@@ -2,9 +2,22 @@ import { Worker, Job } from "bullmq";
 import IORedis from "ioredis";
 import path from "path";
 import fs from "fs";
+import readline from "readline";
 import { spawn } from "child_process";
 import { config } from "./config";
-import { downloadFile, uploadDirectory } from "./lib/s3";
+import { SegmentPublisher } from "./lib/publisher";
+import {
+  prepareSource,
+  probeUrl,
+  SourceInput,
+  streamUrlTtl,
+} from "./lib/ingest";
+import { getObjectSize } from "./lib/s3";
+import { estimateJob } from "./lib/cost";
+import { Lease, ResourceScheduler } from "./lib/scheduler";
+import { metrics, startMetricsServer } from "./lib/metrics";
+import { parseProgressLine, ProgressTracker } from "./lib/progress";
+import { EncodeProgress } from "./types";
 import { query } from "./lib/db"; // هذا يشير إلى الملف الموجود داخل lib
 
 const QUEUE_NAME = "video-transcoding-queue";
@@ -14,32 +27,57 @@ const connection = new IORedis(config.redisUrl, {
   maxRetriesPerRequest: null,
 });
 
+// ميزانية الأنوية/الذاكرة المشتركة بين الوظائف المتزامنة
+const scheduler = new ResourceScheduler(config.scheduler);
+
+const reportLoad = () => {
+  const load = scheduler.load;
+  metrics.schedulerCpus.set({}, load.cpus);
+  metrics.schedulerMemory.set({}, load.memoryMb);
+  metrics.schedulerRunning.set({}, load.running);
+  metrics.schedulerWaiting.set({}, load.waiting);
+};
+
 // دالة تشغيل السكربت
-function runFFmpegScript(inputPath: string): Promise<void> {
+function runFFmpegScript(
+  source: SourceInput,
+  workDir: string,
+  threads: number,
+  onProgress: (p: EncodeProgress) => void,
+): Promise<void> {
   return new Promise((resolve, reject) => {
     const scriptPath = path.resolve(__dirname, "../scripts/encode_master.sh");
-    const workDir = path.dirname(inputPath);
-    const fileName = path.basename(inputPath);
 
     if (!fs.existsSync(scriptPath)) {
       return reject(new Error(`Script not found at: ${scriptPath}`));
     }
 
-    console.log(`[FFmpeg] Spawning Bash inside: ${workDir}`);
+    console.log(`[FFmpeg] Spawning Bash inside: ${workDir} (${source.mode})`);
 
-    const process = spawn("bash", [scriptPath, fileName], {
+    const env: NodeJS.ProcessEnv = {
+      ...process.env,
+      SRC_SIZE_BYTES: String(source.sizeBytes),
+      // عدد الأنوية الذي منحه المجدول لهذه الوظيفة (يُقسّم على الجودات داخل FFmpeg)
+      FFMPEG_THREADS: String(threads),
+    };
+
+    const child = spawn("bash", [scriptPath, source.input], {
       cwd: workDir,
+      env,
       stdio: ["ignore", "pipe", "pipe"],
     });
 
-    process.stdout.on("data", (d) =>
-      console.log(`[FFmpeg Out] ${d.toString().trim()}`),
-    );
-    process.stderr.on("data", (d) =>
+    // سطر بسطر: أسطر "PROGRESS {json}" تذهب للتقدم والمقاييس، والباقي للسجل
+    readline.createInterface({ input: child.stdout }).on("line", (line) => {
+      const progress = parseProgressLine(line);
+      if (progress) onProgress(progress);
+      else if (line.trim()) console.log(`[FFmpeg Out] ${line.trim()}`);
+    });
+    child.stderr.on("data", (d) =>
       console.error(`[FFmpeg Err] ${d.toString().trim()}`),
     );
 
-    process.on("close", (code) => {
+    child.on("close", (code) => {
       if (code === 0) resolve();
       else reject(new Error(`FFmpeg script failed with exit code ${code}`));
     });
@@ -58,6 +96,7 @@ const processJob = async (job: Job) => {
 
   const tempDir = path.resolve(__dirname, `../temp/${videoId}`);
   const inputPath = path.join(tempDir, "source.mp4");
+  let lease: Lease | undefined;
 
   try {
     if (!fs.existsSync(tempDir)) fs.mkdirSync(tempDir, { recursive: true });
@@ -66,42 +105,115 @@ const processJob = async (job: Job) => {
       videoId,
     ]);
 
-    // 1. التنزيل
-    console.log("[Worker] Downloading source file...");
-    await downloadFile(s3Key, inputPath);
-
-    // 2. المعالجة
-    console.log("[Worker] Transcoding...");
-    await runFFmpegScript(inputPath);
+    // 1. الجدولة: تقدير الكلفة ثم انتظار أنوية/ذاكرة كافية (الأقصر أولاً)
+    // لا ننشئ رابط البث ولا ننزّل المصدر قبل القبول: الانتظار قد يطول
+    // ffprobe يقرأ الترويسة فقط عبر رابط فحص قصير العمر
+    const sizeBytes = await getObjectSize(s3Key);
+    const cost = await estimateJob(
+      await probeUrl(s3Key),
+      sizeBytes,
+      config.scheduler.cpus,
+    );
+    console.log(
+      `[Worker] Cost estimate: ${cost.cores} cores, ${cost.memoryMb} MB, ` +
+        `~${cost.estimatedSeconds}s (${cost.rungs.join(", ")})`,
+    );
+    const acquired = scheduler.acquire(String(job.id), cost);
+    reportLoad();
+    lease = await acquired;
+    reportLoad();
+
+    // 2. المصدر: بث مباشر من S3 (fast-start) أو تنزيل كامل كخطة بديلة
+    // عمر الرابط محسوب من زمن الترميز على عدد الأنوية الممنوحة فعلاً
+    console.log("[Worker] Preparing source...");
+    const source = await prepareSource(
+      s3Key,
+      inputPath,
+      streamUrlTtl(cost.cpuSeconds / Math.max(1, lease.threads)),
+    );
 
-    // 3. الرفع
+    // 3. المعالجة + الرفع المتزامن: كل مقطع يُرفع بمجرد اكتماله
     const s3TargetPrefix = `hls/${videoId}`;
-    console.log("[Worker] Uploading HLS files...");
-    await uploadDirectory(tempDir, s3TargetPrefix);
-
-    // 4. الحفظ
     const playlistUrl = `https://${config.aws.bucket}.fly.storage.tigris.dev/${s3TargetPrefix}/master.m3u8`;
+    // fast start (LEAD_SEGMENTS): الـ master يُنشر أثناء الترميز، فنكشف الرابط فوراً
+    // والحالة تبقى PROCESSING حتى تكتمل كل المقاطع
+    const publisher = new SegmentPublisher(
+      tempDir,
+      s3TargetPrefix,
+      config.uploadConcurrency,
+      () => {
+        query("UPDATE videos SET hls_playlist_path = $1 WHERE id = $2", [
+          playlistUrl,
+          videoId,
+        ]).catch((err) =>
+          console.error("[Worker] Early playlist update failed:", err),
+        );
+      },
+    );
+    console.log("[Worker] Transcoding (segments upload as they are produced)...");
+    publisher.start();
+    const tracker = new ProgressTracker(videoId);
+    try {
+      await runFFmpegScript(source, tempDir, lease.threads, (p) => {
+        tracker.record(p);
+        job
+          .updateProgress({
+            percent: p.percent,
+            fps: p.fps,
+            speed: p.speed,
+            eta_s: p.eta_s,
+            rungs: p.rungs,
+          })
+          .catch((err) => console.error("[Worker] updateProgress failed:", err));
+      });
+    } catch (error) {
+      publisher.stop();
+      throw error;
+    } finally {
+      tracker.clear();
+    }
+
+    // 4. الرفع: ما تبقى من المقاطع ثم قوائم التشغيل (master.m3u8 أخيراً)
+    console.log(`[Worker] Finalizing upload (${publisher.count} segments already published)...`);
+    await publisher.finish();
+
+    // 5. الحفظ
     await query(
       "UPDATE videos SET status = 'READY', hls_playlist_path = $1 WHERE id = $2",
       [playlistUrl, videoId],
     );
 
+    metrics.jobs.inc({ status: "completed" });
     console.log(`[Worker] Job ${job.id} Completed!`);
   } catch (error) {
+    metrics.jobs.inc({ status: "failed" });
     console.error(`[Worker] Job ${job.id} Failed:`, error);
     await query("UPDATE videos SET status = 'FAILED' WHERE id = $1", [videoId]);
     throw error;
   } finally {
+    lease?.release();
+    reportLoad();
     if (fs.existsSync(tempDir))
       fs.rmSync(tempDir, { recursive: true, force: true });
   }
 };
 
+// مقاييس Prometheus على /metrics (fly.toml [metrics] يقرأ من هذا المنفذ)
+startMetricsServer(config.metricsPort);
+
 // إنشاء الوركر (مع التصحيح الخاص بـ connection)
+// concurrency هنا حد أعلى فقط: المجدول هو من يقرر متى تبدأ كل وظيفة فعلاً
 export const worker = new Worker(QUEUE_NAME, processJob, {
   connection: connection as any, // <--- الحل الذي قمت به (صحيح 100%)
-  concurrency: 1,
+  concurrency: config.scheduler.maxJobs,
   drainDelay: 5000,
-  lockDuration: 60000,
-  lockRenewTime: 15000,
+  // القفل يُجدَّد كل lockRenewTime طوال مدة الوظيفة (بما فيها الانتظار في المجدول)،
+  // فترميز لعدة ساعات آمن ما دامت حلقة الأحداث لا تتوقف. مدة أطول تتحمل
+  // ضغط الـ CPU من FFmpeg وتأخر Redis قبل أن تُعتبر الوظيفة stalled
+  lockDuration: 120000,
+  lockRenewTime: 30000,
+  stalledInterval: 60000,
+  maxStalledCount: 2,
 });
+
+worker.on("error", (err) => console.error("[Worker] Error:", err));
@@ -0,0 +1,174 @@
+// اختبار اختيار وضع الإدخال (stream / download) لرؤوس MP4 و MOV و TS و MKV
+//
+//   npm test                                   -> اختبارات detectLayout فقط
+//   AWS_ENDPOINT=http://localhost:9000 \
+//   AWS_ACCESS_KEY_ID=minioadmin AWS_SECRET_ACCESS_KEY=minioadmin \
+//   BUCKET_NAME=ingest-test S3_FORCE_PATH_STYLE=true npm test
+//                                              -> + prepareSource مقابل MinIO أو moto_server
+//
+// (moto_server: `moto_server -p 9000`، أي مفاتيح تعمل)
+import { test, before } from "node:test";
+import assert from "node:assert/strict";
+import fs from "fs";
+import os from "os";
+import path from "path";
+import {
+  S3Client,
+  CreateBucketCommand,
+  PutObjectCommand,
+} from "@aws-sdk/client-s3";
+
+const S3_ENDPOINT = process.env.AWS_ENDPOINT;
+
+// config.ts يطلب هذه المتغيرات عند الاستيراد؛ الاختبار لا يلمس Postgres ولا Redis
+process.env.DATABASE_URL ??= "postgres://unused";
+process.env.REDIS_URL ??= "redis://unused";
+process.env.AWS_ACCESS_KEY_ID ??= "test";
+process.env.AWS_SECRET_ACCESS_KEY ??= "test";
+process.env.AWS_ENDPOINT ??= "http://127.0.0.1:1";
+process.env.BUCKET_NAME ??= "ingest-test";
+process.env.S3_FORCE_PATH_STYLE ??= "true";
+process.env.INGEST_MODE = "stream";
+
+type Ingest = typeof import("../src/lib/ingest");
+let ingest: Ingest;
+
+before(async () => {
+  // بعد ضبط البيئة: الاستيراد الثابت سيُقيَّم قبل الأسطر أعلاه
+  ingest = await import("../src/lib/ingest");
+});
+
+// --- FIXTURES ---
+function box(type: string, payload: Buffer | number = 0): Buffer {
+  const body = typeof payload === "number" ? Buffer.alloc(payload) : payload;
+  const header = Buffer.alloc(8);
+  header.writeUInt32BE(8 + body.length, 0);
+  header.write(type, 4, "latin1");
+  return Buffer.concat([header, body]);
+}
+
+const FTYP_MP4 = box("ftyp", Buffer.from("isom\0\0\x02\0isomiso2avc1mp41"));
+const FTYP_MOV = box("ftyp", Buffer.from("qt  \0\0\x02\0qt  "));
+const MOOV = box("moov", box("mvhd", 100));
+const MDAT = box("mdat", 200 * 1024); // أكبر من PROBE_BYTES: moov بعده لن يُقرأ
+
+function tsFile(): Buffer {
+  const packets = Buffer.alloc(188 * 4);
+  for (let i = 0; i < 4; i++) packets[i * 188] = 0x47;
+  return packets;
+}
+
+const FILES: Record<string, { data: Buffer; layout: string; mode: string }> = {
+  "faststart.mp4": {
+    data: Buffer.concat([FTYP_MP4, MOOV, MDAT]),
+    layout: "faststart",
+    mode: "stream",
+  },
+  "moov-last.mp4": {
+    data: Buffer.concat([FTYP_MP4, MDAT, MOOV]),
+    layout: "moov-last",
+    mode: "download",
+  },
+  "ftyp-faststart.mov": {
+    data: Buffer.concat([FTYP_MOV, box("wide"), MOOV, MDAT]),
+    layout: "faststart",
+    mode: "stream",
+  },
+  // QuickTime بدون ftyp: يبدأ بـ wide ثم mdat (moov في النهاية)
+  "wide-moov-last.mov": {
+    data: Buffer.concat([box("wide"), MDAT, MOOV]),
+    layout: "moov-last",
+    mode: "download",
+  },
+  "free-moov-last.mov": {
+    data: Buffer.concat([box("free", 16), MDAT, MOOV]),
+    layout: "moov-last",
+    mode: "download",
+  },
+  "mdat-first.mov": {
+    data: Buffer.concat([MDAT, MOOV]),
+    layout: "moov-last",
+    mode: "download",
+  },
+  "moov-first.mov": {
+    data: Buffer.concat([MOOV, MDAT]),
+    layout: "faststart",
+    mode: "stream",
+  },
+  // box ضخم قبل moov/mdat: لا نعرف الترتيب من أول 64 KiB -> تنزيل
+  "big-free.mov": {
+    data: Buffer.concat([box("free", 128 * 1024), MDAT, MOOV]),
+    layout: "unknown",
+    mode: "download",
+  },
+  "stream.ts": { data: tsFile(), layout: "not-mp4", mode: "stream" },
+  "clip.mkv": {
+    data: Buffer.concat([
+      Buffer.from([0x1a, 0x45, 0xdf, 0xa3]),
+      Buffer.alloc(60),
+    ]),
+    layout: "not-mp4",
+    mode: "stream",
+  },
+};
+
+// --- detectLayout ---
+for (const [name, { data, layout }] of Object.entries(FILES)) {
+  test(`detectLayout ${name} -> ${layout}`, () => {
+    // نفس ما يقرؤه prepareSource: أول 64 KiB فقط
+    assert.equal(ingest.detectLayout(data.subarray(0, 64 * 1024)), layout);
+  });
+}
+
+test("detectLayout: too short to tell -> unknown", () => {
+  assert.equal(ingest.detectLayout(Buffer.from("ftyp")), "unknown");
+});
+
+// --- prepareSource مقابل S3 محلي ---
+test(
+  "prepareSource against MinIO / moto",
+  { skip: S3_ENDPOINT ? false : "AWS_ENDPOINT not set" },
+  async (t) => {
+    const bucket = process.env.BUCKET_NAME!;
+    const s3 = new S3Client({
+      region: process.env.AWS_REGION || "us-east-1",
+      endpoint: S3_ENDPOINT!,
+      forcePathStyle: true,
+      credentials: {
+        accessKeyId: process.env.AWS_ACCESS_KEY_ID!,
+        secretAccessKey: process.env.AWS_SECRET_ACCESS_KEY!,
+      },
+    });
+    try {
+      await s3.send(new CreateBucketCommand({ Bucket: bucket }));
+    } catch (err: any) {
+      if (!/BucketAlready/.test(err?.name ?? "")) throw err;
+    }
+
+    const dir = fs.mkdtempSync(path.join(os.tmpdir(), "ingest-test-"));
+    try {
+      for (const [name, { data, mode }] of Object.entries(FILES)) {
+        await t.test(`${name} -> ${mode}`, async () => {
+          const key = `ingest-test/${name}`;
+          await s3.send(
+            new PutObjectCommand({ Bucket: bucket, Key: key, Body: data }),
+          );
+          const local = path.join(dir, name);
+          const source = await ingest.prepareSource(key, local);
+
+          assert.equal(source.mode, mode);
+          assert.equal(source.sizeBytes, data.length);
+          if (mode === "stream") {
+            assert.match(source.input, /^https?:\/\//);
+            assert.ok(!fs.existsSync(local));
+          } else {
+            assert.equal(source.input, local);
+            assert.deepEqual(fs.readFileSync(local), data);
+          }
+        });
+      }
+    } finally {
+      fs.rmSync(dir, { recursive: true, force: true });
+    }
+  },
+);
@@ -0,0 +1,318 @@
+import os
+import sys
+import json
+import glob
+import time
+import argparse
+import shutil
+import platform
+import statistics
+import subprocess
+from datetime import datetime, timezone
+from tabulate import tabulate
+from scoring_engine import ScoringEngine
+from segment_cache import derive_key
+
+# ==============================================================================
+#  BENCH SUITE: SYNTHETIC CORPUS -> LADDER ENCODE + JUDGE -> JSON HISTORY
+# ==============================================================================
+#
+# Non-interactive replacement for new/test_optimized.sh and quality_lab_full.sh:
+#
+#   1. A fixed corpus is generated locally from ffmpeg lavfi sources (seeded, so
+#      every machine gets the same frames): slides, talking head and high motion
+#      at 480p / 720p / 1080p. Clips are generated once and reused.
+#   2. Each clip goes through backend/scripts/ladder_encoder.py and every rung is
+#      scored against the clip with the judges' ScoringEngine (VMAF/PSNR/SSIM).
+#   3. Wall time, speed x, CPU time (whole process tree) and peak RSS (largest
+#      single process of the tree, from wait4) plus bytes/kbps/VMAF per rung are
+#      appended to a JSON history.
+#   4. The run is compared with the median of the previous comparable runs
+#      (same host fingerprint, ffmpeg build and corpus); regressions are flagged and the exit
+#      code is 1 so CI can fail on them.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+LADDER_ENCODER = os.path.join(HERE, "backend", "scripts", "ladder_encoder.py")
+CORPUS_VERSION = 1   # bump when a source definition changes (old clips are regenerated)
+
+FPS = 30
+# lavfi video source per content class; {w}x{h} filled per resolution
+CONTENT_SOURCES = {
+    # test cards that change every 5 s, held in between: typical lecture slides
+    "slides": "testsrc2=s={w}x{h}:r=1/5,fps={fps}",
+    # slow-moving smooth background + temporal sensor grain: a webcam talking head
+    "talking": "gradients=s={w}x{h}:r={fps}:speed=0.008:seed=7,noise=alls=6:allf=t:all_seed=7",
+    # a full-frame cellular automaton advancing every frame: worst-case motion/entropy
+    "motion": "life=s={w}x{h}:r={fps}:seed=7:ratio=0.3:mold=8:life_color=0xe0c040:death_color=0x203080,"
+              "boxblur=1:1",
+}
+RESOLUTIONS = {"480p": (854, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+
+# Flag thresholds against the baseline: relative for cost and size, absolute VMAF points
+THRESHOLDS = {
+    "wall_s": 0.10,
+    "peak_rss_mb": 0.15,
+    "bytes": 0.03,
+    "vmaf": 0.5,
+}
+
+
+# --- MEASURED RUNS ---
+def run_measured(cmd, log_path=None):
+    """
+    Runs cmd and returns (exit code, wall s, cpu s, peak RSS MB). wait4 sums the
+    CPU time of the child's whole tree (python + the ffmpegs it waited for), but
+    its ru_maxrss is the largest single process of that tree, not their sum:
+    concurrent rung / chunk encoders together can hold more than reported.
+    """
+    log = open(log_path, "w") if log_path else subprocess.DEVNULL
+    try:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT if log_path else None)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+    finally:
+        if log_path:
+            log.close()
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, wall, usage.ru_utime + usage.ru_stime, usage.ru_maxrss / 1024
+
+
+class MeasuredRunner:
+    """ScoringEngine runner that keeps the measurements of the last command"""
+
+    def __init__(self):
+        self.last = None
+
+    def __call__(self, cmd):
+        self.last = run_measured(cmd)
+        return subprocess.CompletedProcess(cmd, self.last[0])
+
+
+# --- CORPUS ---
+def corpus_clips(contents, resolutions):
+    return [(c, r) for c in contents for r in resolutions]
+
+
+def generate_clip(corpus_dir, content, resolution, duration):
+    """Synthetic clip with a 440 Hz tone (so the ladder also muxes audio); cached on disk"""
+    w, h = RESOLUTIONS[resolution]
+    path = os.path.join(corpus_dir, f"v{CORPUS_VERSION}_{content}_{resolution}_{duration}s.mp4")
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        return path
+    os.makedirs(corpus_dir, exist_ok=True)
+    source = CONTENT_SOURCES[content].format(w=w, h=h, fps=FPS)
+    cmd = [
+        "ffmpeg", "-y", "-v", "error", "-nostdin",
+        "-f", "lavfi", "-i", f"{source},format=yuv420p",
+        "-f", "lavfi", "-i", "sine=f=440:sample_rate=48000",
+        "-t", str(duration),
+        # near-lossless mezzanine: the ladder, not the corpus, should decide the quality
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "10", "-g", str(FPS),
+        "-c:a", "aac", "-b:a", "192k", path + ".tmp.mp4",
+    ]
+    if subprocess.run(cmd).returncode != 0:
+        raise RuntimeError(f"corpus generation failed for {content} {resolution}")
+    os.replace(path + ".tmp.mp4", path)
+    return path
+
+
+def has_libvmaf():
+    result = subprocess.run(["ffmpeg", "-hide_banner", "-filters"], capture_output=True, text=True)
+    return "libvmaf" in result.stdout
+
+
+# --- ONE CLIP ---
+def rung_files(out_dir, name):
+    return sorted(glob.glob(os.path.join(out_dir, f"{name}_*.ts")) or glob.glob(os.path.join(out_dir, f"{name}.mp4")))
+
+
+def bench_clip(clip, out_dir, duration, ref_size, threads=0, judge=True, n_threads=4):
+    if os.path.exists(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+
+    cmd = [sys.executable, LADDER_ENCODER, clip, "--out", out_dir, "--content", "off", "--threads", str(threads)]
+    code, wall, cpu, rss = run_measured(cmd, os.path.join(out_dir, "encode.log"))
+    if code != 0:
+        raise RuntimeError(f"ladder encode failed ({code}), see {out_dir}/encode.log")
+    result = {
+        "encode": {"wall_s": round(wall, 3), "speed": round(duration / wall, 3) if wall else 0.0,
+                   "cpu_s": round(cpu, 2), "peak_rss_mb": round(rss, 1)},
+        "rungs": {},
+    }
+
+    names = [os.path.splitext(os.path.basename(p))[0] for p in glob.glob(os.path.join(out_dir, "*.m3u8"))]
+    rungs = {n: rung_files(out_dir, n) for n in names if n != "master"}
+    for name, files in rungs.items():
+        size = sum(os.path.getsize(f) for f in files)
+        result["rungs"][name] = {"bytes": size, "kbps": round(size * 8 / duration / 1000, 1), "vmaf": None}
+
+    if judge and rungs:
+        runner = MeasuredRunner()
+        engine = ScoringEngine(clip, out_dir, ref_size=ref_size, n_threads=n_threads, runner=runner)
+        for name, files in rungs.items():
+            engine.add(name, files, duration)
+        scores = engine.run()
+        for name in rungs:
+            if scores.get(name):
+                result["rungs"][name]["vmaf"] = round(scores[name].vmaf, 3)
+        if runner.last:
+            _, wall, cpu, rss = runner.last
+            result["judge"] = {"wall_s": round(wall, 3), "cpu_s": round(cpu, 2), "peak_rss_mb": round(rss, 1)}
+    return result
+
+
+# --- HISTORY ---
+def git_commit():
+    result = subprocess.run(["git", "-C", HERE, "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+
+def ffmpeg_build():
+    """Version + short hash of `ffmpeg -version` (libav* versions and configure line, e.g. --enable-libx264)"""
+    try:
+        out = subprocess.run(["ffmpeg", "-version"], capture_output=True, text=True).stdout
+    except OSError:
+        return "ffmpeg-none"
+    words = out.split()
+    version = words[2] if len(words) > 2 and words[:2] == ["ffmpeg", "version"] else "unknown"
+    return f"ffmpeg-{version}-{derive_key(out)[:8]}"
+
+
+def host_fingerprint(threads):
+    """Runs are only comparable on the same kind of machine, core budget and ffmpeg/x264 build"""
+    return f"{platform.machine()}-{os.cpu_count()}cpu-t{threads}-{ffmpeg_build()}"
+
+
+def load_history(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def save_history(path, history):
+    with open(path + ".tmp", "w") as f:
+        json.dump(history, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def metric_series(runs, clip_id, path):
+    """Values of one metric (path like ("rungs", "720p", "vmaf")) across runs, None-free"""
+    values = []
+    for run in runs:
+        node = run["results"].get(clip_id)
+        for key in path:
+            node = node.get(key) if isinstance(node, dict) else None
+        if isinstance(node, (int, float)):
+            values.append(node)
+    return values
+
+
+def find_regressions(run, baseline_runs):
+    """[(clip, metric, baseline, now, change)] past THRESHOLDS against the baseline median"""
+    flagged = []
+    for clip_id, res in run["results"].items():
+        checks = [(("encode", "wall_s"), "wall_s"), (("encode", "peak_rss_mb"), "peak_rss_mb")]
+        if "judge" in res:
+            checks += [(("judge", "wall_s"), "wall_s"), (("judge", "peak_rss_mb"), "peak_rss_mb")]
+        for name in res["rungs"]:
+            checks += [(("rungs", name, "bytes"), "bytes"), (("rungs", name, "vmaf"), "vmaf")]
+
+        for path, kind in checks:
+            now = metric_series([run], clip_id, path)
+            past = metric_series(baseline_runs, clip_id, path)
+            if not now or not past:
+                continue
+            now, base = now[0], statistics.median(past)
+            if kind == "vmaf":
+                if base - now > THRESHOLDS["vmaf"]:
+                    flagged.append((clip_id, ".".join(path), base, now, f"{now - base:+.2f} VMAF"))
+            elif base > 0 and (now - base) / base > THRESHOLDS[kind]:
+                flagged.append((clip_id, ".".join(path), base, now, f"{100 * (now - base) / base:+.1f}%"))
+    return flagged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproducible ladder encoder / judge benchmark on a synthetic corpus")
+    parser.add_argument("--contents", default=",".join(CONTENT_SOURCES), help="Comma separated content classes")
+    parser.add_argument("--resolutions", default=",".join(RESOLUTIONS), help="Comma separated source resolutions")
+    parser.add_argument("--duration", type=int, default=20, help="Seconds per corpus clip")
+    parser.add_argument("--threads", type=int, default=0, help="ladder_encoder --threads (0 = all cores)")
+    parser.add_argument("--corpus-dir", default="bench_corpus", help="Where generated clips are kept")
+    parser.add_argument("--work-dir", default="bench_runs", help="Encode outputs of this run")
+    parser.add_argument("--history", default="bench_history.json", help="JSON history of every run")
+    parser.add_argument("--baseline", type=int, default=3, help="Previous comparable runs in the baseline median")
+    parser.add_argument("--label", default="", help="Free-form note stored with the run")
+    parser.add_argument("--no-judge", action="store_true", help="Skip VMAF scoring")
+    parser.add_argument("--no-record", action="store_true", help="Compare only; don't append to the history")
+    args = parser.parse_args()
+
+    contents = [c.strip() for c in args.contents.split(",") if c.strip()]
+    resolutions = [r.strip() for r in args.resolutions.split(",") if r.strip()]
+    unknown = [c for c in contents if c not in CONTENT_SOURCES] + [r for r in resolutions if r not in RESOLUTIONS]
+    if unknown:
+        print(f"❌ Unknown content/resolution: {', '.join(unknown)}")
+        sys.exit(2)
+
+    judge = not args.no_judge
+    if judge and not has_libvmaf():
+        print("⚠️ ffmpeg has no libvmaf: recording encode cost and sizes only")
+        judge = False
+
+    run = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "label": args.label,
+        "host": host_fingerprint(args.threads),
+        "corpus": f"v{CORPUS_VERSION}-{args.duration}s",
+        "judge": judge,
+        "results": {},
+    }
+
+    print(f"🚀 Bench: {len(contents)} contents x {len(resolutions)} resolutions, {args.duration}s clips")
+    for content, resolution in corpus_clips(contents, resolutions):
+        clip_id = f"{content}_{resolution}"
+        clip = generate_clip(args.corpus_dir, content, resolution, args.duration)
+        print(f"   🎬 {clip_id}...")
+        run["results"][clip_id] = bench_clip(clip, os.path.join(args.work_dir, clip_id), args.duration,
+                                             RESOLUTIONS[resolution], threads=args.threads, judge=judge)
+
+    history = load_history(args.history)
+    comparable = [r for r in history if r["host"] == run["host"] and r["corpus"] == run["corpus"]]
+    baseline = comparable[-args.baseline:] if args.baseline > 0 else []
+    flagged = find_regressions(run, baseline)
+
+    rows = []
+    for clip_id, res in run["results"].items():
+        enc = res["encode"]
+        for name, rung in res["rungs"].items():
+            rows.append([clip_id, name, f"{enc['wall_s']:.1f}", f"{enc['speed']:.2f}x", f"{enc['peak_rss_mb']:.0f}",
+                         f"{rung['kbps']:.0f}", f"{rung['vmaf']:.2f}" if rung["vmaf"] is not None else "N/A",
+                         f"{res['judge']['wall_s']:.1f}" if "judge" in res else "-"])
+    print("\n" + "=" * 90)
+    print(f"BENCH RESULTS ({run['host']}, commit {run['commit'] or 'unknown'})")
+    print("=" * 90)
+    print(tabulate(rows, headers=["Clip", "Rung", "Enc s", "Speed", "RSS MB", "kbps", "VMAF", "Judge s"],
+                   tablefmt="grid"))
+
+    if not baseline:
+        print("\nℹ️ No comparable previous run: this run becomes the baseline.")
+    elif flagged:
+        print(f"\n🚨 {len(flagged)} regression(s) against the median of {len(baseline)} previous run(s):")
+        print(tabulate([[c, m, f"{b:g}", f"{n:g}", d] for c, m, b, n, d in flagged],
+                       headers=["Clip", "Metric", "Baseline", "Now", "Change"], tablefmt="simple"))
+    else:
+        print(f"\n✅ No regressions against the median of {len(baseline)} previous run(s).")
+
+    if not args.no_record:
+        run["regressions"] = len(flagged)
+        save_history(args.history, history + [run])
+        print(f"📝 Recorded in {args.history}")
+    sys.exit(1 if flagged else 0)
+
+
+if __name__ == "__main__":
+    main()
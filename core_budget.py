@@ -0,0 +1,61 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# ==============================================================================
+#  CORE BUDGET: PARALLEL RENDITION JOBS WITHOUT OVERSUBSCRIBING THE MACHINE
+# ==============================================================================
+
+# libvmaf stops scaling well past ~4 threads per instance, so by default we
+# prefer more concurrent comparisons over fatter ones.
+VMAF_THREADS_SWEET_SPOT = 4
+
+
+def available_cpus():
+    """Cores this process may actually use (respects taskset/cgroup affinity)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class CoreBudget:
+    """
+    Splits a CPU budget into `jobs` concurrent ffmpeg processes x `threads` each.
+
+    budget = CoreBudget(cpus=6)            # Fly performance-6x
+    jobs, threads = budget.plan(n_tasks=3)  # -> (1, 6) ... (3, 2) depending on the budget
+    """
+
+    def __init__(self, cpus=None, jobs=None):
+        self.cpus = max(1, min(cpus or available_cpus(), available_cpus()))
+        self.jobs = jobs
+
+    def plan(self, n_tasks):
+        if n_tasks <= 0:
+            return 1, self.cpus
+        jobs = self.jobs or max(1, self.cpus // VMAF_THREADS_SWEET_SPOT)
+        jobs = max(1, min(jobs, n_tasks, self.cpus))
+        return jobs, max(1, self.cpus // jobs)
+
+    def threads_for(self, parallel_streams):
+        """Per-libvmaf threads when one ffmpeg runs several metric branches at once"""
+        return max(1, self.cpus // max(1, parallel_streams))
+
+    def map(self, fn, tasks):
+        """
+        Runs fn over tasks in a process pool sized by plan(); results keep task order.
+        fn must be a module-level function (picklable). With a single job everything
+        stays in-process, which keeps tracebacks readable.
+        """
+        jobs, _ = self.plan(len(tasks))
+        if jobs == 1:
+            return [fn(t) for t in tasks]
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(fn, tasks))
+
+
+def add_budget_args(parser):
+    parser.add_argument("--cpus", type=int, default=None,
+                        help="CPU cores this run may use (default: all available)")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Concurrent rendition comparisons (default: derived from --cpus)")
@@ -0,0 +1,401 @@
+import os
+import re
+import sys
+import csv
+import json
+import math
+import time
+import shlex
+import shutil
+import sqlite3
+import argparse
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+from tabulate import tabulate
+from segment_cache import derive_key
+from core_budget import CoreBudget
+
+# ==============================================================================
+#  FLEET JUDGE: ULTIMATE JUDGE OVER A CATALOGUE, RESUMABLE, ONE AGGREGATE REPORT
+# ==============================================================================
+#
+# ultimate_judge.py compares one original / Mux / local triple and wipes its
+# work dir on start. Here a manifest of many titles (CSV with a header, or
+# JSONL; columns id, original, mux_master, local_master, id optional) is run
+# with --titles judges at once, each in its own process, work dir and log:
+#
+#   fleet_lab/<id>/        scratch of the title (removed once it is done)
+#   fleet_lab/<id>.log     the judge's full output
+#   fleet_lab/<id>.json    its per-rendition results (--json)
+#
+# Every state change is committed to a SQLite checkpoint (--db), so a crashed
+# or interrupted run picks up where it stopped: done titles are skipped, titles
+# that were running go back to pending. A title is re-run when its manifest
+# entry or the judge options change. The heavy artifacts (segments, decoded
+# references, metric logs) live in the SegmentCache, so a re-run is cheap.
+#
+# The report aggregates every done title in the checkpoint: BD-rate of local
+# vs Mux (bitrate change at equal VMAF), mean VMAF delta and efficiency per rung.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ULTIMATE_JUDGE = os.path.join(HERE, "ultimate_judge.py")
+MANIFEST_FIELDS = ("original", "mux_master", "local_master")
+TIE_MARGIN = 0.5   # VMAF points, as in ultimate_judge's verdict
+LOG_TAIL = 5       # log lines kept as the error of a failed title
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS titles (
+    id TEXT PRIMARY KEY,
+    original TEXT NOT NULL,
+    mux_master TEXT NOT NULL,
+    local_master TEXT NOT NULL,
+    options TEXT NOT NULL DEFAULT '',
+    state TEXT NOT NULL DEFAULT 'pending',   -- pending | running | done | failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started REAL,
+    finished REAL,
+    error TEXT,
+    result TEXT
+)
+"""
+
+
+# --- MANIFEST ---
+def read_manifest(path):
+    """[{id, original, mux_master, local_master}] from a CSV (header row) or JSONL manifest"""
+    with open(path, newline="") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+
+    titles, seen = [], set()
+    for n, row in enumerate(rows, 1):
+        missing = [k for k in MANIFEST_FIELDS if not row.get(k)]
+        if missing:
+            raise ValueError(f"{path}: entry {n} has no {', '.join(missing)}")
+        title_id = str(row.get("id") or derive_key(*(row[k] for k in MANIFEST_FIELDS))[:12])
+        if title_id in seen:
+            raise ValueError(f"{path}: duplicate id {title_id!r}")
+        seen.add(title_id)
+        titles.append({"id": title_id, **{k: row[k] for k in MANIFEST_FIELDS}})
+    return titles
+
+
+# --- CHECKPOINT ---
+class JobStore:
+    """Per-title state in SQLite; every change is committed at once (the checkpoint)"""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute(SCHEMA)
+        self.db.commit()
+
+    def sync(self, titles, options):
+        """Adds new titles; resets titles whose inputs or judge options changed"""
+        for t in titles:
+            self.db.execute(
+                """INSERT INTO titles (id, original, mux_master, local_master, options) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(id) DO UPDATE SET
+                       state = CASE WHEN (original, mux_master, local_master, options)
+                                         IS NOT (excluded.original, excluded.mux_master, excluded.local_master,
+                                                 excluded.options)
+                                    THEN 'pending' ELSE state END,
+                       original = excluded.original, mux_master = excluded.mux_master,
+                       local_master = excluded.local_master, options = excluded.options""",
+                (t["id"], t["original"], t["mux_master"], t["local_master"], options))
+        self.db.commit()
+
+    def recover(self):
+        """Titles left 'running' by a crashed or interrupted run go back to pending"""
+        n = self.db.execute("UPDATE titles SET state = 'pending' WHERE state = 'running'").rowcount
+        self.db.commit()
+        return n
+
+    def pending(self, ids, retry_failed=False):
+        states = ("pending", "failed") if retry_failed else ("pending",)
+        rows = self.db.execute(f"SELECT * FROM titles WHERE state IN ({','.join('?' * len(states))})", states)
+        by_id = {r["id"]: dict(r) for r in rows}
+        return [by_id[i] for i in ids if i in by_id]   # manifest order
+
+    def start(self, title_id):
+        self.db.execute("UPDATE titles SET state = 'running', attempts = attempts + 1, started = ?, error = NULL "
+                        "WHERE id = ?", (time.time(), title_id))
+        self.db.commit()
+
+    def finish(self, title_id, result):
+        self.db.execute("UPDATE titles SET state = 'done', finished = ?, result = ? WHERE id = ?",
+                        (time.time(), json.dumps(result), title_id))
+        self.db.commit()
+
+    def fail(self, title_id, error):
+        self.db.execute("UPDATE titles SET state = 'failed', finished = ?, error = ? WHERE id = ?",
+                        (time.time(), error, title_id))
+        self.db.commit()
+
+    def rows(self, ids=None, state=None):
+        rows = [dict(r) for r in self.db.execute("SELECT * FROM titles ORDER BY id")]
+        if ids is not None:
+            rows = [r for r in rows if r["id"] in ids]
+        return [r for r in rows if state is None or r["state"] == state]
+
+
+# --- ONE TITLE (runs in a worker thread; the judge itself is a separate process) ---
+def safe_name(title_id):
+    return re.sub(r"[^\w.-]", "_", title_id)
+
+
+def run_title(title, work_root, cpus, judge_opts, keep_work=False):
+    name = safe_name(title["id"])
+    work_dir = os.path.join(work_root, name)
+    out_json = os.path.join(work_root, f"{name}.json")
+    log_path = os.path.join(work_root, f"{name}.log")
+    if os.path.exists(out_json):
+        os.remove(out_json)   # never read a previous attempt's results
+
+    cmd = [sys.executable, ULTIMATE_JUDGE, title["original"], title["mux_master"], title["local_master"],
+           "--work-dir", work_dir, "--json", out_json, "--cpus", str(cpus), *judge_opts]
+    with open(log_path, "w") as log:
+        returncode = subprocess.run(cmd, stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL).returncode
+
+    if returncode != 0 or not os.path.exists(out_json):
+        with open(log_path, errors="replace") as log:
+            tail = " | ".join(line.strip() for line in log.readlines()[-LOG_TAIL:] if line.strip())
+        raise RuntimeError(f"judge exited {returncode}: {tail}")
+    with open(out_json) as f:
+        result = json.load(f)
+    if not keep_work:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return result
+
+
+def run_fleet(store, titles, work_root, budget, n_titles, judge_opts, keep_work=False):
+    """Runs the titles with at most n_titles judges at once; returns (done, failed) counts"""
+    os.makedirs(work_root, exist_ok=True)
+    cpus = max(1, budget.cpus // n_titles)
+    queue, running, done, failed = list(titles), {}, 0, 0
+    with ThreadPoolExecutor(max_workers=n_titles) as pool:
+        while queue or running:
+            while queue and len(running) < n_titles:
+                title = queue.pop(0)
+                store.start(title["id"])
+                running[pool.submit(run_title, title, work_root, cpus, judge_opts, keep_work)] = title
+                print(f"▶️  {title['id']} started ({cpus} CPUs)")
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                title = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    store.fail(title["id"], str(e))
+                    failed += 1
+                    print(f"❌ {title['id']} failed: {str(e)[:160]}")
+                    continue
+                store.finish(title["id"], result)
+                done += 1
+                print(f"✅ {title['id']} done ({len(result['renditions'])} renditions) "
+                      f"[{len(queue) + len(running)} left]")
+    return done, failed
+
+
+# --- AGGREGATE ---
+def bd_rate(anchor, test):
+    """
+    Bjøntegaard delta rate of `test` vs `anchor`, both [(kbps, vmaf)]: the average
+    bitrate change (%) at equal VMAF over the overlapping VMAF range. Negative =
+    test needs fewer bits. log-rate is fitted as a polynomial of VMAF (cubic when
+    there are 4+ rungs, lower with fewer). None without 2 points each or overlap.
+    """
+    anchor = sorted((q, math.log(r)) for r, q in anchor if r > 0)
+    test = sorted((q, math.log(r)) for r, q in test if r > 0)
+    degree = min(3, len(anchor) - 1, len(test) - 1)
+    if degree < 1:
+        return None
+    lo = max(anchor[0][0], test[0][0])
+    hi = min(anchor[-1][0], test[-1][0])
+    if hi <= lo:
+        return None
+
+    def mean_log_rate(points):
+        q, lr = zip(*points)
+        integral = np.polyint(np.polyfit(q, lr, degree))
+        return (np.polyval(integral, hi) - np.polyval(integral, lo)) / (hi - lo)
+
+    return (math.exp(mean_log_rate(test) - mean_log_rate(anchor)) - 1) * 100
+
+
+def rung_label(res):
+    """Rungs grouped by width (the ladder fixes the width, the height follows the aspect ratio)"""
+    w, _, h = res.partition("x")
+    return f"{round(int(w) * 9 / 16)}p" if w.isdigit() and h.isdigit() else res
+
+
+def scored(r):
+    """The judge writes null VMAF for a side whose metrics failed; such a rendition has no point"""
+    return r["vmaf"]["mux"] is not None and r["vmaf"]["local"] is not None
+
+
+def _points(renditions, side):
+    return [(r["bitrate_kbps"][side], r["vmaf"][side]) for r in renditions if scored(r)]
+
+
+def aggregate(rows):
+    """Catalogue-level report from the done titles of the checkpoint"""
+    rungs, per_title = {}, []
+    for row in rows:
+        judged = json.loads(row["result"])["renditions"]
+        renditions = [r for r in judged if scored(r)]
+        for r in renditions:
+            rungs.setdefault(rung_label(r["res"]), []).append(r)
+        per_title.append({
+            "id": row["id"],
+            "renditions": len(renditions),
+            "unscored": [r["res"] for r in judged if not scored(r)],
+            "bd_rate": bd_rate(_points(renditions, "mux"), _points(renditions, "local")),
+            "vmaf_delta": statistics.fmean(r["vmaf"]["local"] - r["vmaf"]["mux"] for r in renditions)
+            if renditions else None,
+        })
+
+    by_rung = {}
+    for label, rs in rungs.items():
+        deltas = [r["vmaf"]["local"] - r["vmaf"]["mux"] for r in rs]
+        mean = lambda key, side: statistics.fmean(r[key][side] for r in rs)
+        by_rung[label] = {
+            "titles": len(rs),
+            "kbps": {side: mean("bitrate_kbps", side) for side in ("mux", "local")},
+            "vmaf": {side: mean("vmaf", side) for side in ("mux", "local")},
+            "vmaf_delta": statistics.fmean(deltas),
+            "vmaf_delta_min": min(deltas),
+            "efficiency": {side: mean("efficiency", side) for side in ("mux", "local")},
+            "local_wins": sum(d > TIE_MARGIN for d in deltas),
+            "ties": sum(abs(d) <= TIE_MARGIN for d in deltas),
+            "mux_wins": sum(d < -TIE_MARGIN for d in deltas),
+        }
+
+    bds = [t["bd_rate"] for t in per_title if t["bd_rate"] is not None]
+    # Catalogue curve: the mean bitrate / VMAF of every rung, one BD-rate for the whole fleet
+    catalogue = bd_rate([(r["kbps"]["mux"], r["vmaf"]["mux"]) for r in by_rung.values()],
+                        [(r["kbps"]["local"], r["vmaf"]["local"]) for r in by_rung.values()])
+    return {
+        "titles": len(rows),
+        "bd_rate": {
+            "catalogue": catalogue,
+            "titles": len(bds),
+            "mean": statistics.fmean(bds) if bds else None,
+            "median": statistics.median(bds) if bds else None,
+            "best": min(bds) if bds else None,
+            "worst": max(bds) if bds else None,
+        },
+        "vmaf_delta": statistics.fmean(t["vmaf_delta"] for t in per_title if t["vmaf_delta"] is not None)
+        if per_title else None,
+        "rungs": by_rung,
+        "per_title": per_title,
+    }
+
+
+def _pct(value):
+    return f"{value:+.1f} %" if value is not None else "N/A"
+
+
+def print_report(report, failed_rows):
+    def height(label):
+        return int(label[:-1]) if label[:-1].isdigit() else 0
+
+    rows = []
+    for label in sorted(report["rungs"], key=height, reverse=True):
+        r = report["rungs"][label]
+        rows.append([
+            label, r["titles"],
+            f"{r['kbps']['mux']:.0f} / {r['kbps']['local']:.0f} k",
+            f"{r['vmaf']['mux']:.1f} / {r['vmaf']['local']:.1f}",
+            f"{r['vmaf_delta']:+.2f} (min {r['vmaf_delta_min']:+.1f})",
+            f"{r['efficiency']['mux']:.1f} / {r['efficiency']['local']:.1f}",
+            f"{r['local_wins']} / {r['ties']} / {r['mux_wins']}",
+        ])
+
+    bd = report["bd_rate"]
+    print("\n" + "=" * 110)
+    print(f"                         FLEET REPORT: {report['titles']} title(s)   Format: (Mux / Local)")
+    print("=" * 110)
+    print(tabulate(rows, headers=["Rung", "Titles", "Mean Bitrate", "Mean VMAF", "VMAF Δ (Local-Mux)",
+                                  "Efficiency (VMAF/MB)", "Local / Tie / Mux"], tablefmt="grid"))
+    print(f"\n📉 BD-rate Local vs Mux (same VMAF): catalogue {_pct(bd['catalogue'])} | per title over {bd['titles']}: "
+          f"mean {_pct(bd['mean'])}, median {_pct(bd['median'])}, best {_pct(bd['best'])}, worst {_pct(bd['worst'])}")
+    if report["vmaf_delta"] is not None:
+        print(f"🎯 Mean VMAF delta (Local - Mux): {report['vmaf_delta']:+.2f}")
+
+    ranked = sorted((t for t in report["per_title"] if t["bd_rate"] is not None), key=lambda t: t["bd_rate"])
+    if len(ranked) > 1:
+        print("\nTITLES WHERE LOCAL COSTS THE MOST BITS (candidates for per-title tuning):")
+        print(tabulate([[t["id"], t["renditions"], _pct(t["bd_rate"]), f"{t['vmaf_delta']:+.2f}"]
+                        for t in reversed(ranked[-5:])],
+                       headers=["Title", "Rungs", "BD-rate", "VMAF Δ"], tablefmt="simple", disable_numparse=True))
+    unscored = [t for t in report["per_title"] if t["unscored"]]
+    if unscored:
+        print(f"\n⚠️  {len(unscored)} title(s) with renditions left out (metrics failed, see the title logs):")
+        for t in unscored[:20]:
+            print(f"   {t['id']}: {', '.join(t['unscored'])}")
+    if failed_rows:
+        print(f"\n❌ {len(failed_rows)} failed title(s) (logs next to the work dirs, --retry-failed to run again):")
+        for row in failed_rows[:20]:
+            print(f"   {row['id']} (attempt {row['attempts']}): {(row['error'] or '')[:140]}")
+    print("\n* BD-rate: bitrate change of Local for the same VMAF; negative means Local saves bits.")
+    print("* Efficiency: VMAF per MB of the compared span, averaged over the titles of the rung.")
+    print("=" * 110)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fleet Judge: ultimate_judge over a catalogue manifest")
+    parser.add_argument("manifest", help="CSV (header: id,original,mux_master,local_master) or JSONL manifest")
+    parser.add_argument("--db", default="fleet_state.sqlite", help="SQLite checkpoint of per-title progress")
+    parser.add_argument("--work-root", default="fleet_lab", help="Per-title work dirs, logs and results")
+    parser.add_argument("--titles", type=int, default=2, help="Titles judged at once")
+    parser.add_argument("--cpus", type=int, default=None, help="CPU cores for the whole fleet (split per title)")
+    parser.add_argument("--judge-args", default="",
+                        help="Extra ultimate_judge options for every title, e.g. \"--stream --sample 8\"")
+    parser.add_argument("--retry-failed", action="store_true", help="Run failed titles again")
+    parser.add_argument("--report-only", action="store_true", help="Don't run anything, report the checkpoint")
+    parser.add_argument("--report", metavar="PATH", help="Also write the aggregate report as JSON")
+    parser.add_argument("--keep-work", action="store_true", help="Keep the work dir of finished titles")
+    args = parser.parse_args()
+
+    try:
+        titles = read_manifest(args.manifest)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(2)
+    judge_opts = shlex.split(args.judge_args)
+    store = JobStore(args.db)
+    ids = [t["id"] for t in titles]
+
+    if not args.report_only:
+        store.sync(titles, " ".join(judge_opts))
+        recovered = store.recover()
+        if recovered:
+            print(f"♻️  {recovered} interrupted title(s) back to pending")
+        todo = store.pending(ids, args.retry_failed)
+        n_titles = max(1, args.titles)
+        budget = CoreBudget(cpus=args.cpus)
+        print(f"🚚 Fleet: {len(titles)} title(s) in the manifest, {len(titles) - len(todo)} already settled, "
+              f"{len(todo)} to judge ({n_titles} at once on {budget.cpus} CPUs)")
+        run_fleet(store, todo, args.work_root, budget, n_titles, judge_opts, args.keep_work)
+
+    done = store.rows(set(ids), "done")
+    failed = store.rows(set(ids), "failed")
+    if not done:
+        print("❌ No finished title to report.")
+        sys.exit(1)
+    report = aggregate(done)
+    print_report(report, failed)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({**report, "failed": [{"id": r["id"], "error": r["error"]} for r in failed]}, f, indent=2)
+        print(f"📝 Report written to {args.report}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import numpy as np
+
+# ==============================================================================
+#  FRAME METRICS: PER-FRAME VMAF/SSIM/PSNR TIME SERIES (NUMPY)
+# ==============================================================================
+
+# libvmaf CSV column -> short name used across the tools
+COLUMNS = {"vmaf": "vmaf", "psnr_y": "psnr", "float_ssim": "ssim"}
+
+
+class FrameMetrics:
+    """
+    Per-frame metric arrays loaded from a libvmaf CSV log.
+    CSV goes straight into float arrays with np.loadtxt, so an hour-long log never
+    becomes millions of Python dicts the way json.load on the JSON log does.
+    """
+
+    def __init__(self, series, duration):
+        self.series = series          # short name -> float64 array (one value per frame)
+        self.duration = duration      # seconds covered by the log
+        self.n_frames = len(next(iter(series.values()))) if series else 0
+
+    @classmethod
+    def load_csv(cls, path, duration):
+        with open(path) as f:
+            header = f.readline().strip().split(",")
+        wanted = [(i, COLUMNS[name]) for i, name in enumerate(header) if name in COLUMNS]
+        if not wanted:
+            return cls({}, duration)
+        data = np.loadtxt(path, delimiter=",", skiprows=1, usecols=[i for i, _ in wanted], ndmin=2)
+        return cls({name: data[:, k] for k, (_, name) in enumerate(wanted)}, duration)
+
+    @property
+    def frame_time(self):
+        """Seconds per frame (frame rate recovered from the scored duration)"""
+        return self.duration / self.n_frames if self.n_frames else 0.0
+
+    # --- POOLING ---
+    def pooled(self, metric):
+        x = self.series.get(metric)
+        if x is None or not len(x):
+            return {"mean": 0.0, "harmonic": 0.0, "p1": 0.0, "p5": 0.0, "min": 0.0}
+        p1, p5 = np.percentile(x, [1, 5])
+        return {
+            "mean": float(x.mean()),
+            # Netflix-style harmonic mean (+1 offset keeps zero-score frames finite)
+            "harmonic": float(len(x) / np.sum(1.0 / (x + 1.0)) - 1.0),
+            "p1": float(p1),
+            "p5": float(p5),
+            "min": float(x.min()),
+        }
+
+    def rolling_mean(self, metric, window_sec):
+        """Mean over every window of window_sec (cumsum, O(n)); index i = window starting at frame i"""
+        x = self.series.get(metric)
+        if x is None or not len(x):
+            return np.empty(0)
+        w = max(1, min(len(x), int(round(window_sec / self.frame_time)) if self.frame_time else 1))
+        c = np.concatenate(([0.0], np.cumsum(x)))
+        return (c[w:] - c[:-w]) / w
+
+    # --- LOCALISATION ---
+    def worst_windows(self, metric, window_sec, count=3, segment_durations=None):
+        """
+        The `count` lowest-scoring, non-overlapping windows of window_sec,
+        with their timestamps and the playlist segments they fall in.
+        """
+        means = self.rolling_mean(metric, window_sec)
+        if not len(means):
+            return []
+        w = self.n_frames - len(means) + 1
+        bounds = np.cumsum([0.0] + list(segment_durations)) if segment_durations else None
+
+        picked = []
+        taken = np.zeros(len(means), dtype=bool)
+        for start in np.argsort(means, kind="stable"):
+            if taken[start]:
+                continue
+            taken[max(0, start - w + 1):start + w] = True
+            t0 = start * self.frame_time
+            t1 = (start + w) * self.frame_time
+            window = {"start": float(t0), "end": float(t1), "mean": float(means[start])}
+            if bounds is not None:
+                first, last = np.searchsorted(bounds, [t0, t1 - 1e-6], side="right") - 1
+                window["segments"] = list(range(int(first), int(min(last, len(bounds) - 2)) + 1))
+            picked.append(window)
+            if len(picked) == count:
+                break
+        return picked
@@ -0,0 +1,125 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from probe_service import ProbeService
+
+# ==============================================================================
+#  GOP FORENSICS: PACKET-LEVEL KEYFRAME / GOP ANALYSIS (NO FRAME DECODE)
+# ==============================================================================
+#
+# ffprobe -show_packets only demuxes (+ runs the bitstream parser), so a whole
+# segment is read in milliseconds instead of decoding frames like -show_frames.
+#
+# Frame types come from the packet layout:
+#   * keyframe flag (K) -> I (IDR / recovery point)
+#   * non-key packet whose PTS is earlier than a packet already seen in decode
+#     order -> B (it is displayed before a frame decoded ahead of it)
+#   * anything else -> P
+#
+# The packet lists come from ProbeService, so a segment seen before (same
+# path, size and mtime) is not probed again, in this run or a later one.
+
+def probe_packets(path, probes=None):
+    """Video packets of a file in decode order: list of (pts, dts, is_key, size)"""
+    probes = probes or ProbeService(persist=False)
+    packets = []
+    for line in probes.video_packets(path).splitlines():
+        parts = line.split(",")
+        if len(parts) < 4:
+            continue
+        pts_s, dts_s, size_s, flags = parts[0], parts[1], parts[2], parts[3]
+        try:
+            pts = float(pts_s) if pts_s not in ("", "N/A") else None
+            dts = float(dts_s) if dts_s not in ("", "N/A") else pts
+            packets.append((pts if pts is not None else dts, dts, "K" in flags, int(size_s)))
+        except ValueError:
+            continue
+    return packets
+
+
+def classify(packets):
+    """I/P/B label per packet (decode order) from keyframe flags + PTS reordering"""
+    types = []
+    max_pts = float("-inf")
+    for pts, _, key, _ in packets:
+        if key:
+            types.append("I")
+        elif pts is not None and pts < max_pts:
+            types.append("B")
+        else:
+            types.append("P")
+        if pts is not None:
+            max_pts = max(max_pts, pts)
+    return types
+
+
+def segment_gop(path, probes=None):
+    """Keyframe positions, GOP intervals and frame mix of one segment"""
+    packets = probe_packets(path, probes)
+    if not packets:
+        return {"path": path, "packets": 0, "starts_on_idr": False, "keyframes": [],
+                "intervals": [], "I": 0, "P": 0, "B": 0, "duration": 0.0, "bytes": 0}
+
+    types = classify(packets)
+    key_pts = sorted(p[0] for p in packets if p[2] and p[0] is not None)
+    all_pts = [p[0] for p in packets if p[0] is not None]
+    counts = Counter(types)
+    return {
+        "path": path,
+        "packets": len(packets),
+        "starts_on_idr": packets[0][2],
+        "keyframes": key_pts,
+        "intervals": [b - a for a, b in zip(key_pts, key_pts[1:])],
+        "I": counts["I"], "P": counts["P"], "B": counts["B"],
+        "duration": (max(all_pts) - min(all_pts)) if all_pts else 0.0,
+        "bytes": sum(p[3] for p in packets),
+    }
+
+
+def analyze_segments(paths, max_workers=8, probes=None):
+    """Runs segment_gop over every segment of a rendition in parallel (one ffprobe per unseen segment)"""
+    if not paths:
+        return []
+    probes = probes or ProbeService(persist=False)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return list(pool.map(lambda p: segment_gop(p, probes), paths))
+
+
+def contiguous_runs(results, indexes=None):
+    """Splits results into runs of playlist-adjacent segments (indexes: playlist position of each)"""
+    indexes = range(len(results)) if indexes is None else indexes
+    runs, prev = [], None
+    for i, r in sorted(zip(indexes, results), key=lambda ir: ir[0]):
+        if prev is None or i != prev + 1:
+            runs.append([])
+        runs[-1].append(r)
+        prev = i
+    return runs
+
+
+def summarize(results, indexes=None):
+    """
+    Rendition-level view: keyframe interval distribution across segment boundaries
+    too (keyframes of consecutive segments are stitched on a common timeline).
+    indexes: playlist position of each result; intervals are only taken inside runs of
+    adjacent segments, so the gap between sampled windows or around a failed fetch is
+    never counted as a GOP.
+    """
+    intervals = []
+    for run in contiguous_runs(results, indexes):
+        keyframes = sorted(t for r in run for t in r["keyframes"])
+        intervals += [round(b - a, 2) for a, b in zip(keyframes, keyframes[1:]) if b > a]
+    total = Counter()
+    for r in results:
+        total.update({"I": r["I"], "P": r["P"], "B": r["B"]})
+    frames = sum(total.values()) or 1
+    idr_starts = sum(1 for r in results if r["starts_on_idr"])
+    return {
+        "segments": len(results),
+        "idr_start_pct": 100.0 * idr_starts / len(results) if results else 0.0,
+        "keyint_min": min(intervals) if intervals else 0.0,
+        "keyint_max": max(intervals) if intervals else 0.0,
+        "keyint_mean": sum(intervals) / len(intervals) if intervals else 0.0,
+        "keyint_hist": dict(sorted(Counter(intervals).items())),
+        "gop_str": f"I={total['I']},P={total['P']},B={total['B']}",
+        "b_pct": 100.0 * total["B"] / frames,
+    }
@@ -0,0 +1,314 @@
+import os
+import sys
+import json
+import asyncio
+import argparse
+import aiohttp
+import m3u8
+from tabulate import tabulate
+from segment_fetcher import segment_refs, resolve_uri, RETRY_STATUS
+
+# ==============================================================================
+#  HLS VALIDATOR: ASYNC CRAWL OF WHOLE PUBLISHED ASSETS
+# ==============================================================================
+#
+# analyze_mux walks one variant at a time and stops at 12 segments. Here every
+# variant playlist of a master is loaded concurrently and every segment (and
+# EXT-X-MAP init) is sized with a HEAD request (or a 1-byte range GET when the
+# origin does not answer HEAD), so nothing is downloaded. Checks per asset:
+#
+#   sizes       every object exists, is non-empty and holds its EXT-X-BYTERANGE
+#   duration    round(EXTINF) <= EXT-X-TARGETDURATION (RFC 8216 4.3.3.1)
+#   sequence    EXT-X-MEDIA-SEQUENCE / discontinuities / segment count and
+#               durations aligned across variants (switching needs it)
+#   bandwidth   measured peak segment bitrate <= BANDWIDTH, measured average
+#               close to AVERAGE-BANDWIDTH
+#
+# One aiohttp session (one connection pool, capped by --connections) is shared
+# by all assets; --assets bounds how many masters are crawled at once. Reports
+# are appended to --report as JSON lines while the run goes, so an overnight
+# batch can be inspected (or killed) at any point.
+
+DEFAULT_CONNECTIONS = 64
+DEFAULT_ASSETS = 8
+BANDWIDTH_TOLERANCE = 0.10   # measured peak may exceed BANDWIDTH by this much before it is an error
+ALIGN_TOLERANCE = 0.5        # seconds two variants' segment N may differ by
+RETRIES = 3
+
+
+class HLSValidator:
+    """
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=64)) as session:
+        report = await HLSValidator(session).validate("https://.../master.m3u8")
+    """
+
+    def __init__(self, session, tolerance=BANDWIDTH_TOLERANCE, retries=RETRIES):
+        self.session = session
+        self.tolerance = tolerance
+        self.retries = retries
+        self.requests = 0
+
+    # --- HTTP ---
+    async def _request(self, method, url, headers=None, read=False):
+        """(status, headers, text or None); retries 429/5xx and connection errors with backoff"""
+        for attempt in range(self.retries + 1):
+            try:
+                self.requests += 1
+                async with self.session.request(method, url, headers=headers) as r:
+                    if r.status in RETRY_STATUS and attempt < self.retries:
+                        await asyncio.sleep(0.5 * 2 ** attempt)
+                        continue
+                    body = await r.text() if read and r.status == 200 else None
+                    return r.status, r.headers, body
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(0.5 * 2 ** attempt)
+
+    async def load(self, url):
+        status, _, body = await self._request("GET", url, read=True)
+        if status != 200:
+            raise RuntimeError(f"HTTP {status} for {url}")
+        return m3u8.loads(body, uri=url)
+
+    async def object_size(self, url):
+        """(size in bytes or None, HTTP status) without downloading the body"""
+        status, headers, _ = await self._request("HEAD", url)
+        if status == 200 and headers.get("Content-Length"):
+            return int(headers["Content-Length"]), status
+        if status == 404:
+            return None, status
+        # HEAD refused or without a length (some CDNs): ask for one byte, read the total from Content-Range
+        status, headers, _ = await self._request("GET", url, headers={"Range": "bytes=0-0"})
+        total = headers.get("Content-Range", "").rpartition("/")[2]
+        if status == 206 and total.isdigit():
+            return int(total), status
+        if status == 200 and headers.get("Content-Length"):
+            return int(headers["Content-Length"]), status
+        return None, status
+
+    # --- VARIANT ---
+    async def validate_variant(self, url, stream_info=None):
+        playlist = await self.load(url)
+        refs = segment_refs(playlist, url)
+        objects = sorted({uri for uri, _, _ in refs} | {init[0] for _, _, init in refs if init})
+        sizes = dict(zip(objects, await asyncio.gather(*(self.object_size(u) for u in objects))))
+        errors, warnings = [], []
+
+        for uri, (size, status) in sizes.items():
+            if size is None:
+                errors.append(f"{os.path.basename(uri)}: HTTP {status}, no size")
+            elif size == 0:
+                errors.append(f"{os.path.basename(uri)}: empty object")
+
+        target = playlist.target_duration
+        if target is None:
+            errors.append("missing EXT-X-TARGETDURATION")
+        if not playlist.is_endlist:
+            warnings.append("no EXT-X-ENDLIST (live or unfinished)")
+
+        seg_bytes, durations = [], []
+        for n, (seg, (uri, byterange, init)) in enumerate(zip(playlist.segments, refs)):
+            seq = playlist.media_sequence + n
+            durations.append(seg.duration)
+            if target is not None and round(seg.duration) > target:
+                errors.append(f"segment {seq}: EXTINF {seg.duration:.3f}s > TARGETDURATION {target}")
+            size = sizes[uri][0]
+            if byterange:
+                offset, length = byterange
+                if size is not None and offset + length > size:
+                    errors.append(f"segment {seq}: byterange {length}@{offset} beyond the {size} B object")
+                seg_bytes.append(length)
+            else:
+                seg_bytes.append(size or 0)
+            if init and init[1] and sizes[init[0]][0] is not None and sum(init[1]) > sizes[init[0]][0]:
+                errors.append(f"segment {seq}: EXT-X-MAP byterange beyond its object")
+
+        total_dur = sum(durations)
+        rates = [8 * b / d for b, d in zip(seg_bytes, durations) if d > 0]
+        peak = max(rates, default=0.0)
+        average = 8 * sum(seg_bytes) / total_dur if total_dur > 0 else 0.0
+
+        # BANDWIDTH is the peak segment bitrate of the variant (alternate audio renditions are not added here)
+        declared = stream_info.bandwidth if stream_info else None
+        if declared and peak > declared * (1 + self.tolerance):
+            errors.append(f"measured peak {peak / 1000:.0f} kbps > BANDWIDTH {declared / 1000:.0f} kbps")
+        declared_avg = getattr(stream_info, "average_bandwidth", None) if stream_info else None
+        if declared_avg and abs(average - declared_avg) > declared_avg * self.tolerance:
+            warnings.append(f"measured average {average / 1000:.0f} kbps vs AVERAGE-BANDWIDTH "
+                            f"{declared_avg / 1000:.0f} kbps")
+
+        return {
+            "url": url,
+            "segments": len(playlist.segments),
+            "duration": round(total_dur, 3),
+            "durations": durations,
+            "media_sequence": playlist.media_sequence,
+            "discontinuity_sequence": playlist.discontinuity_sequence,
+            "discontinuities": sum(1 for s in playlist.segments if s.discontinuity),
+            "target_duration": target,
+            "bytes": sum(seg_bytes),
+            "peak_kbps": round(peak / 1000, 1),
+            "average_kbps": round(average / 1000, 1),
+            "bandwidth_kbps": round(declared / 1000, 1) if declared else None,
+            "errors": errors,
+            "warnings": warnings,
+        }
+
+    # --- ASSET ---
+    async def validate(self, master_url):
+        master = await self.load(master_url)
+        entries = [(resolve_uri(master_url, p.uri), p.stream_info) for p in master.playlists] \
+            if master.is_variant else [(master_url, None)]
+        results = await asyncio.gather(*(self.validate_variant(u, info) for u, info in entries),
+                                       return_exceptions=True)
+
+        variants, errors, warnings = [], [], []
+        for (url, info), result in zip(entries, results):
+            name = os.path.splitext(os.path.basename(url))[0]
+            if isinstance(result, Exception):
+                errors.append(f"{name}: {type(result).__name__}: {result}")
+                continue
+            result["name"] = name
+            variants.append(result)
+            errors += [f"{name}: {e}" for e in result["errors"]]
+            warnings += [f"{name}: {w}" for w in result["warnings"]]
+            if info is not None and not info.codecs:
+                warnings.append(f"{name}: no CODECS attribute in the master")
+        errors += self.check_alignment(variants)
+
+        return {
+            "url": master_url,
+            "variants": len(entries),
+            "segments": sum(v["segments"] for v in variants),
+            "duration": max((v["duration"] for v in variants), default=0.0),
+            "worst_peak_ratio": max((v["peak_kbps"] / v["bandwidth_kbps"] for v in variants
+                                     if v["bandwidth_kbps"]), default=None),
+            "errors": errors,
+            "warnings": warnings,
+            "ok": not errors,
+            "renditions": [{k: v for k, v in r.items() if k != "durations"} for r in variants],
+        }
+
+    @staticmethod
+    def check_alignment(variants):
+        """Players switch variants by media sequence: every variant must line up segment for segment"""
+        if len(variants) < 2:
+            return []
+        ref, errors = variants[0], []
+        for v in variants[1:]:
+            pair = f"{v['name']} vs {ref['name']}"
+            for field in ("media_sequence", "discontinuity_sequence", "discontinuities", "segments"):
+                if v[field] != ref[field]:
+                    errors.append(f"{pair}: {field} {v[field]} != {ref[field]}")
+            for n, (a, b) in enumerate(zip(v["durations"], ref["durations"])):
+                if abs(a - b) > ALIGN_TOLERANCE:
+                    errors.append(f"{pair}: segment {v['media_sequence'] + n} is {a:.3f}s vs {b:.3f}s")
+                    break   # one misaligned boundary shifts all the following ones
+        return errors
+
+
+async def validate_all(urls, connections=DEFAULT_CONNECTIONS, assets=DEFAULT_ASSETS, timeout=60.0,
+                       tolerance=BANDWIDTH_TOLERANCE, on_report=None):
+    """Validates many masters over one capped connection pool; reports in input order"""
+    connector = aiohttp.TCPConnector(limit=connections, limit_per_host=connections)
+    # No total: aiohttp would count the wait for a free pooled connection against it, and every
+    # HEAD of a variant is queued at once. Only connecting and each read are bounded.
+    timeouts = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeouts) as session:
+        validator = HLSValidator(session, tolerance)
+        gate = asyncio.Semaphore(assets)
+
+        async def one(url):
+            async with gate:
+                try:
+                    report = await validator.validate(url)
+                except Exception as e:   # unreachable master: recorded, the batch goes on
+                    report = {"url": url, "variants": 0, "segments": 0, "duration": 0.0, "worst_peak_ratio": None,
+                              "errors": [f"{type(e).__name__}: {e}"], "warnings": [], "ok": False,
+                              "renditions": []}
+            if on_report:
+                on_report(report)
+            return report
+
+        reports = await asyncio.gather(*(one(u) for u in urls))
+    return reports, validator.requests
+
+
+def read_url_list(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl and validate whole published HLS assets")
+    parser.add_argument("urls", nargs="*", help="Master playlist URLs")
+    parser.add_argument("--list", help="File with one master URL per line")
+    parser.add_argument("--serve", metavar="DIR",
+                        help="Validate DIR/master.m3u8 through a local HTTP server (encode output check)")
+    parser.add_argument("--connections", type=int, default=DEFAULT_CONNECTIONS, help="Open connections cap")
+    parser.add_argument("--assets", type=int, default=DEFAULT_ASSETS, help="Masters crawled at once")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Connect / read timeout per request (s)")
+    parser.add_argument("--tolerance", type=float, default=BANDWIDTH_TOLERANCE * 100,
+                        help="Allowed %% of measured peak above BANDWIDTH")
+    parser.add_argument("--report", help="Append one JSON line per asset to this file")
+    parser.add_argument("--verbose", action="store_true", help="Print every error and warning")
+    args = parser.parse_args()
+
+    urls = list(args.urls) + (read_url_list(args.list) if args.list else [])
+    server = None
+    if args.serve:
+        if not os.path.isfile(os.path.join(args.serve, "master.m3u8")):
+            print(f"❌ No master.m3u8 in {args.serve}")
+            sys.exit(1)
+        from ttff_simulator import serve
+        server, base = serve(os.path.abspath(args.serve), bandwidth=float("inf"), rtt=0.0)
+        urls.append(base + "master.m3u8")
+    if not urls:
+        parser.error("no master URL given (positional, --list or --serve)")
+
+    report_file = open(args.report, "a") if args.report else None
+    done = [0]
+
+    def on_report(report):
+        done[0] += 1
+        mark = "✅" if report["ok"] else "❌"
+        print(f"{mark} [{done[0]}/{len(urls)}] {report['url'][:90]} ({len(report['errors'])} error(s))")
+        if report_file:
+            report_file.write(json.dumps(report) + "\n")
+            report_file.flush()
+
+    print(f"🕸️  Validating {len(urls)} asset(s): {args.assets} at once, {args.connections} connections max")
+    try:
+        reports, n_requests = asyncio.run(validate_all(urls, args.connections, max(1, args.assets), args.timeout,
+                                                       args.tolerance / 100, on_report))
+    finally:
+        if report_file:
+            report_file.close()
+        if server:
+            server.shutdown()
+            server.server_close()
+
+    failed = [r for r in reports if not r["ok"]]
+    rows = [[r["url"][-60:], r["variants"], r["segments"], f"{r['duration']:.1f}s",
+             f"{r['worst_peak_ratio']:.2f}" if r["worst_peak_ratio"] else "N/A",
+             len(r["errors"]), len(r["warnings"])]
+            for r in (reports if args.verbose or len(reports) <= 50 else failed)]
+
+    print("\n" + "=" * 80)
+    print(f"HLS VALIDATION: {len(reports) - len(failed)}/{len(reports)} assets OK ({n_requests} requests)")
+    print("=" * 80)
+    if rows:
+        print(tabulate(rows, headers=["Master", "Variants", "Segments", "Duration", "Peak/BW", "Errors", "Warnings"],
+                       tablefmt="grid"))
+    for r in (reports if args.verbose else failed[:20]):
+        for line in r["errors"][:None if args.verbose else 5]:
+            print(f"   ❌ {r['url'][-50:]}: {line}")
+        if args.verbose:
+            for line in r["warnings"]:
+                print(f"   ⚠️ {r['url'][-50:]}: {line}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
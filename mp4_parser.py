@@ -0,0 +1,185 @@
+import sys
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+# ==============================================================================
+#  FMP4 PARSER: BOX-LEVEL BYTE ACCOUNTING FOR CMAF / FRAGMENTED MP4 SEGMENTS
+# ==============================================================================
+#
+# The fMP4 counterpart of ts_parser: walks the box tree instead of 188-byte
+# packets. Sample sizes come from each fragment's trun (or the tfhd/trex
+# defaults), so video/audio payload is exact; everything else in the fragment
+# (styp, sidx, moof, mdat header) is container overhead.
+#
+# Fetched segments are stored as init section + fragment (see segment_fetcher),
+# so ftyp/moov are reported separately as init_bytes: the player fetches the
+# init once per rendition, not once per segment.
+
+CONTAINERS = {b"moov", b"trak", b"mdia", b"minf", b"stbl", b"mvex", b"moof", b"traf", b"edts", b"dinf"}
+INIT_BOXES = {b"ftyp", b"moov"}
+MP4_FIRST_BOXES = {b"ftyp", b"styp", b"moov", b"moof", b"sidx"}
+
+
+def is_mp4(path):
+    """True when the file starts with an ISO-BMFF box (MPEG-TS starts with the 0x47 sync byte)"""
+    with open(path, "rb") as f:
+        head = f.read(8)
+    return len(head) == 8 and head[4:8] in MP4_FIRST_BOXES
+
+
+def iter_boxes(buf, start=0, end=None):
+    """(type, box start, payload start, box end) of the boxes in buf[start:end]"""
+    end = len(buf) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", buf, pos)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", buf, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos   # runs to the end of the file
+        if size < header:
+            break
+        yield kind, pos, pos + header, min(pos + size, end)
+        pos += size
+
+
+class MP4File:
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self.tracks = {}      # track_id -> {"handler", "timescale", defaults from trex}
+        self.init_bytes = 0
+        self.fragments = []   # per traf: {"track", "sizes", "durations", "decode_time"}
+        self.moofs = 0
+        self.mdat_header_bytes = 0
+
+    @classmethod
+    def open(cls, path):
+        with open(path, "rb") as f:
+            mp4 = cls(path, f.read())
+        mp4._parse(0, len(mp4.data), top=True)
+        return mp4
+
+    # --- BOX WALK ---
+    def _parse(self, start, end, top=False, track=None):
+        for kind, pos, body, box_end in iter_boxes(self.data, start, end):
+            if top and kind in INIT_BOXES:
+                self.init_bytes += box_end - pos
+            if kind == b"trak":
+                track = {}
+                self._parse(body, box_end, track=track)
+                if "id" in track:
+                    self.tracks.setdefault(track["id"], {}).update(track)
+                continue
+            if kind == b"traf":
+                self._traf(body, box_end)
+                continue
+            if kind in CONTAINERS:
+                self.moofs += kind == b"moof"
+                self._parse(body, box_end, track=track)
+            elif kind == b"mdat":
+                self.mdat_header_bytes += body - pos
+            elif kind == b"tkhd" and track is not None:
+                version = self.data[body]
+                track["id"] = struct.unpack_from(">I", self.data, body + (20 if version == 1 else 12))[0]
+            elif kind == b"mdhd" and track is not None:
+                version = self.data[body]
+                track["timescale"] = struct.unpack_from(">I", self.data, body + (20 if version == 1 else 12))[0]
+            elif kind == b"hdlr" and track is not None:
+                track["handler"] = self.data[body + 8:body + 12].decode("latin1")
+            elif kind == b"trex":
+                tid, _, dur, size, _ = struct.unpack_from(">5I", self.data, body + 4)
+                self.tracks.setdefault(tid, {}).update({"default_duration": dur, "default_size": size})
+
+    def _traf(self, start, end):
+        frag = {"track": None, "sizes": [], "durations": [], "decode_time": None}
+        default_duration = default_size = None
+        for kind, pos, body, box_end in iter_boxes(self.data, start, end):
+            flags = int.from_bytes(self.data[body + 1:body + 4], "big")
+            if kind == b"tfhd":
+                frag["track"] = struct.unpack_from(">I", self.data, body + 4)[0]
+                off = body + 8
+                off += 8 if flags & 0x01 else 0   # base_data_offset
+                off += 4 if flags & 0x02 else 0   # sample_description_index
+                if flags & 0x08:
+                    default_duration = struct.unpack_from(">I", self.data, off)[0]
+                    off += 4
+                if flags & 0x10:
+                    default_size = struct.unpack_from(">I", self.data, off)[0]
+            elif kind == b"tfdt":
+                fmt = ">Q" if self.data[body] == 1 else ">I"
+                frag["decode_time"] = struct.unpack_from(fmt, self.data, body + 4)[0]
+            elif kind == b"trun":
+                count = struct.unpack_from(">I", self.data, body + 4)[0]
+                off = body + 8
+                off += 4 if flags & 0x01 else 0   # data_offset
+                off += 4 if flags & 0x04 else 0   # first_sample_flags
+                fields = [bit for bit in (0x100, 0x200, 0x400, 0x800) if flags & bit]
+                defaults = self.tracks.get(frag["track"], {})
+                for _ in range(count):
+                    values = dict(zip(fields, struct.unpack_from(f">{len(fields)}I", self.data, off)))
+                    off += 4 * len(fields)
+                    frag["durations"].append(values.get(0x100, default_duration or defaults.get("default_duration", 0)))
+                    frag["sizes"].append(values.get(0x200, default_size or defaults.get("default_size", 0)))
+        self.fragments.append(frag)
+
+    # --- REPORT ---
+    def track_ids(self, handler):
+        return {tid for tid, t in self.tracks.items() if t.get("handler") == handler}
+
+    def payload_bytes(self, handler):
+        ids = self.track_ids(handler)
+        return sum(sum(f["sizes"]) for f in self.fragments if f["track"] in ids)
+
+    def duration(self):
+        """Summed sample durations of the video track (any track when there is no video)"""
+        ids = self.track_ids("vide") or set(self.tracks)
+        for tid in sorted(ids):
+            ticks = sum(sum(f["durations"]) for f in self.fragments if f["track"] == tid)
+            timescale = self.tracks[tid].get("timescale")
+            if ticks and timescale:
+                return ticks / timescale
+        return 0.0
+
+    def report(self):
+        total = len(self.data) - self.init_bytes
+        v_bytes, a_bytes = self.payload_bytes("vide"), self.payload_bytes("soun")
+        return {
+            "path": self.path,
+            "container": "fmp4",
+            "bytes": total,
+            "init_bytes": self.init_bytes,
+            "duration": self.duration(),
+            "fragments": self.moofs,
+            "video_bytes": v_bytes,
+            "audio_bytes": a_bytes,
+            "overhead_bytes": total - v_bytes - a_bytes,
+            "mdat_header_bytes": self.mdat_header_bytes,
+            # No packets, PSI or PCR in fMP4: the ts_parser fields stay zero
+            "packets": 0, "null_packets": 0, "pat_packets": 0, "psi_packets": 0, "pid_histogram": {},
+            "pcr_count": 0, "interval_max_ms": 0.0, "interval_mean_ms": 0.0, "cbr": False,
+            "accuracy_max_ms": None, "mux_rate_kbps": 0.0,
+        }
+
+
+def analyze_file(path):
+    return MP4File.open(path).report()
+
+
+def analyze_files(paths, max_workers=8):
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return list(pool.map(analyze_file, paths))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python mp4_parser.py <segment.mp4> [more.mp4 ...]")
+        sys.exit(1)
+    for r in analyze_files(sys.argv[1:]):
+        print(f"{r['path']}: {r['duration']:.2f}s | {r['fragments']} fragment(s) | video {r['video_bytes']} B"
+              f" | audio {r['audio_bytes']} B | init {r['init_bytes']} B"
+              f" | overhead {100.0 * r['overhead_bytes'] / max(r['bytes'], 1):.2f}%")
@@ -0,0 +1,238 @@
+import os
+import sys
+import math
+import json
+import shutil
+import argparse
+import subprocess
+from tabulate import tabulate
+from segment_cache import SegmentCache, derive_key, detach, DEFAULT_CACHE_DIR
+from scoring_engine import ScoringEngine, probe_size
+from core_budget import CoreBudget, add_budget_args
+from segment_sampler import stratified_pick
+from probe_service import ProbeService
+from reference_cache import make_reference_cache, add_reference_args
+
+# ==============================================================================
+#  PER-TITLE LADDER: PROBE ENCODES -> VMAF CONVEX HULL -> LADDER JSON
+# ==============================================================================
+#
+# Short clips sampled across the title are encoded at every resolution x CRF
+# point of a grid, scored against the original with the shared ScoringEngine,
+# and the upper convex hull of (log bitrate, VMAF) picks the cheapest point that
+# reaches each quality target. The result is a ladder JSON for
+# backend/scripts/ladder_encoder.py --ladder.
+
+SEG_TIME = 4
+# Same never-upscale rule as ladder_encoder.LADDER: (name, width, min source height)
+RESOLUTIONS = [("1080p", 1920, 1080), ("720p", 1280, 720), ("480p", 854, 0)]
+DEFAULT_CRFS = [22, 25, 28, 31, 34]
+DEFAULT_TARGETS = [95.0, 88.0, 78.0]   # VMAF per rung, top to bottom
+MAXRATE_FACTOR = 1.5                   # VBV cap over the measured average bitrate
+BUFSIZE_FACTOR = 2.0                   # bufsize = 2 x maxrate (as in the fixed ladder)
+
+
+def probe_encode(task):
+    """
+    Encodes one clip at one grid point (module-level so the process pool can pickle it).
+    Returns the output path, or None when ffmpeg failed (the partial output is removed).
+    """
+    source, out_path, start, duration, width, crf, preset, tune, threads = task
+    cmd = [
+        "ffmpeg", "-y", "-v", "error", "-nostdin",
+        "-ss", f"{start:.3f}", "-t", f"{duration:.3f}", "-i", source,
+        "-vf", f"scale=w={width}:h=-2:flags=lanczos",
+        "-c:v", "libx264", "-profile:v", "high", "-preset", preset, "-tune", tune, "-crf", str(crf),
+        "-threads", str(threads), "-an", out_path,
+    ]
+    # never let ffmpeg -y rewrite an older file in place (it may be a cache object's hard link)
+    detach(out_path)
+    if subprocess.run(cmd).returncode != 0:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        return None
+    return out_path
+
+
+def upper_hull(points):
+    """
+    Upper convex hull of (bitrate, vmaf, ...) tuples in (log bitrate, VMAF) space,
+    left to right; points below it are never worth encoding at any bitrate.
+    """
+    pts = sorted((p for p in points if p[0] > 0), key=lambda p: (p[0], -p[1]))
+    hull = []
+    for p in pts:
+        if hull and p[1] <= hull[-1][1]:
+            continue  # costs more, scores no better
+        while len(hull) >= 2:
+            (x1, y1), (x2, y2) = (math.log(hull[-2][0]), hull[-2][1]), (math.log(hull[-1][0]), hull[-1][1])
+            x3, y3 = math.log(p[0]), p[1]
+            if (x2 - x1) * (y3 - y1) - (y2 - y1) * (x3 - x1) >= 0:
+                hull.pop()   # middle point sits on or under the chord
+            else:
+                break
+        hull.append(p)
+    return hull
+
+
+def pick_ladder(hull, targets):
+    """Cheapest hull point reaching each VMAF target (best available when none does)"""
+    ladder = []
+    for target in targets:
+        reaching = [p for p in hull if p[1] >= target]
+        point = reaching[0] if reaching else hull[-1]
+        if point not in ladder:
+            ladder.append(point)
+    return sorted(ladder, key=lambda p: -p[0])
+
+
+class PerTitleOptimizer:
+    def __init__(self, original_file, work_dir="per_title_lab", cache_dir=DEFAULT_CACHE_DIR, use_cache=True,
+                 preset="medium", tune="animation", ref_format="ffv1", clean=True):
+        self.original_file = original_file
+        self.work_dir = work_dir
+        self.preset = preset
+        self.tune = tune
+        self.cache = SegmentCache(cache_dir) if use_cache else None
+        self.probes = ProbeService(cache_dir, persist=use_cache)
+        self.refs = make_reference_cache(original_file, os.path.join(work_dir, "refs"), self.cache, ref_format,
+                                         self.probes)
+        # Scratch per run: clip and metrics names carry no source / preset, so files left by
+        # an earlier search must never be mistaken for (or written over as) this one's
+        if clean and os.path.exists(work_dir):
+            shutil.rmtree(work_dir)
+        os.makedirs(work_dir, exist_ok=True)
+
+    def clip_windows(self, n_clips, clip_len):
+        """n clips spread over the title (middle of each stratum), on the SEG_TIME grid"""
+        duration = self.probes.duration(self.original_file)
+        n_segments = max(1, int(duration // clip_len))
+        return [(w.start, w.duration) for w in stratified_pick([clip_len] * n_segments, n_clips)]
+
+    def grid(self, crfs):
+        src_h = int(self.probes.video(self.original_file).get("height", 0))
+        return [(name, width, crf) for name, width, min_h in RESOLUTIONS if src_h >= min_h for crf in crfs]
+
+    # --- PROBE ENCODES (cached) ---
+    def encode_all(self, windows, grid, budget):
+        src_key = self.cache.file_key(self.original_file) if self.cache else None
+        jobs_n, threads = budget.plan(len(windows) * len(grid))
+        clips, pending = {}, []
+        for k, (start, dur) in enumerate(windows):
+            for name, width, crf in grid:
+                out = os.path.join(self.work_dir, f"w{k}_{name}_crf{crf}.ts")
+                key = derive_key("probe-encode", src_key, start, dur, width, crf, self.preset, self.tune) \
+                    if self.cache else None
+                clips[(k, name, crf)] = out
+                if self.cache and self.cache.fetch_into(key, out):
+                    continue
+                pending.append(((self.original_file, out, start, dur, width, crf, self.preset, self.tune, threads), key))
+
+        print(f"   🎬 {len(clips)} probe encodes ({len(clips) - len(pending)} cached), "
+              f"{jobs_n} parallel x {threads} threads")
+        done = budget.map(probe_encode, [task for task, _ in pending])
+        failed = done.count(None)
+        if failed:
+            print(f"   ⚠️ {failed} probe encode(s) failed, left out of the search")
+        if self.cache:
+            # only complete encodes: a partial one would be served from the cache on every later run
+            for (task, key), path in zip(pending, done):
+                if path:
+                    self.cache.put(key, path)
+        return clips
+
+    # --- SEARCH ---
+    def run(self, n_clips=3, clip_len=SEG_TIME, crfs=DEFAULT_CRFS, targets=DEFAULT_TARGETS, budget=None):
+        budget = budget or CoreBudget()
+        windows = self.clip_windows(n_clips, clip_len)
+        grid = self.grid(crfs)
+        clips = self.encode_all(windows, grid, budget)
+
+        engine = ScoringEngine(self.original_file, self.work_dir, ref_size=probe_size(self.original_file, self.probes),
+                               cache=self.cache, ref_cache=self.refs)
+        for (k, name, crf), path in clips.items():
+            if os.path.exists(path) and os.path.getsize(path) > 0:
+                start, dur = windows[k]
+                engine.add(f"w{k}_{name}_crf{crf}", path, dur, ref_start=start)
+        engine.n_threads = budget.threads_for(len(engine.items))
+        scores = engine.run()
+
+        # Each grid point: mean bitrate and VMAF over the sampled windows
+        points = []
+        for name, width, crf in grid:
+            rates, vmafs = [], []
+            for k, (_, dur) in enumerate(windows):
+                path = clips[(k, name, crf)]
+                label = f"w{k}_{name}_crf{crf}"
+                scored = scores.get(label)
+                if scored:
+                    rates.append(os.path.getsize(path) * 8 / dur)
+                    vmafs.append(scored.vmaf)
+            if rates:
+                points.append((sum(rates) / len(rates), sum(vmafs) / len(vmafs), name, width, crf))
+        hull = upper_hull(points)
+        return points, hull, pick_ladder(hull, targets) if hull else []
+
+
+def ladder_json(picked):
+    """Rungs in the ladder_encoder --ladder format (kbps strings, per-rung CRF)"""
+    rungs = []
+    for bitrate, vmaf, name, width, crf in picked:
+        kbps = int(round(bitrate / 1000))
+        maxrate = int(round(kbps * MAXRATE_FACTOR))
+        rungs.append({
+            "name": name if name not in [r["name"] for r in rungs] else f"{name}_{kbps}k",
+            "width": width,
+            "crf": crf,
+            "bitrate": f"{kbps}k",
+            "maxrate": f"{maxrate}k",
+            "bufsize": f"{int(maxrate * BUFSIZE_FACTOR)}k",
+            "vmaf": round(vmaf, 2),
+        })
+    return rungs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-title ladder search over a VMAF convex hull")
+    parser.add_argument("original", help="Source video")
+    parser.add_argument("--out", default="ladder.json", help="Ladder JSON for ladder_encoder.py --ladder")
+    parser.add_argument("--clips", type=int, default=3, help="Sampled clips across the title")
+    parser.add_argument("--clip-len", type=float, default=SEG_TIME, help="Seconds per clip")
+    parser.add_argument("--crfs", default=",".join(map(str, DEFAULT_CRFS)), help="CRF grid, comma separated")
+    parser.add_argument("--targets", default=",".join(map(str, DEFAULT_TARGETS)),
+                        help="VMAF target per rung, comma separated")
+    parser.add_argument("--preset", default="medium", help="x264 preset for probe encodes")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and don't populate the artifact cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Artifact cache location")
+    add_budget_args(parser)
+    add_reference_args(parser)
+    args = parser.parse_args()
+
+    optimizer = PerTitleOptimizer(args.original, cache_dir=args.cache_dir, use_cache=not args.no_cache,
+                                  preset=args.preset, ref_format=args.ref_format)
+    print(f"🔍 Per-title search: {args.original}")
+    points, hull, picked = optimizer.run(
+        n_clips=args.clips, clip_len=args.clip_len,
+        crfs=[int(c) for c in args.crfs.split(",")],
+        targets=[float(t) for t in args.targets.split(",")],
+        budget=CoreBudget(cpus=args.cpus, jobs=args.jobs),
+    )
+    if not picked:
+        print("❌ No probe encode could be scored.")
+        sys.exit(1)
+
+    on_hull = {(p[2], p[4]) for p in hull}
+    rows = [[name, crf, f"{rate / 1000:.0f} k", f"{vmaf:.1f}", "★" if (name, crf) in on_hull else ""]
+            for rate, vmaf, name, _, crf in sorted(points, key=lambda p: p[0])]
+    print(tabulate(rows, headers=["Res", "CRF", "Bitrate", "VMAF", "Hull"], tablefmt="grid"))
+
+    rungs = ladder_json(picked)
+    with open(args.out, "w") as f:
+        json.dump(rungs, f, indent=2)
+    print(tabulate([[r["name"], r["width"], r["crf"], r["bitrate"], r["maxrate"], r["vmaf"]] for r in rungs],
+                   headers=["Rung", "Width", "CRF", "Bitrate", "Maxrate", "VMAF"], tablefmt="grid"))
+    print(f"✅ Ladder written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import os
+import json
+import sqlite3
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from segment_cache import DEFAULT_CACHE_DIR
+
+# ==============================================================================
+#  PROBE SERVICE: ONE FFPROBE PER FILE, MEMOIZED + PERSISTED IN SQLITE
+# ==============================================================================
+#
+# ffprobe startup dominates when the field asked for is tiny (a duration, a
+# height), so every file is probed once with format + streams and every later
+# question is answered from that result. Results are keyed by
+# (realpath, size, mtime_ns): a rewritten file is re-probed automatically.
+# Video packet lists (gop_forensics) are memoized the same way in their own table.
+
+PROBE_SECTIONS = ["-show_format", "-show_streams"]
+PACKET_ENTRIES = "packet=pts_time,dts_time,flags,size"
+
+
+def parse_rate(rate):
+    """'30000/1001' -> 29.97 (ffprobe frame rates are fractions)"""
+    try:
+        num, _, den = str(rate).partition("/")
+        return float(num) / float(den or 1) if float(den or 1) else 0.0
+    except ValueError:
+        return 0.0
+
+
+class ProbeService:
+    """
+    probes = ProbeService()                # persisted under the judge cache dir
+    probes.probe_many(segments)            # concurrent, one ffprobe per unseen file
+    probes.duration(path), probes.video(path)["height"], probes.format(path)["bit_rate"]
+    probes.video_packets(path)             # ffprobe -show_packets CSV of the first video stream
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, persist=True, max_workers=8):
+        self.max_workers = max_workers
+        self._memo = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if persist:
+            os.makedirs(root, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(root, "probes.sqlite"),
+                                       timeout=30, check_same_thread=False)
+            with self._lock, self._db:
+                for table in ("probes", "packets"):
+                    self._db.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+                        path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, data TEXT)""")
+
+    @staticmethod
+    def _key(path):
+        st = os.stat(path)
+        return os.path.realpath(path), st.st_size, st.st_mtime_ns
+
+    @staticmethod
+    def run_ffprobe(path):
+        cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", *PROBE_SECTIONS, path]
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        try:
+            return json.loads(result.stdout)
+        except ValueError:
+            return {}
+
+    @staticmethod
+    def run_packet_probe(path):
+        cmd = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+               "-show_entries", PACKET_ENTRIES, "-of", "csv=p=0", path]
+        return subprocess.run(cmd, capture_output=True, text=True).stdout
+
+    # --- LOOKUP ---
+    def _memoized(self, table, path, run, empty):
+        """run(path) once per (file version, table): memo first, then SQLite, then the run"""
+        try:
+            key = self._key(path)
+        except OSError:
+            return empty
+        with self._lock:
+            if (table, key) in self._memo:
+                return self._memo[(table, key)]
+            if self._db:
+                row = self._db.execute(f"SELECT data FROM {table} WHERE path=? AND size=? AND mtime_ns=?",
+                                       key).fetchone()
+                if row:
+                    self._memo[(table, key)] = json.loads(row[0])
+                    return self._memo[(table, key)]
+
+        data = run(path)
+        with self._lock:
+            self._memo[(table, key)] = data
+            if self._db and data:
+                with self._db:
+                    self._db.execute(f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?)",
+                                     (*key, json.dumps(data)))
+        return data
+
+    def probe(self, path):
+        """Full ffprobe result ({"format": ..., "streams": [...]}); {} when unreadable"""
+        return self._memoized("probes", path, self.run_ffprobe, {})
+
+    def video_packets(self, path):
+        """pts_time,dts_time,size,flags CSV lines of the first video stream, decode order; "" when unreadable"""
+        return self._memoized("packets", path, self.run_packet_probe, "")
+
+    def probe_many(self, paths):
+        """Probes a batch concurrently (cached files cost nothing); results keep input order"""
+        if not paths:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(paths))) as pool:
+            return list(pool.map(self.probe, paths))
+
+    # --- FIELDS ---
+    def format(self, path):
+        return self.probe(path).get("format", {})
+
+    def stream(self, path, codec_type):
+        return next((s for s in self.probe(path).get("streams", []) if s.get("codec_type") == codec_type), {})
+
+    def video(self, path):
+        return self.stream(path, "video")
+
+    def audio(self, path):
+        return self.stream(path, "audio")
+
+    def duration(self, path):
+        try:
+            return float(self.format(path).get("duration", 0))
+        except ValueError:
+            return 0.0
+
+    def fps(self, path):
+        return parse_rate(self.video(path).get("r_frame_rate", "0/1"))
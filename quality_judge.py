@@ -1,66 +1,82 @@
 import os
 import sys
-import m3u8
-import requests
+import argparse
 import subprocess
 import json
 import shutil
-import glob
-from urllib.parse import urljoin
 from tabulate import tabulate
+from segment_fetcher import SegmentFetcher, resolve_uri
+from segment_cache import SegmentCache, derive_key, detach, DEFAULT_CACHE_DIR
+from core_budget import CoreBudget, add_budget_args
+from scoring_engine import (ScoringEngine, VMAF_MODELS, add_scoring_args, default_model, fmt, metric, parse_size,
+                            probe_size, scoring_size)
+from frame_metrics import FrameMetrics
+from segment_sampler import plan_sampled_comparison, aggregate_windows
+from probe_service import ProbeService
+from reference_cache import make_reference_cache, add_reference_args
 
 # ==============================================================================
 #  THE JUDGE: VMAF & SSIM COMPARATOR
 # ==============================================================================
 
 class QualityJudge:
-    def __init__(self, original_file, work_dir="quality_lab"):
+    def __init__(self, original_file, work_dir="quality_lab", cache_dir=DEFAULT_CACHE_DIR, use_cache=True,
+                 ref_format="ffv1", score_at="display", display=None, vmaf_model=None, clean=True, vmaf_threads=4):
         self.original_file = original_file
         self.work_dir = work_dir
-        if os.path.exists(work_dir):
-            shutil.rmtree(work_dir)
-        os.makedirs(work_dir)
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        self.ref_format = ref_format
+        self.vmaf_threads = vmaf_threads
+        # The work dir is scratch space; anything worth keeping lives in the cache
+        self.cache = SegmentCache(cache_dir) if use_cache else None
+        self.fetcher = SegmentFetcher(cache=self.cache)
+        self.probes = ProbeService(cache_dir, persist=use_cache)
+        self.segment_durations = {}  # label -> EXTINF durations of the fetched segments
+        # Decoded reference windows, shared by every later comparison of this original
+        self.refs = make_reference_cache(original_file, os.path.join(work_dir, "refs"), self.cache, ref_format,
+                                         self.probes)
+        self.references = {}  # prepared reference path -> ReferenceClip
+        self.score_at = score_at
+        self.display = display
+        self.vmaf_model = vmaf_model
+        self.source_size = probe_size(original_file, self.probes)   # checked, not assumed to be 1080p
+        self.display_size = parse_size(display) or self.source_size
+        if clean:
+            if os.path.exists(work_dir):
+                shutil.rmtree(work_dir)
+            os.makedirs(work_dir)
+
+    def _file_keys(self, paths):
+        return [self.cache.file_key(p) for p in paths] if self.cache else []
+
+    def _cached(self, key_parts, out_path, build):
+        """Reuses a cached artifact for out_path, or builds and stores it"""
+        if not self.cache:
+            build()
+            return out_path
+        key = derive_key(*key_parts)
+        if self.cache.fetch_into(key, out_path):
+            print(f"   ♻️  Cache hit: {os.path.basename(out_path)}")
+            return out_path
+        detach(out_path)   # build() writes with ffmpeg -y: never through a cache object's link
+        build()
+        self.cache.put(key, out_path)
+        return out_path
 
     def download_segments(self, playlist_url, label, limit=10):
         """Downloads first N segments from a playlist"""
         print(f"   ⬇️ Downloading {label} segments...")
         folder = os.path.join(self.work_dir, label)
-        os.makedirs(folder, exist_ok=True)
         
         try:
-            if playlist_url.startswith("http"):
-                m3u8_obj = m3u8.load(playlist_url)
-                base_uri = playlist_url
-            else:
-                # Local file handling
-                m3u8_obj = m3u8.load(playlist_url)
-                base_uri = playlist_url
-
-            segments = m3u8_obj.segments[:limit]
-            ts_files = []
-
-            for i, seg in enumerate(segments):
-                seg_uri = seg.uri
-                # Handle relative paths
-                if not seg_uri.startswith("http") and not os.path.isabs(seg_uri):
-                    if playlist_url.startswith("http"):
-                        seg_uri = urljoin(base_uri, seg_uri)
-                    else:
-                        seg_uri = os.path.join(os.path.dirname(playlist_url), seg_uri)
-                
-                local_path = os.path.join(folder, f"seg_{i:03d}.ts")
-                
-                if seg_uri.startswith("http"):
-                    r = requests.get(seg_uri, stream=True)
-                    with open(local_path, 'wb') as f:
-                        for chunk in r.iter_content(chunk_size=1024):
-                            f.write(chunk)
-                else:
-                    shutil.copy(seg_uri, local_path)
-                
-                ts_files.append(local_path)
-            
-            return ts_files
+            m3u8_obj = self.fetcher.load_playlist(playlist_url)
+            results = self.fetcher.fetch_playlist_segments(m3u8_obj, playlist_url, folder, limit)
+            self.fetcher.report(results, label)
+            if not all(results):
+                raise RuntimeError(f"{results.count(None)} segment(s) failed to download")
+            self.segment_durations[label] = [r['duration'] for r in results]
+            return [r['path'] for r in results]
         except Exception as e:
             print(f"   ❌ Error fetching segments for {label}: {e}")
             return []
@@ -70,13 +86,19 @@ class QualityJudge:
         if not ts_files:
             return None
         
+        # fMP4 segments (init + fragment) merge into .mp4, TS into .ts
+        ext = os.path.splitext(ts_files[0])[1] or ".ts"
+        merged_path = os.path.join(self.work_dir, f"{output_name}_merged{ext}")
+        key_parts = ["concat", *self._file_keys(ts_files)]
+        return self._cached(key_parts, merged_path,
+                            lambda: self._concat_segments(ts_files, output_name, merged_path))
+
+    def _concat_segments(self, ts_files, output_name, merged_path):
         list_file = os.path.join(self.work_dir, f"{output_name}_list.txt")
         with open(list_file, 'w') as f:
             for ts in ts_files:
                 f.write(f"file '{os.path.abspath(ts)}'\n")
         
-        merged_path = os.path.join(self.work_dir, f"{output_name}_merged.ts")
-        
         # Concat using ffmpeg to fix timestamps
         cmd = [
             "ffmpeg", "-y", "-v", "error",
@@ -86,19 +108,31 @@ class QualityJudge:
             merged_path
         ]
         subprocess.run(cmd)
-        return merged_path
 
     def get_duration(self, file_path):
-        cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", file_path]
-        try:
-            return float(subprocess.check_output(cmd).strip())
-        except:
-            return 0
+        return self.probes.duration(file_path)
+
+    def score_size(self, res):
+        """Scoring resolution of the rendition labelled `res` ('1280x720')"""
+        return scoring_size(self.score_at, self.display_size, parse_size(res))
 
-    def prepare_reference(self, duration_sec, output_name):
+    def model(self, size):
+        return self.vmaf_model or default_model(size)
+
+    def prepare_reference(self, duration_sec, output_name, size=None):
         """Cuts the original file to match the segment duration exactly"""
+        if self.refs:
+            # Decoded once at the scoring size: no x264 intermediate, no scaling at compare time
+            clip = self.refs.get(0.0, duration_sec, size or self.display_size)
+            if clip:
+                self.references[clip.path] = clip
+                return clip.path
+            # decode failed: fall through to the x264 cut, as with --ref-format off
         ref_path = os.path.join(self.work_dir, f"{output_name}_ref.mp4")
-        
+        key_parts = ["reference", "x264-crf0-ultrafast", duration_sec, *self._file_keys([self.original_file])]
+        return self._cached(key_parts, ref_path, lambda: self._prepare_reference(duration_sec, ref_path))
+
+    def _prepare_reference(self, duration_sec, ref_path):
         # We assume segments start at 0.0
         # Important: re-encode to raw YUV or losslessly to avoid seeking keyframe issues during VMAF
         # But for speed, we try fast trim first. If VMAF fails, we decode.
@@ -111,89 +145,262 @@ class QualityJudge:
             ref_path
         ]
         subprocess.run(cmd)
-        return ref_path
 
-    def run_vmaf_ssim(self, distorted_path, reference_path):
+    def run_vmaf_ssim(self, distorted_path, reference_path, size=None):
         """
-        Runs the VMAF and SSIM comparison.
-        Scales distorted video to match reference if needed.
+        Runs the VMAF and SSIM comparison at `size` (default: the display size).
+        Both sides are scaled to it when they differ.
         """
         print(f"   🧪 Running VMAF/SSIM analysis (This takes time)...")
         
-        log_path = distorted_path + "_vmaf.json"
+        scores_path = distorted_path + "_scores.json"
+        clip = self.references.get(reference_path)
+        # A cached reference is identified by its derivation key (hashing GBs of frames would cost more)
+        ref_keys = [clip.key] if clip else self._file_keys([reference_path])
+        w, h = size = tuple(size or self.display_size)
+        key_parts = ["vmaf_ssim", f"scale{w}x{h}-bicubic-libvmaf_ssim", self.model(size),
+                     *self._file_keys([distorted_path]), *ref_keys]
+
+        def build():
+            vmaf_score, ssim_score = self._run_vmaf_ssim(distorted_path, reference_path, size)
+            if vmaf_score is not None:
+                with open(scores_path, 'w') as f:
+                    json.dump({"vmaf": vmaf_score, "ssim": ssim_score}, f)
+
+        self._cached(key_parts, scores_path, build)
+        try:
+            with open(scores_path, 'r') as f:
+                scores = json.load(f)
+                return scores['vmaf'], scores['ssim']
+        except (OSError, ValueError, KeyError):
+            return None, None   # metrics failed: N/A in the table, not VMAF 0
+
+    def _run_vmaf_ssim(self, distorted_path, reference_path, size):
+        log_path = distorted_path + "_metrics.csv"
+        detach(log_path)   # a failed run must not read an older log back
         
         # Complex Filter:
-        # 1. [0:v] (Distorted) -> Scale to 1920x1080 (assuming Ref is 1080p) -> setpts (sync)
-        # 2. [1:v] (Reference) -> setpts (sync)
-        # 3. Compare
-        
-        # Note: We assume Original is 1080p. If different, we should check ref width.
-        # But usually we scale Distorted to match Reference.
+        # 1. [0:v] (Distorted) -> Scale to the scoring size -> setpts (sync)
+        # 2. [1:v] (Reference) -> Scale to the scoring size unless the cached clip already is -> setpts (sync)
+        # 3. Compare: libvmaf computes PSNR and SSIM per frame alongside VMAF,
+        #    so SSIM comes from the same CSV log instead of ffmpeg's stderr summary
         
+        w, h = size
+        clip = self.references.get(reference_path)
+        ref_scale = "" if clip and clip.size == size else f"scale={w}:{h}:flags=bicubic,"
         cmd = [
             "ffmpeg", "-y", "-v", "error",
             "-i", distorted_path,
-            "-i", reference_path,
+            *(clip.input_opts() if clip else []), "-i", reference_path,
             "-filter_complex", 
-            "[0:v]scale=1920:1080:flags=bicubic,setpts=PTS-STARTPTS[dist];[1:v]setpts=PTS-STARTPTS[ref];[dist][ref]libvmaf=log_path={}:log_fmt=json:n_threads=4:feature=name=psnr".format(log_path) + ";[dist][ref]ssim",
+            f"[0:v]scale={w}:{h}:flags=bicubic,setpts=PTS-STARTPTS[dist];[1:v]{ref_scale}setpts=PTS-STARTPTS[ref];"
+            "[dist][ref]libvmaf=log_path={}:log_fmt=csv:n_threads={}:model={}:feature=name=psnr|name=float_ssim".format(
+                log_path, self.vmaf_threads, VMAF_MODELS[self.model(size)]),
             "-f", "null", "-"
         ]
+        subprocess.run(cmd)
         
-        # Capture SSIM from stderr (ffmpeg outputs stats there)
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        # Parse SSIM from stderr
-        ssim_score = 0.0
-        for line in result.stderr.split('\n'):
-            if "SSIM All" in line:
-                # Format: SSIM All:0.98123...
-                parts = line.split("All:")
-                if len(parts) > 1:
-                    ssim_score = float(parts[1].split()[0])
-        
-        # Parse VMAF from JSON
-        vmaf_score = 0.0
         try:
-            with open(log_path, 'r') as f:
-                data = json.load(f)
-                vmaf_score = data['pooled_metrics']['vmaf']['mean']
-        except:
+            frames = FrameMetrics.load_csv(log_path, duration=0)
+            return frames.pooled("vmaf")["mean"], frames.pooled("ssim")["mean"]
+        except (OSError, ValueError):
             print("   ⚠️ Could not read VMAF log.")
-        
-        return vmaf_score, ssim_score
+            return None, None
+
+    def trim_to_duration(self, input_path, duration, output_suffix):
+        """Cuts a merged file down to the common test duration"""
+        root, ext = os.path.splitext(input_path)
+        output = f"{root}_{output_suffix}{ext}"
+        key_parts = ["trim", duration, *self._file_keys([input_path])]
+        cmd = ["ffmpeg", "-y", "-v", "error", "-i", input_path, "-t", str(duration), "-c", "copy", output]
+        return self._cached(key_parts, output, lambda: subprocess.run(cmd))
 
     def get_master_variants(self, master_path):
         """Extracts resolution:url pairs from a master playlist"""
         variants = {}
         try:
-            m = m3u8.load(master_path)
+            m = self.fetcher.load_playlist(master_path)
             for p in m.playlists:
                 res = f"{p.stream_info.resolution[0]}x{p.stream_info.resolution[1]}"
-                uri = p.uri
-                if not uri.startswith("http") and master_path.startswith("http"):
-                    uri = urljoin(master_path, uri)
-                elif not os.path.isabs(uri) and not master_path.startswith("http"):
-                     uri = os.path.join(os.path.dirname(master_path), uri)
-                
-                variants[res] = uri
+                variants[res] = resolve_uri(master_path, p.uri)
         except Exception as e:
             print(f"Error reading master {master_path}: {e}")
         return variants
 
+# ==============================================================================
+#  ONE RESOLUTION ROUND (runs inside the process pool)
+# ==============================================================================
+
+def compare_rendition(task):
+    """Full Mux vs Local comparison for one resolution; returns a table row or None"""
+    res, mux_url, local_url, judge_args, vmaf_threads, stream, samples = task
+    judge = QualityJudge(*judge_args, clean=False, vmaf_threads=vmaf_threads)
+
+    print(f"\n⚔️  BATTLE ROUND: {res} ⚔️")
+    if samples:
+        return sampled_round(judge, res, mux_url, local_url, samples)
+    
+    # 1. Download Segments (نحمل عدد أكبر قليلاً لضمان تغطية الوقت)
+    # نحمل 12 قطعة من Mux (12 * 5 = 60s)
+    mux_ts_files = judge.download_segments(mux_url, f"mux_{res}", limit=12)
+    # نحمل 15 قطعة من Local (15 * 4 = 60s) - لضمان أننا نغطي نفس المدة
+    local_ts_files = judge.download_segments(local_url, f"local_{res}", limit=15)
+
+    if stream:
+        return stream_round(judge, res, mux_ts_files, local_ts_files)
+
+    mux_merged = judge.concat_segments(mux_ts_files, f"mux_{res}")
+    local_merged = judge.concat_segments(local_ts_files, f"local_{res}")
+    
+    if not mux_merged or not local_merged:
+        print("   ⚠️ Skipping due to missing segments.")
+        return None
+        
+    # 2. Time Normalization (التعديل الجديد والمهم) ⏱️
+    # نحسب مدة كل ملف
+    dur_mux = judge.get_duration(mux_merged)
+    dur_loc = judge.get_duration(local_merged)
+    
+    # نختار المدة الأقصر لنحاكم الجميع عليها
+    test_duration = min(dur_mux, dur_loc)
+    print(f"   ⏱️  Normalizing test duration to: {test_duration:.2f} seconds")
+
+    # 3. Prepare Reference (Cut exact duration)
+    size = judge.score_size(res)
+    reference = judge.prepare_reference(test_duration, f"ref_{res}", size)
+    
+    # نقوم بقص الملفات المدمجة لتطابق المرجع تماماً
+    mux_final = judge.trim_to_duration(mux_merged, test_duration, "trimmed")
+    local_final = judge.trim_to_duration(local_merged, test_duration, "trimmed")
+    
+    # 4. Fight!
+    print(f"   🥊 Assessing Mux Quality...")
+    mux_vmaf, mux_ssim = judge.run_vmaf_ssim(mux_final, reference, size)
+    
+    print(f"   🥊 Assessing Local Quality...")
+    loc_vmaf, loc_ssim = judge.run_vmaf_ssim(local_final, reference, size)
+    
+    return round_row(res, mux_vmaf, mux_ssim, loc_vmaf, loc_ssim)
+
+def round_row(res, mux_vmaf, mux_ssim, loc_vmaf, loc_ssim):
+    """Table row of one round; a side whose metrics failed (None) shows N/A and there is no winner"""
+    if mux_vmaf is None or loc_vmaf is None:
+        winner = "NO SCORE ⚠️"
+    else:
+        diff = loc_vmaf - mux_vmaf
+        if diff > 0.5: winner = "LOCAL 🏆" # قللنا الهامش ليكون أكثر دقة
+        elif diff < -0.5: winner = "MUX 👑"
+        else: winner = "DRAW 🤝"
+
+    return [
+        res,
+        fmt(mux_vmaf, ".2f"), fmt(mux_ssim, ".4f"),
+        fmt(loc_vmaf, ".2f"), fmt(loc_ssim, ".4f"),
+        winner
+    ]
+
+def stream_round(judge, res, mux_ts_files, local_ts_files):
+    """
+    Streaming variant of a round: the raw segments are fed to one scoring ffmpeg
+    (concat protocol, duration enforced with -t/trim), against the original itself.
+    No merged, trimmed or reference file is written.
+    """
+    if not mux_ts_files or not local_ts_files:
+        print("   ⚠️ Skipping due to missing segments.")
+        return None
+
+    test_duration = min(sum(judge.segment_durations[f"mux_{res}"]),
+                        sum(judge.segment_durations[f"local_{res}"]))
+    print(f"   ⏱️  Normalizing test duration to: {test_duration:.2f} seconds (streamed)")
+
+    size = judge.score_size(res)
+    engine = ScoringEngine(judge.original_file, judge.work_dir, ref_size=judge.source_size,
+                           n_threads=max(1, judge.vmaf_threads // 2), cache=judge.cache, ref_cache=judge.refs,
+                           model=judge.vmaf_model)
+    engine.add(f"mux_{res}", mux_ts_files, test_duration, size=size)
+    engine.add(f"local_{res}", local_ts_files, test_duration, size=size)
+    print(f"   🥊 Assessing Mux & Local Quality in one pass...")
+    scores = engine.run()
+    mux, loc = scores.get(f"mux_{res}"), scores.get(f"local_{res}")
+    return round_row(res, metric(mux, "vmaf"), metric(mux, "ssim"), metric(loc, "vmaf"), metric(loc, "ssim"))
+
+def sampled_round(judge, res, mux_url, local_url, samples):
+    """
+    Sampling variant of a round: N windows stratified over the whole playlist, each
+    scored against a fast-seeked cut of the original. VMAF is reported as an estimate.
+    """
+    plan = plan_sampled_comparison(judge.fetcher, mux_url, local_url,
+                                   os.path.join(judge.work_dir, f"sample_{res}"), samples)
+    windows = plan["windows"]
+    if not windows:
+        print("   ⚠️ Skipping due to missing segments.")
+        return None
+
+    size = judge.score_size(res)
+    engine = ScoringEngine(judge.original_file, judge.work_dir, ref_size=judge.source_size,
+                           n_threads=max(1, judge.vmaf_threads // (2 * len(windows))), cache=judge.cache,
+                           ref_cache=judge.refs, model=judge.vmaf_model)
+    for k, w in enumerate(windows):
+        engine.add(f"mux_{res}_w{k}", w['mux'], w['duration'], w['start'], w['mux_offset'], size=size)
+        engine.add(f"local_{res}_w{k}", w['loc'], w['duration'], w['start'], size=size)
+    print(f"   🥊 Assessing {len(windows)} sampled windows per source...")
+    scores = engine.run()
+
+    weights = [w['weight'] for w in windows]
+    mux, est_mux = aggregate_windows([scores.get(f"mux_{res}_w{k}") for k in range(len(windows))],
+                                     weights, plan["population"])
+    loc, est_loc = aggregate_windows([scores.get(f"local_{res}_w{k}") for k in range(len(windows))],
+                                     weights, plan["population"])
+    if est_mux["failed"] or est_loc["failed"]:
+        print(f"   ⚠️ {res}: metrics failed for {est_mux['failed']} Mux / {est_loc['failed']} Local window(s), "
+              f"estimating from the rest")
+    if not mux or not loc:
+        return [res, "N/A", "N/A", "N/A", "N/A", "NO SCORE ⚠️"]
+
+    diff = loc.vmaf - mux.vmaf
+    if diff > 0.5: winner = "LOCAL 🏆"
+    elif diff < -0.5: winner = "MUX 👑"
+    else: winner = "DRAW 🤝"
+
+    return [
+        res,
+        f"{mux.vmaf:.2f} ± {est_mux['half_width']:.2f}", f"{mux.ssim:.4f}",
+        f"{loc.vmaf:.2f} ± {est_loc['half_width']:.2f}", f"{loc.ssim:.4f}",
+        winner
+    ]
+
 # ==============================================================================
 #  MAIN EXECUTION
 # ==============================================================================
 
 def main():
-    if len(sys.argv) < 4:
-        print("Usage: python quality_judge.py <ORIGINAL.mp4> <MUX_MASTER_URL> <LOCAL_MASTER_PATH/URL>")
+    parser = argparse.ArgumentParser(description="The Judge: VMAF & SSIM comparator")
+    parser.add_argument("original", help="Original source file (ORIGINAL.mp4)")
+    parser.add_argument("mux_master", help="Mux master playlist URL")
+    parser.add_argument("local_master", help="Local master playlist path/URL")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and don't populate the artifact cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Artifact cache location")
+    parser.add_argument("--stream", action="store_true",
+                        help="Feed segments straight into the scorer (no merged/trimmed/reference files)")
+    parser.add_argument("--sample", type=int, default=0, metavar="N",
+                        help="Score N windows spread over the whole video (VMAF shown with 95%% CI)")
+    add_budget_args(parser)
+    add_reference_args(parser)
+    add_scoring_args(parser)
+    args = parser.parse_args()
+    if args.display and not parse_size(args.display):
+        print(f"❌ --display expects WxH, got {args.display!r}")
         sys.exit(1)
 
-    orig_file = sys.argv[1]
-    mux_master = sys.argv[2]
-    local_master = sys.argv[3]
+    mux_master = args.mux_master
+    local_master = args.local_master
     
-    judge = QualityJudge(orig_file)
+    judge = QualityJudge(args.original, cache_dir=args.cache_dir, use_cache=not args.no_cache,
+                         ref_format=args.ref_format, score_at=args.score_at, display=args.display,
+                         vmaf_model=args.vmaf_model)
+    src_w, src_h = judge.source_size
+    where = "each rendition's own size" if judge.score_at == "native" else "{}x{}".format(*judge.display_size)
+    print(f"📐 Scoring at {where} (source {src_w}x{src_h}, VMAF model {judge.vmaf_model or 'auto'})")
     
     print("🔍 Parsing Playlists...")
     mux_variants = judge.get_master_variants(mux_master)
@@ -205,66 +412,15 @@ def main():
         print("❌ No common resolutions found!")
         sys.exit(1)
         
-    results_table = []
-    
-    for res in sorted(common_res, reverse=True):
-        print(f"\n⚔️  BATTLE ROUND: {res} ⚔️")
-        
-        # 1. Download Segments (نحمل عدد أكبر قليلاً لضمان تغطية الوقت)
-        # نحمل 12 قطعة من Mux (12 * 5 = 60s)
-        mux_ts_files = judge.download_segments(mux_variants[res], f"mux_{res}", limit=12)
-        # نحمل 15 قطعة من Local (15 * 4 = 60s) - لضمان أننا نغطي نفس المدة
-        local_ts_files = judge.download_segments(local_variants[res], f"local_{res}", limit=15)
-
-        mux_merged = judge.concat_segments(mux_ts_files, f"mux_{res}")
-        local_merged = judge.concat_segments(local_ts_files, f"local_{res}")
-        
-        if not mux_merged or not local_merged:
-            print("   ⚠️ Skipping due to missing segments.")
-            continue
-            
-        # 2. Time Normalization (التعديل الجديد والمهم) ⏱️
-        # نحسب مدة كل ملف
-        dur_mux = judge.get_duration(mux_merged)
-        dur_loc = judge.get_duration(local_merged)
-        
-        # نختار المدة الأقصر لنحاكم الجميع عليها
-        test_duration = min(dur_mux, dur_loc)
-        print(f"   ⏱️  Normalizing test duration to: {test_duration:.2f} seconds")
+    budget = CoreBudget(cpus=args.cpus, jobs=args.jobs)
+    jobs, vmaf_threads = budget.plan(len(common_res))
+    print(f"🧮 Core budget: {budget.cpus} CPUs -> {jobs} parallel round(s) x {vmaf_threads} libvmaf threads")
 
-        # 3. Prepare Reference (Cut exact duration)
-        reference = judge.prepare_reference(test_duration, f"ref_{res}")
-        
-        # دالة مساعدة لقص الملفات المدمجة إذا كانت أطول من اللازم
-        def trim_to_duration(input_path, duration, output_suffix):
-            output = input_path.replace(".ts", f"_{output_suffix}.ts")
-            cmd = ["ffmpeg", "-y", "-v", "error", "-i", input_path, "-t", str(duration), "-c", "copy", output]
-            subprocess.run(cmd)
-            return output
-
-        # نقوم بقص الملفات المدمجة لتطابق المرجع تماماً
-        mux_final = trim_to_duration(mux_merged, test_duration, "trimmed")
-        local_final = trim_to_duration(local_merged, test_duration, "trimmed")
-        
-        # 4. Fight!
-        print(f"   🥊 Assessing Mux Quality...")
-        mux_vmaf, mux_ssim = judge.run_vmaf_ssim(mux_final, reference)
-        
-        print(f"   🥊 Assessing Local Quality...")
-        loc_vmaf, loc_ssim = judge.run_vmaf_ssim(local_final, reference)
-        
-        # Determine Winner
-        diff = loc_vmaf - mux_vmaf
-        if diff > 0.5: winner = "LOCAL 🏆" # قللنا الهامش ليكون أكثر دقة
-        elif diff < -0.5: winner = "MUX 👑"
-        else: winner = "DRAW 🤝"
-        
-        results_table.append([
-            res, 
-            f"{mux_vmaf:.2f}", f"{mux_ssim:.4f}",
-            f"{loc_vmaf:.2f}", f"{loc_ssim:.4f}",
-            winner
-        ])
+    judge_args = (judge.original_file, judge.work_dir, judge.cache_dir, judge.use_cache, judge.ref_format,
+                  judge.score_at, judge.display, judge.vmaf_model)
+    tasks = [(res, mux_variants[res], local_variants[res], judge_args, vmaf_threads, args.stream, args.sample)
+             for res in sorted(common_res, reverse=True)]
+    results_table = [row for row in budget.map(compare_rendition, tasks) if row]
     
     print("\n\n" + "="*80)
     print("                      FINAL QUALITY VERDICT")
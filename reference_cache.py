@@ -0,0 +1,196 @@
+import os
+import subprocess
+from dataclasses import dataclass
+import numpy as np
+from segment_cache import derive_key
+from probe_service import ProbeService
+
+# ==============================================================================
+#  REFERENCE CACHE: THE ORIGINAL DECODED ONCE PER (WINDOW, SCORING SIZE)
+# ==============================================================================
+#
+# Every comparison used to decode (and, for prepare_reference, re-encode with
+# x264) the original again. Here each (source, start, duration, size) window is
+# decoded once, scaled to the scoring size when it differs from the source, and
+# stored in the SegmentCache as:
+#
+#   ffv1  lossless FFV1 in Matroska: ~3-5x smaller than raw, cheap intra decode
+#   yuv   raw yuv420p frames: zero decode cost, readable as a numpy memmap
+#
+# Raw frames carry no timestamps and are read back at a constant -framerate,
+# so yuv windows go through fps= at decode time: a VFR source becomes truly
+# CFR instead of drifting against the distorted side. Raw 1080p is ~5.6 GB a
+# minute; a yuv window that would take more than YUV_CACHE_SHARE of the
+# SegmentCache is stored as ffv1 instead (it would only evict itself).
+#
+# All sizes missing for one window are produced from a single decode (split).
+# A later comparison reads the frames directly: no H.264 decode, no seek, no
+# reference-side scaling.
+
+FORMATS = ("ffv1", "yuv")
+PIX_FMT = "yuv420p"
+SCALER = "bicubic"   # same scaler the ScoringEngine uses on the distorted side
+YUV_CACHE_SHARE = 0.5   # largest share of the cache one raw window may take
+
+
+@dataclass
+class ReferenceClip:
+    path: str
+    size: tuple
+    fps: float
+    fmt: str
+    key: str = ""
+    cached: bool = False
+
+    def input_opts(self):
+        """ffmpeg options placed before -i (raw frames carry no header)"""
+        if self.fmt != "yuv":
+            return []
+        w, h = self.size
+        return ["-f", "rawvideo", "-pix_fmt", PIX_FMT, "-video_size", f"{w}x{h}", "-framerate", f"{self.fps:.6f}"]
+
+    def frames(self):
+        """Raw clips as a read-only (n_frames, bytes per frame) memmap; pages load on access"""
+        if self.fmt != "yuv":
+            raise ValueError("frames() needs a raw yuv reference")
+        w, h = self.size
+        return np.memmap(self.path, dtype=np.uint8, mode="r").reshape(-1, w * h * 3 // 2)
+
+
+class ReferenceCache:
+    """
+    refs = ReferenceCache(original, work_dir, cache)
+    refs.get(0.0, 60.0, (1280, 720))                       # -> ReferenceClip (None if the decode failed)
+    refs.get_many([(0.0, 60.0, (1920, 1080)), (0.0, 60.0, (854, 480))])
+    """
+
+    def __init__(self, source, work_dir, cache=None, fmt="ffv1", probes=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown reference format {fmt!r} (expected one of {FORMATS})")
+        self.source = source
+        self.work_dir = work_dir
+        self.cache = cache
+        self.fmt = fmt
+        self.probes = probes or ProbeService(persist=False)
+        self.decodes = 0   # decodes of the original done by this instance
+
+    @property
+    def source_size(self):
+        video = self.probes.video(self.source)
+        return int(video.get("width", 0)), int(video.get("height", 0))
+
+    @property
+    def fps(self):
+        return self.probes.fps(self.source) or 30.0
+
+    def _format(self, duration, size):
+        """yuv unless the raw window would crowd the SegmentCache out; ffv1 then"""
+        if self.fmt != "yuv" or not self.cache:
+            return self.fmt
+        raw_bytes = size[0] * size[1] * 3 // 2 * self.fps * duration
+        if raw_bytes <= self.cache.max_bytes * YUV_CACHE_SHARE:
+            return "yuv"
+        print(f"   ⚠️ Raw {size[0]}x{size[1]} reference for {duration:.0f}s is {raw_bytes / 1024 ** 3:.1f} GiB "
+              f"(cache {self.cache.max_bytes / 1024 ** 3:.0f} GiB): storing it as ffv1")
+        return "ffv1"
+
+    def _key(self, start, duration, size, fmt):
+        source_key = self.cache.file_key(self.source) if self.cache else os.path.realpath(self.source)
+        # raw frames are resampled to a constant rate, which is part of what is stored
+        rate = f"{self.fps:.6f}" if fmt == "yuv" else ""
+        return derive_key("reference-frames", fmt, PIX_FMT, SCALER, rate, source_key,
+                          f"{start:.3f}", f"{duration:.3f}", f"{size[0]}x{size[1]}")
+
+    def _clip(self, key, size, fmt):
+        ext = ".yuv" if fmt == "yuv" else ".mkv"
+        path = os.path.join(self.work_dir, f"ref_{key[:16]}{ext}")
+        return ReferenceClip(path, tuple(size), self.fps, fmt, key)
+
+    # --- LOOKUP ---
+    def get(self, start, duration, size=None):
+        return self.get_many([(start, duration, size)])[(start, duration, size)]
+
+    def get_many(self, requests):
+        """
+        {(start, duration, size): ReferenceClip}; size None = the source's own size.
+        Misses of the same window are built together from one decode; a window whose
+        decode failed maps to None, and callers read the original for it instead.
+        """
+        clips, missing = {}, {}
+        for start, duration, size in requests:
+            target = tuple(size) if size else self.source_size
+            fmt = self._format(duration, target)
+            key = self._key(start, duration, target, fmt)
+            clip = self._clip(key, target, fmt)
+            if self.cache and self.cache.fetch_into(key, clip.path):
+                clip.cached = True
+            elif not (os.path.exists(clip.path) and os.path.getsize(clip.path) > 0):
+                missing.setdefault((start, duration), []).append((key, clip))
+            clips[(start, duration, size)] = clip
+
+        failed = set()
+        for (start, duration), group in missing.items():
+            failed |= self._build(start, duration, group)
+        return {req: None if clip.key in failed else clip for req, clip in clips.items()}
+
+    # --- BUILD ---
+    @staticmethod
+    def _tmp(clip):
+        """Per-process temp name: parallel rounds may build the same window at once"""
+        return f"{clip.path}.{os.getpid()}.tmp"
+
+    def _build(self, start, duration, group):
+        """Decodes one window into every clip of `group`; returns the keys that failed"""
+        native = self.source_size
+        os.makedirs(self.work_dir, exist_ok=True)
+        cmd = ["ffmpeg", "-y", "-v", "error", "-nostdin"]
+        if start > 0:
+            cmd += ["-ss", f"{start:.3f}"]
+        cmd += ["-t", f"{duration:.3f}", "-i", self.source]
+
+        graph = [f"[0:v]setpts=PTS-STARTPTS,split={len(group)}" + "".join(f"[s{n}]" for n in range(len(group)))]
+        outputs = []
+        for n, (key, clip) in enumerate(group):
+            w, h = clip.size
+            scale = "" if clip.size == native else f"scale={w}:{h}:flags={SCALER},"
+            # same rate input_opts() reads it back at: a VFR source comes out CFR, not drifting
+            rate = f"fps={clip.fps:.6f}," if clip.fmt == "yuv" else ""
+            graph.append(f"[s{n}]{rate}{scale}format={PIX_FMT}[r{n}]")
+            if clip.fmt == "yuv":
+                codec = ["-f", "rawvideo"]
+            else:
+                # intra-only, sliced: every frame decodes independently across threads
+                # (-f: the .tmp suffix hides the container from ffmpeg's extension guess)
+                codec = ["-c:v", "ffv1", "-level", "3", "-g", "1", "-slices", "16", "-slicecrc", "0",
+                         "-f", "matroska"]
+            outputs += ["-map", f"[r{n}]", *codec, "-an", self._tmp(clip)]
+        cmd += ["-filter_complex", ";".join(graph), *outputs]
+
+        print(f"   🎞️  Decoding reference {start:.1f}s+{duration:.1f}s once -> "
+              f"{', '.join(f'{c.size[0]}x{c.size[1]} ({c.fmt})' for _, c in group)}")
+        result = subprocess.run(cmd)
+        self.decodes += 1
+        failed = set()
+        for key, clip in group:
+            tmp = self._tmp(clip)
+            if result.returncode != 0 or not os.path.exists(tmp) or os.path.getsize(tmp) == 0:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                print(f"   ⚠️ Reference decode failed for {clip.size[0]}x{clip.size[1]} at {start:.3f}s: "
+                      f"reading the original instead")
+                failed.add(key)
+                continue
+            os.replace(tmp, clip.path)
+            if self.cache:
+                self.cache.put(key, clip.path)
+        return failed
+
+
+def make_reference_cache(source, work_dir, cache, fmt, probes=None):
+    """None for --ref-format off (the original is decoded by every comparison, as before)"""
+    return None if fmt == "off" else ReferenceCache(source, work_dir, cache, fmt, probes)
+
+
+def add_reference_args(parser):
+    parser.add_argument("--ref-format", default="ffv1", choices=[*FORMATS, "off"],
+                        help="Decoded reference cache: ffv1 (compact), yuv (raw, fastest reads) or off")
@@ -0,0 +1,301 @@
+import os
+import time
+import subprocess
+from dataclasses import dataclass, field
+from segment_cache import derive_key, detach
+from frame_metrics import FrameMetrics
+from probe_service import ProbeService
+
+# ==============================================================================
+#  SCORING ENGINE: ONE REFERENCE DECODE -> VMAF/PSNR/SSIM FOR EVERY RENDITION
+# ==============================================================================
+
+DEFAULT_REF_SIZE = (1920, 1080)   # only when the reference cannot be probed
+
+# Where renditions are scored:
+#   display  every rendition upscaled to one display size (the source's own size by default)
+#   native   each rendition at its own resolution against a downscaled reference
+SCORE_MODES = ("display", "native")
+# libvmaf models in filter-option syntax; "phone" is the v0.6.1 model with the phone transform
+VMAF_MODELS = {
+    "hd": "version=vmaf_v0.6.1",
+    "phone": "version=vmaf_v0.6.1\\:enable_transform=true",
+    "4k": "version=vmaf_4k_v0.6.1",
+}
+
+
+def parse_size(text):
+    """'1280x720' -> (1280, 720); None for anything else (e.g. 'N/A')"""
+    w, _, h = str(text or "").lower().partition("x")
+    return (int(w), int(h)) if w.isdigit() and h.isdigit() else None
+
+
+def probe_size(path, probes=None):
+    """(width, height) of the first video stream, falling back to DEFAULT_REF_SIZE"""
+    video = (probes or ProbeService(persist=False)).video(path)
+    w, h = int(video.get("width", 0) or 0), int(video.get("height", 0) or 0)
+    return (w, h) if w and h else DEFAULT_REF_SIZE
+
+
+def default_model(size):
+    return "4k" if size[1] >= 2160 else "hd"
+
+
+def scoring_size(mode, display_size, rendition_size):
+    """Scoring resolution of one rendition (native falls back to the display size when unknown)"""
+    if mode == "native" and rendition_size:
+        return tuple(rendition_size)
+    return tuple(display_size)
+
+
+# --- REPORT HELPERS (None = the metrics of that label failed; shown as N/A, never as 0) ---
+def metric(scores, name):
+    return getattr(scores, name) if scores is not None else None
+
+
+def fmt(value, spec):
+    return format(value, spec) if value is not None else "N/A"
+
+
+def add_scoring_args(parser):
+    parser.add_argument("--score-at", default="display", choices=SCORE_MODES,
+                        help="display: upscale renditions to --display; native: score each at its own size")
+    parser.add_argument("--display", default=None, metavar="WxH",
+                        help="Display resolution for --score-at display (default: the original's size)")
+    parser.add_argument("--vmaf-model", default=None, choices=list(VMAF_MODELS),
+                        help="VMAF model (default: 4k for 2160p+ scoring sizes, hd otherwise)")
+
+
+def concat_input(paths):
+    """
+    MPEG-TS segments are byte-concatenable, so the concat protocol feeds them to
+    ffmpeg as one continuous stream without writing a merged file first.
+    fMP4 segments (init + fragment per file) are not: they go through a small
+    ffconcat list instead. Returns (input options, input).
+    """
+    if not any(p.endswith(".mp4") for p in paths):
+        return [], "concat:" + "|".join(os.path.abspath(p) for p in paths)
+    abs_paths = [os.path.abspath(p) for p in paths]
+    list_path = os.path.join(os.path.dirname(abs_paths[0]),
+                             f"concat_{derive_key('ffconcat', *abs_paths)[:16]}.ffconcat")
+    with open(list_path, "w") as f:
+        f.write("ffconcat version 1.0\n" + "".join(f"file '{p}'\n" for p in abs_paths))
+    return ["-f", "concat", "-safe", "0"], list_path
+
+
+@dataclass
+class MetricScores:
+    vmaf: float = 0.0
+    psnr: float = 0.0
+    ssim: float = 0.0
+    vmaf_harmonic: float = 0.0
+    vmaf_p1: float = 0.0
+    vmaf_p5: float = 0.0
+    log_path: str = ""
+    cached: bool = False
+    frames: FrameMetrics = None   # per-frame series for worst-window localisation
+
+
+@dataclass
+class ScoreResult:
+    reference: str
+    scores: dict = field(default_factory=dict)   # label -> MetricScores
+    reference_decodes: int = 0
+    elapsed: float = 0.0
+
+    def __getitem__(self, label):
+        """KeyError when the label's metrics failed: a failure must never read as VMAF 0"""
+        return self.scores[label]
+
+    def get(self, label):
+        """The label's scores, or None when its metrics failed (never a zero-filled MetricScores)"""
+        return self.scores.get(label)
+
+
+@dataclass
+class _Distorted:
+    label: str
+    path: object    # a file, or a list of segments streamed through concat_input()
+    duration: float
+    ref_start: float = 0.0    # where this window starts in the reference
+    dist_offset: float = 0.0  # where it starts inside the distorted input
+    size: tuple = None        # scoring size; None = the engine's ref_size
+
+    @property
+    def input_spec(self):
+        """(input options, input) for ffmpeg"""
+        return concat_input(self.path) if isinstance(self.path, (list, tuple)) else ([], self.path)
+
+    @property
+    def files(self):
+        return list(self.path) if isinstance(self.path, (list, tuple)) else [self.path]
+
+
+class ScoringEngine:
+    """
+    Decodes the reference once and fans it out with `split` to one libvmaf
+    instance per distorted input (PSNR and SSIM are computed by libvmaf itself).
+    Sampled windows (ref_start > 0) each get their own fast-seeked reference input.
+    With a ReferenceCache the reference inputs are pre-decoded (and pre-scaled)
+    clips instead of the original: no H.264 decode or seek on the reference side.
+
+    engine = ScoringEngine(original, work_dir)
+    engine.add("mux_1920x1080", mux_ts, 60.0)           # a merged .ts
+    engine.add("loc_1920x1080", [seg0, seg1, ...], 60.0)  # or the raw segments
+    result = engine.run()
+    """
+
+    def __init__(self, reference, work_dir, ref_size=None, n_threads=4, cache=None, runner=None,
+                 ref_cache=None, score_size=None, model=None):
+        self.reference = reference
+        self.work_dir = work_dir
+        self.ref_size = tuple(ref_size) if ref_size else probe_size(reference)   # the original's own size
+        self.score_size = tuple(score_size) if score_size else self.ref_size   # default scoring size
+        self.model = model   # VMAF_MODELS key; None = default_model() of each scoring size
+        self.n_threads = n_threads
+        self.cache = cache
+        self.runner = runner or subprocess.run   # runs the ffmpeg command (bench_suite measures it)
+        self.ref_cache = ref_cache
+        self.items = []
+
+    def add(self, label, path, duration, ref_start=0.0, dist_offset=0.0, size=None):
+        self.items.append(_Distorted(label, path, duration, ref_start, dist_offset, size))
+
+    def _size(self, item):
+        return tuple(item.size or self.score_size)
+
+    def _model(self, item):
+        return self.model or default_model(self._size(item))
+
+    def _log_path(self, item):
+        return os.path.join(self.work_dir, f"{item.label}_metrics.csv")
+
+    def _cache_key(self, item):
+        w, h = self._size(item)
+        return derive_key("metrics-csv", f"{w}x{h}-bicubic", self._model(item), item.duration, item.ref_start, item.dist_offset,
+                          self.cache.file_key(self.reference), *[self.cache.file_key(p) for p in item.files])
+
+    def _windows(self, items):
+        """Reference inputs: one per (window start, scoring size) -> the items sharing it"""
+        windows = {}
+        for item in items:
+            windows.setdefault((item.ref_start, self._size(item)), []).append(item)
+        return windows
+
+    def reference_clips(self, items):
+        """Pre-decoded reference clip per window from the ReferenceCache (built on a miss)"""
+        windows = self._windows(items)
+        requests = {key: (key[0], max(i.duration for i in group), key[1]) for key, group in windows.items()}
+        clips = self.ref_cache.get_many(list(requests.values()))
+        return {key: clips[req] for key, req in requests.items()}
+
+    def build_command(self, items, ref_clips=None):
+        """
+        One ffmpeg: one reference input per distinct window start and scoring size
+        (fast-seeked with -ss before -i, or a cached clip), split across every
+        distorted clip that shares that window.
+        """
+        windows = self._windows(items)
+
+        cmd = ["ffmpeg", "-y", "-v", "error"]
+        for (start, size), group in windows.items():
+            clip = ref_clips.get((start, size)) if ref_clips else None
+            if clip:
+                cmd += [*clip.input_opts(), "-i", clip.path]
+                continue
+            if start > 0:
+                cmd += ["-ss", f"{start:.3f}"]
+            cmd += ["-t", f"{max(i.duration for i in group):.3f}", "-i", self.reference]
+        for item in items:
+            input_opts, input_path = item.input_spec
+            cmd += ["-t", f"{item.dist_offset + item.duration:.3f}", *input_opts, "-i", input_path]
+
+        graph = []
+        ref_labels = {}
+        for g, ((start, size), group) in enumerate(windows.items()):
+            labels = [f"ref{g}_{k}" for k in range(len(group))]
+            # Without a cached clip the original is scaled here when the scoring size differs from ref_size
+            scale = ""
+            if not (ref_clips and ref_clips.get((start, size))) and size != tuple(self.ref_size):
+                scale = f"scale={size[0]}:{size[1]}:flags=bicubic,"
+            graph.append(f"[{g}:v]setpts=PTS-STARTPTS,{scale}split={len(group)}" + "".join(f"[{l}]" for l in labels))
+            for item, label in zip(group, labels):
+                ref_labels[id(item)] = label
+
+        maps = []
+        for n, item in enumerate(items):
+            log_path = self._log_path(item)
+            dist_in = len(windows) + n
+            graph.append(f"[{ref_labels[id(item)]}]trim=duration={item.duration:.3f},setpts=PTS-STARTPTS[refc{n}]")
+            trim = ""
+            if item.dist_offset > 0:
+                trim = f"setpts=PTS-STARTPTS,trim=start={item.dist_offset:.3f}:duration={item.duration:.3f},"
+            w, h = self._size(item)
+            graph.append(f"[{dist_in}:v]{trim}scale={w}:{h}:flags=bicubic,setpts=PTS-STARTPTS[dist{n}]")
+            graph.append(
+                f"[dist{n}][refc{n}]libvmaf=log_path={log_path}:log_fmt=csv:n_threads={self.n_threads}"
+                f":model={VMAF_MODELS[self._model(item)]}:feature=name=psnr|name=float_ssim[out{n}]"
+            )
+            maps += ["-map", f"[out{n}]"]
+        return cmd + ["-filter_complex", ";".join(graph)] + maps + ["-f", "null", "-"]
+
+    @staticmethod
+    def read_scores(log_path, duration):
+        try:
+            frames = FrameMetrics.load_csv(log_path, duration)
+        except (OSError, ValueError):
+            return None
+        if not frames.n_frames:
+            return None
+        vmaf = frames.pooled("vmaf")
+        return MetricScores(
+            vmaf=vmaf["mean"],
+            psnr=frames.pooled("psnr")["mean"],
+            ssim=frames.pooled("ssim")["mean"],
+            vmaf_harmonic=vmaf["harmonic"],
+            vmaf_p1=vmaf["p1"],
+            vmaf_p5=vmaf["p5"],
+            log_path=log_path,
+            frames=frames,
+        )
+
+    def run(self):
+        result = ScoreResult(reference=self.reference)
+        start = time.perf_counter()
+
+        # Anything scored before against the same reference window comes from the cache
+        pending = []
+        for item in self.items:
+            if self.cache and self.cache.fetch_into(self._cache_key(item), self._log_path(item)):
+                scores = self.read_scores(self._log_path(item), item.duration)
+                if scores:
+                    scores.cached = True
+                    result.scores[item.label] = scores
+                    continue
+            pending.append(item)
+
+        if pending:
+            ref_clips = None
+            if self.ref_cache:
+                decodes = self.ref_cache.decodes
+                ref_clips = self.reference_clips(pending)
+                result.reference_decodes = self.ref_cache.decodes - decodes
+            else:
+                result.reference_decodes = len(self._windows(pending))
+            # A log left by an earlier run (or a cache object linked here) must not be read back
+            # as this run's score when libvmaf fails, nor rewritten in place when it succeeds
+            for item in pending:
+                detach(self._log_path(item))
+            print(f"   🧪 Scoring {len(pending)} clip(s) in one ffmpeg pass...")
+            self.runner(self.build_command(pending, ref_clips))
+            for item in pending:
+                scores = self.read_scores(self._log_path(item), item.duration)
+                if not scores:
+                    print(f"   ⚠️ Metrics failed for {item.label}")
+                    continue
+                result.scores[item.label] = scores
+                if self.cache:
+                    self.cache.put(self._cache_key(item), self._log_path(item))
+
+        result.elapsed = time.perf_counter() - start
+        return result
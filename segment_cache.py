@@ -0,0 +1,194 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+
+# ==============================================================================
+#  SEGMENT CACHE: CONTENT-ADDRESSED ARTIFACT STORE WITH LRU EVICTION
+# ==============================================================================
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "JUDGE_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "streaming-judge")
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("JUDGE_CACHE_MAX_BYTES", 10 * 1024 ** 3))  # 10 GiB
+HASH_BLOCK = 4 * 1024 * 1024
+READ_ONLY = 0o444   # cache objects (and the work-dir hard links to them)
+
+
+def derive_key(*parts):
+    """Key for a derived artifact (concat, trim, reference cut) built from its inputs"""
+    h = hashlib.sha256()
+    for p in parts:
+        h.update(str(p).encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def detach(path):
+    """
+    Removes path before a tool writes to it. After put() or a cache hit, a work file
+    is a hard link to a cache object: ffmpeg -y or open(path, "wb") would rewrite that
+    object in place (root ignores the read-only mode), so writers unlink first.
+    """
+    if os.path.lexists(path):
+        os.remove(path)
+
+
+class SegmentCache:
+    """
+    Persistent store for playlists, segments and intermediate files.
+    Remote objects are keyed by URL + ETag/Last-Modified, local files by content hash.
+    Objects are hard-linked into the work dir, so a cache hit costs no I/O. Objects
+    are read-only and the work-dir links share them: callers detach() a path before
+    writing to it, never write through it.
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"),
+                                   timeout=30, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY, path TEXT, size INTEGER, last_used REAL)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS file_keys (
+                path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, key TEXT)""")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS url_keys (
+                url TEXT PRIMARY KEY, key TEXT, checked REAL)""")
+
+    # --- KEYS ---
+    @staticmethod
+    def url_key(url, headers):
+        """None when the server gives us no validator (then we cannot trust a hit)"""
+        etag = headers.get("ETag")
+        modified = headers.get("Last-Modified")
+        if not etag and not modified:
+            return None
+        return derive_key("url", url, etag or "", modified or "")
+
+    def file_key(self, path):
+        """Content hash of a local file, memoized on (path, size, mtime)"""
+        st = os.stat(path)
+        real = os.path.realpath(path)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT key FROM file_keys WHERE path=? AND size=? AND mtime_ns=?",
+                (real, st.st_size, st.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                h.update(block)
+        key = h.hexdigest()
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO file_keys VALUES (?, ?, ?, ?)",
+                             (real, st.st_size, st.st_mtime_ns, key))
+        return key
+
+    def known_url_key(self, url, ttl):
+        """url_key() of a URL validated less than ttl seconds ago (no request), else None"""
+        if ttl <= 0:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT key FROM url_keys WHERE url=? AND checked>?",
+                                   (url, time.time() - ttl)).fetchone()
+        return row[0] if row else None
+
+    def remember_url_key(self, url, key):
+        if key is None:
+            return
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO url_keys VALUES (?, ?, ?)", (url, key, time.time()))
+
+    # --- LOOKUP / STORE ---
+    def get(self, key):
+        """Returns the cached object path (and marks it as recently used) or None"""
+        if key is None:
+            return None
+        with self._lock, self._db:
+            row = self._db.execute("SELECT path FROM entries WHERE key=?", (key,)).fetchone()
+            if not row:
+                return None
+            if not os.path.exists(row[0]):
+                self._db.execute("DELETE FROM entries WHERE key=?", (key,))
+                return None
+            self._db.execute("UPDATE entries SET last_used=? WHERE key=?", (time.time(), key))
+            return row[0]
+
+    def fetch_into(self, key, dest):
+        """Materializes a cached object at dest. Returns True on a hit."""
+        cached = self.get(key)
+        if not cached:
+            return False
+        detach(dest)
+        try:
+            os.link(cached, dest)   # read-only alias of the object
+        except OSError:
+            shutil.copyfile(cached, dest)   # private copy (other device)
+        return True
+
+    def put(self, key, src_path):
+        """Adds a finished file to the store (hard link when possible) and evicts LRU entries"""
+        if key is None or not src_path or not os.path.exists(src_path):
+            return
+        if os.path.getsize(src_path) == 0:
+            return  # failed ffmpeg runs leave empty outputs; never cache those
+        ext = os.path.splitext(src_path)[1]
+        obj_path = os.path.join(self.objects_dir, key[:2], key + ext)
+        os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+        if not os.path.exists(obj_path):
+            tmp_path = f"{obj_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                os.link(src_path, tmp_path)   # src_path stays a link: it turns read-only with the object
+            except OSError:
+                shutil.copyfile(src_path, tmp_path)
+            os.chmod(tmp_path, READ_ONLY)
+            os.replace(tmp_path, obj_path)
+
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                             (key, obj_path, os.path.getsize(obj_path), time.time()))
+        self.evict()
+
+    def put_text(self, key, text, ext=".m3u8"):
+        """Stores a small text object (playlists)"""
+        if key is None:
+            return
+        tmp_path = os.path.join(self.objects_dir, f"{key}.{os.getpid()}.{threading.get_ident()}{ext}")
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        self.put(key, tmp_path)
+        os.remove(tmp_path)
+
+    def get_text(self, key):
+        cached = self.get(key)
+        if not cached:
+            return None
+        with open(cached) as f:
+            return f.read()
+
+    # --- EVICTION ---
+    def evict(self):
+        """Drops least recently used objects until the store fits in max_bytes"""
+        with self._lock, self._db:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            rows = self._db.execute("SELECT key, path, size FROM entries ORDER BY last_used").fetchall()
+            for key, path, size in rows:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self._db.execute("DELETE FROM entries WHERE key=?", (key,))
+                total -= size
@@ -0,0 +1,289 @@
+import os
+import time
+import threading
+import m3u8
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+from requests.adapters import HTTPAdapter
+from segment_cache import derive_key, detach
+
+# ==============================================================================
+#  SEGMENT FETCHER: POOLED KEEP-ALIVE SESSION + PARALLEL DOWNLOADS
+# ==============================================================================
+
+CHUNK_SIZE = 1024 * 1024          # 1 MiB network reads
+WRITE_BUFFER = 4 * 1024 * 1024    # 4 MiB file buffer
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# A published segment URL is not rewritten in place (new content gets a new URL), so its
+# validators are trusted this long before the next HEAD; playlists are revalidated every time
+VALIDATOR_TTL = 24 * 3600
+
+
+def parse_byterange(spec, next_offset=0):
+    """EXT-X-BYTERANGE "length[@offset]" -> (offset, length); no offset = right after the previous range"""
+    length, _, offset = str(spec).partition("@")
+    return (int(offset) if offset else next_offset), int(length)
+
+
+def range_header(byterange):
+    offset, length = byterange
+    return f"bytes={offset}-{offset + length - 1}"
+
+
+def segment_refs(playlist, playlist_url):
+    """
+    Where every segment's bytes live: [(uri, byterange, init)] in playlist order.
+    byterange is (offset, length) or None (whole object); init is (uri, byterange)
+    of the EXT-X-MAP initialization section (fMP4/CMAF) or None (MPEG-TS).
+    """
+    refs, next_offset = [], {}
+    for seg in playlist.segments:
+        uri = resolve_uri(playlist_url, seg.uri)
+        byterange = None
+        if seg.byterange:
+            byterange = parse_byterange(seg.byterange, next_offset.get(uri, 0))
+            next_offset[uri] = byterange[0] + byterange[1]
+        init = None
+        if seg.init_section is not None and seg.init_section.uri:
+            init_range = parse_byterange(seg.init_section.byterange) if seg.init_section.byterange else None
+            init = (resolve_uri(playlist_url, seg.init_section.uri), init_range)
+        refs.append((uri, byterange, init))
+    return refs
+
+
+def segment_ext(refs):
+    """Local extension for fetched segments: fMP4 fragments are stored with their init as .mp4"""
+    return ".mp4" if any(init for _, _, init in refs) else ".ts"
+
+
+def segment_jobs(playlist, playlist_url, folder, indexes=None, name="seg_{:03d}"):
+    """fetch_all() jobs for the given segment indexes (all by default) of a parsed playlist"""
+    refs = segment_refs(playlist, playlist_url)
+    ext = segment_ext(refs)
+    indexes = range(len(refs)) if indexes is None else indexes
+    return [(refs[i][0], os.path.join(folder, name.format(i) + ext), refs[i][1], refs[i][2]) for i in indexes]
+
+
+def resolve_uri(base, uri):
+    """Resolves a playlist entry against its parent playlist (URL or local path)"""
+    if uri.startswith("http"):
+        return uri
+    if base.startswith("http"):
+        return urljoin(base, uri)
+    if os.path.isabs(uri):
+        return uri
+    return os.path.join(os.path.dirname(base), uri)
+
+
+class SegmentFetcher:
+    """
+    Shared download layer for the judges and the Mux analyzer.
+    One requests.Session (keep-alive, pooled) is reused by a bounded thread pool.
+    """
+
+    def __init__(self, max_workers=8, retries=3, backoff=0.5, timeout=15, cache=None, validator_ttl=VALIDATOR_TTL):
+        self.cache = cache  # optional SegmentCache shared across runs
+        self.validator_ttl = validator_ttl  # seconds a segment's HEAD result is reused (0 = every fetch)
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.last_elapsed = 0.0
+        self._inits = {}    # (uri, byterange) -> init section bytes, fetched once per rendition
+        self._init_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    # --- PLAYLISTS ---
+    def load_playlist(self, uri):
+        """Loads an m3u8 over the pooled session (local paths go through m3u8 directly)"""
+        if not uri.startswith("http"):
+            return m3u8.load(uri)
+        key = self._remote_key(uri)
+        text = self.cache.get_text(key) if key else None
+        if text is None:
+            r = self.session.get(uri, timeout=self.timeout)
+            r.raise_for_status()
+            text = r.text
+            if key:
+                self.cache.put_text(key, text)
+        return m3u8.loads(text, uri=uri)
+
+    def _remote_key(self, url, ttl=0):
+        """
+        Cache key from a HEAD request (None without a cache or without validators).
+        ttl > 0 reuses the key of a HEAD done less than ttl seconds ago instead.
+        """
+        if not self.cache:
+            return None
+        key = self.cache.known_url_key(url, ttl)
+        if key:
+            return key
+        try:
+            r = self.session.head(url, timeout=self.timeout, allow_redirects=True)
+            if r.status_code != 200:
+                return None
+            key = self.cache.url_key(url, r.headers)
+        except requests.RequestException:
+            return None
+        self.cache.remember_url_key(url, key)
+        return key
+
+    def content_length(self, uri, byterange=None):
+        """Segment size without downloading it (byte range, HEAD for URLs, stat for local files)"""
+        if byterange:
+            return byterange[1]
+        if not uri.startswith("http"):
+            return os.path.getsize(uri) if os.path.exists(uri) else 0
+        try:
+            r = self.session.head(uri, timeout=self.timeout, allow_redirects=True)
+            return int(r.headers.get("Content-Length", 0)) if r.status_code == 200 else 0
+        except (requests.RequestException, ValueError):
+            return 0
+
+    # --- SINGLE SEGMENT ---
+    def fetch(self, uri, local_path, byterange=None, init=None):
+        """
+        Fetches one segment to local_path.
+        byterange: (offset, length) inside uri (EXT-X-BYTERANGE, single-file renditions)
+        init: (uri, byterange) of the fMP4 init section, written ahead of the fragment so
+              the local file is a standalone MP4 that ffprobe/ffmpeg can open on its own
+        Returns a stats dict (path, bytes, seconds, mbps) or None on failure.
+        """
+        start = time.perf_counter()
+        cached = False
+        if uri.startswith("http"):
+            key = self._remote_key(uri, self.validator_ttl)
+            if key and (byterange or init):
+                key = derive_key("range", key, byterange, init)
+            cached = bool(key) and self.cache.fetch_into(key, local_path)
+            ok = cached or self._download(uri, local_path, byterange, self._init_bytes(init))
+            if ok and key and not cached:
+                self.cache.put(key, local_path)
+        elif byterange or init:
+            ok = self._copy_local(uri, local_path, byterange, self._init_bytes(init))
+        else:
+            ok = self._link_local(uri, local_path)
+        if not ok:
+            return None
+
+        elapsed = time.perf_counter() - start
+        size = os.path.getsize(local_path)
+        return {
+            "path": local_path,
+            "bytes": size,
+            "seconds": elapsed,
+            "mbps": (size * 8 / 1e6) / elapsed if elapsed > 0 else 0.0,
+            "cached": cached,
+        }
+
+    def _init_bytes(self, init):
+        """Init section bytes (b"" for none), read once and shared by every fragment"""
+        if not init:
+            return b""
+        with self._init_lock:
+            if init not in self._inits:
+                uri, byterange = init
+                self._inits[init] = self._read_bytes(uri, byterange)
+            return self._inits[init]
+
+    def _read_bytes(self, uri, byterange=None):
+        if uri.startswith("http"):
+            headers = {"Range": range_header(byterange)} if byterange else {}
+            r = self.session.get(uri, headers=headers, timeout=self.timeout)
+            r.raise_for_status()
+            return r.content
+        with open(uri, "rb") as f:
+            if not byterange:
+                return f.read()
+            f.seek(byterange[0])
+            return f.read(byterange[1])
+
+    def _download(self, url, local_path, byterange=None, prefix=b""):
+        headers = {"Range": range_header(byterange)} if byterange else {}
+        expected = 206 if byterange else 200
+        for attempt in range(self.retries + 1):
+            try:
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as r:
+                    if r.status_code == expected:
+                        tmp_path = local_path + ".part"
+                        with open(tmp_path, "wb", buffering=WRITE_BUFFER) as f:
+                            f.write(prefix)
+                            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                                f.write(chunk)
+                        os.replace(tmp_path, local_path)
+                        return True
+                    if r.status_code not in RETRY_STATUS:
+                        print(f"   ⚠️ HTTP {r.status_code} for {url}")
+                        return False
+            except requests.RequestException as e:
+                if attempt == self.retries:
+                    print(f"   ⚠️ Error downloading segment: {e}")
+                    return False
+            if attempt < self.retries:
+                time.sleep(self.backoff * (2 ** attempt))
+        return False
+
+    def _copy_local(self, src, local_path, byterange, prefix=b""):
+        """Byte-range segments of a local single-file rendition are sliced out (init first)"""
+        if not os.path.exists(src):
+            return False
+        data = self._read_bytes(src, byterange)
+        detach(local_path)
+        with open(local_path, "wb", buffering=WRITE_BUFFER) as f:
+            f.write(prefix)
+            f.write(data)
+        return True
+
+    @staticmethod
+    def _link_local(src, local_path):
+        """Local segments are hard-linked (or symlinked across devices), never copied"""
+        if not os.path.exists(src):
+            return False
+        detach(local_path)
+        try:
+            os.link(src, local_path)
+        except OSError:
+            os.symlink(os.path.abspath(src), local_path)
+        return True
+
+    # --- BATCH ---
+    def fetch_all(self, jobs):
+        """
+        jobs: list of (uri, local_path[, byterange, init]) tuples (see segment_jobs).
+        Returns stats in the same order as jobs (None for failed entries).
+        """
+        if not jobs:
+            return []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as pool:
+            results = list(pool.map(lambda job: self.fetch(*job), jobs))
+        self.last_elapsed = time.perf_counter() - start
+        return results
+
+    def fetch_playlist_segments(self, playlist_obj, playlist_url, folder, limit=None):
+        """Downloads the first `limit` segments of a parsed playlist into folder"""
+        os.makedirs(folder, exist_ok=True)
+        segments = playlist_obj.segments[:limit] if limit else playlist_obj.segments
+        jobs = segment_jobs(playlist_obj, playlist_url, folder, range(len(segments)))
+        results = self.fetch_all(jobs)
+        for seg, r in zip(segments, results):
+            if r:
+                r["duration"] = seg.duration  # EXTINF, lets callers skip probing
+        return results
+
+    def report(self, results, label):
+        """Prints per-segment throughput and the aggregate rate of the last batch"""
+        done = [r for r in results if r]
+        for r in done:
+            source = " [cache]" if r["cached"] else ""
+            print(f"      {os.path.basename(r['path'])}: "
+                  f"{r['bytes'] / 1024:.0f} KB in {r['seconds']:.2f}s ({r['mbps']:.1f} Mbps){source}")
+        total_bytes = sum(r["bytes"] for r in done)
+        rate = (total_bytes * 8 / 1e6) / self.last_elapsed if self.last_elapsed > 0 else 0.0
+        print(f"   ✅ Fetched {len(done)}/{len(results)} segments for {label} "
+              f"({total_bytes / 1024 / 1024:.1f} MB, ~{rate:.1f} Mbps aggregate)")
@@ -0,0 +1,199 @@
+import os
+import math
+import random
+from dataclasses import dataclass
+from segment_fetcher import segment_refs, segment_jobs
+from scoring_engine import MetricScores
+
+# ==============================================================================
+#  SEGMENT SAMPLER: STRATIFIED WINDOWS + FULL-VIDEO VMAF ESTIMATE
+# ==============================================================================
+
+# Two-sided 95% Student-t quantiles by degrees of freedom (falls back to 1.96)
+T_95 = {1: 12.71, 2: 4.30, 3: 3.18, 4: 2.78, 5: 2.57, 6: 2.45, 7: 2.36, 8: 2.31,
+        9: 2.26, 10: 2.23, 12: 2.18, 15: 2.13, 20: 2.09, 25: 2.06, 30: 2.04}
+
+
+def t_quantile(df):
+    if df <= 0:
+        return float("inf")
+    known = [d for d in T_95 if d <= df]
+    return T_95[max(known)] if df <= 30 else 1.96
+
+
+@dataclass
+class SampleWindow:
+    index: int           # segment index in the sampled playlist
+    start: float         # seconds from the start of the playlist
+    duration: float
+    weight: float        # estimator weight: stratum share / selection probability
+
+
+def timeline(durations):
+    """Start time of every segment"""
+    starts, t = [], 0.0
+    for d in durations:
+        starts.append(t)
+        t += d
+    return starts
+
+
+def stratified_pick(durations, n, sizes=None, seed=0):
+    """
+    Splits the playlist into n equal-count strata and picks one segment per stratum.
+    Without sizes the middle segment of each stratum is used (deterministic).
+    With sizes, the pick is random with probability proportional to segment bitrate,
+    which concentrates samples on complex content; the weights undo that bias.
+    """
+    total = len(durations)
+    n = max(1, min(n, total))
+    starts = timeline(durations)
+    rng = random.Random(seed)
+    windows = []
+    for k in range(n):
+        lo, hi = (k * total) // n, ((k + 1) * total) // n
+        stratum = list(range(lo, hi))
+        stratum_dur = sum(durations[lo:hi])
+        if sizes:
+            rates = [sizes[i] / durations[i] if durations[i] > 0 else 0.0 for i in stratum]
+            norm = sum(rates)
+            probs = [r / norm for r in rates] if norm > 0 else [1 / len(stratum)] * len(stratum)
+            i = rng.choices(stratum, weights=probs)[0]
+            prob = probs[stratum.index(i)]
+        else:
+            i = stratum[len(stratum) // 2]
+            prob = 1 / len(stratum)
+        windows.append(SampleWindow(i, starts[i], durations[i], stratum_dur / len(stratum) / prob))
+    return windows
+
+
+def covering_segments(durations, start, duration):
+    """Indexes of the segments spanning [start, start+duration) and the offset into the first"""
+    starts = timeline(durations)
+    end = start + duration
+    idx = [i for i, (s, d) in enumerate(zip(starts, durations)) if s < end and s + d > start]
+    if not idx:
+        return [], 0.0
+    return idx, start - starts[idx[0]]
+
+
+def estimate(values, weights, population=None):
+    """
+    Weighted (Hajek) mean of per-window scores with a 95% confidence interval.
+    `population` (total segment count) applies the finite-population correction.
+
+    stratified_pick draws one window per stratum, which leaves no within-stratum
+    spread to estimate, so the variance treats the windows as one unstratified
+    sample. That keeps the between-strata differences in it: the interval is
+    conservative (wider than the design's true one), never optimistic.
+    """
+    pairs = [(v, w) for v, w in zip(values, weights) if w > 0]
+    n = len(pairs)
+    if not n:
+        return {"mean": 0.0, "low": 0.0, "high": 0.0, "half_width": 0.0, "n": 0}
+    w_sum = sum(w for _, w in pairs)
+    mean = sum(v * w for v, w in pairs) / w_sum
+    if n == 1:
+        return {"mean": mean, "low": mean, "high": mean, "half_width": float("inf"), "n": 1}
+
+    # Linearised variance of the ratio estimator
+    var = n / (n - 1) * sum((w / w_sum) ** 2 * (v - mean) ** 2 for v, w in pairs)
+    if population:
+        var *= max(0.0, 1 - n / population)
+    half = t_quantile(n - 1) * math.sqrt(var)
+    return {"mean": mean, "low": mean - half, "high": mean + half, "half_width": half, "n": n}
+
+
+# ==============================================================================
+#  SAMPLED COMPARISON PLAN (shared by both judges)
+# ==============================================================================
+
+def plan_sampled_comparison(fetcher, mux_url, loc_url, folder, n, weight_bitrate=False, seed=0):
+    """
+    Picks n windows across the local playlist, fetches just those segments plus the
+    Mux segments covering the same time span, and returns the per-window inputs.
+    """
+    mux_pl = fetcher.load_playlist(mux_url)
+    loc_pl = fetcher.load_playlist(loc_url)
+    mux_durs = [s.duration for s in mux_pl.segments]
+    loc_durs = [s.duration for s in loc_pl.segments]
+
+    sizes = None
+    if weight_bitrate:
+        # Byte-range (single-file) playlists carry every size already; others need a HEAD each
+        sizes = [fetcher.content_length(uri, byterange) for uri, byterange, _ in segment_refs(loc_pl, loc_url)]
+        if not all(sizes):
+            sizes = None  # server gave no sizes: fall back to position-only strata
+
+    windows = [w for w in stratified_pick(loc_durs, n, sizes, seed)
+               if w.start + w.duration <= sum(mux_durs)]
+
+    # Fetch every needed segment once, in one parallel batch per source
+    plan = []
+    needed = {"mux": set(), "loc": set()}
+    for w in windows:
+        mux_idx, mux_offset = covering_segments(mux_durs, w.start, w.duration)
+        needed["mux"].update(mux_idx)
+        needed["loc"].add(w.index)
+        plan.append((w, mux_idx, mux_offset))
+
+    paths = {}
+    for side, pl, url in (("mux", mux_pl, mux_url), ("loc", loc_pl, loc_url)):
+        side_dir = os.path.join(folder, side)
+        os.makedirs(side_dir, exist_ok=True)
+        order = sorted(needed[side])
+        jobs = segment_jobs(pl, url, side_dir, order, name="seg_{:04d}")
+        results = fetcher.fetch_all(jobs)
+        fetcher.report(results, f"{side} (sampled)")
+        paths[side] = {i: r["path"] for i, r in zip(order, results) if r}
+
+    out = []
+    for w, mux_idx, mux_offset in plan:
+        if w.index not in paths["loc"] or not all(i in paths["mux"] for i in mux_idx):
+            continue
+        out.append({
+            "start": w.start,
+            "duration": w.duration,
+            "weight": w.weight,
+            "loc": [paths["loc"][w.index]],
+            "mux": [paths["mux"][i] for i in mux_idx],
+            "mux_offset": mux_offset,
+        })
+    return {
+        "windows": out,
+        "population": len(loc_durs),
+        "mux_bytes_span": (list(paths["mux"].values()), sum(mux_durs[i] for i in paths["mux"])),
+        "loc_bytes_span": (list(paths["loc"].values()), sum(loc_durs[i] for i in paths["loc"])),
+        # playlist position of each file above (the windows are not adjacent)
+        "mux_indexes": list(paths["mux"]),
+        "loc_indexes": list(paths["loc"]),
+    }
+
+
+def aggregate_windows(window_scores, weights, population=None):
+    """
+    Collapses per-window MetricScores into one full-video estimate (+ CI for VMAF).
+    Failed windows (None) are dropped and the weights of the rest re-normalised;
+    with no window left the scores are None.
+    """
+    kept = [(s, w) for s, w in zip(window_scores, weights) if s is not None]
+    failed = len(window_scores) - len(kept)
+    window_scores = [s for s, _ in kept]
+    weights = [w for _, w in kept]
+    est = estimate([s.vmaf for s in window_scores], weights, population)
+    est["failed"] = failed
+    if not window_scores:
+        return None, est
+    w_sum = sum(weights) or 1.0
+    # each window's harmonic mean h gives its mean of 1/(vmaf+1) as 1/(h+1);
+    # weighting those recovers the harmonic mean over the sampled frames
+    inv = sum(w / (s.vmaf_harmonic + 1.0) for s, w in zip(window_scores, weights)) / w_sum
+    agg = MetricScores(
+        vmaf=est["mean"],
+        psnr=sum(s.psnr * w for s, w in zip(window_scores, weights)) / w_sum,
+        ssim=sum(s.ssim * w for s, w in zip(window_scores, weights)) / w_sum,
+        vmaf_harmonic=1.0 / inv - 1.0 if inv > 0 else 0.0,
+        vmaf_p1=min((s.vmaf_p1 for s in window_scores), default=0.0),
+        vmaf_p5=min((s.vmaf_p5 for s in window_scores), default=0.0),
+    )
+    return agg, est
@@ -0,0 +1,59 @@
+import asyncio
+import pytest
+from hls_validator import validate_all
+from ttff_simulator import serve
+
+
+def write_asset(root, variants, segments, seg_bytes=1000, seg_time=4.0, bandwidth=800_000, missing=(),
+                long_segment=None):
+    lines = ["#EXTM3U"]
+    for name in variants:
+        lines += [f'#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION=854x480,CODECS="avc1.4d401f,mp4a.40.2"',
+                  f"{name}.m3u8"]
+        playlist = ["#EXTM3U", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:0"]
+        for i in range(segments):
+            duration = 5.0 if (name, i) == long_segment else seg_time
+            playlist += [f"#EXTINF:{duration:.3f},", f"{name}_{i:04d}.ts"]
+            if (name, i) not in missing:
+                (root / f"{name}_{i:04d}.ts").write_bytes(b"\0" * seg_bytes)
+        (root / f"{name}.m3u8").write_text("\n".join(playlist + ["#EXT-X-ENDLIST"]) + "\n")
+    (root / "master.m3u8").write_text("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def server(tmp_path):
+    started = []
+
+    def start(rtt=0.0):
+        srv, base = serve(str(tmp_path), bandwidth=float("inf"), rtt=rtt)
+        started.append(srv)
+        return base + "master.m3u8"
+
+    yield start
+    for srv in started:
+        srv.shutdown()
+        srv.server_close()
+
+
+def test_queued_requests_do_not_time_out(tmp_path, server):
+    # 2 x 300 HEADs at 50 ms over 4 connections: ~8 s queued, far past the 1 s timeout
+    write_asset(tmp_path, ["low", "high"], 300)
+    url = server(rtt=0.05)
+    (report,), n_requests = asyncio.run(validate_all([url], connections=4, timeout=1.0))
+
+    assert report["ok"], report["errors"]
+    assert report["segments"] == 600
+    assert n_requests == 1 + 2 + 600   # master, playlists, one HEAD per segment: no retries
+
+
+def test_broken_asset_is_reported(tmp_path, server):
+    write_asset(tmp_path, ["low", "high"], 5, seg_bytes=600_000, bandwidth=800_000,
+                missing={("high", 2)}, long_segment=("high", 1))
+    (report,), _ = asyncio.run(validate_all([server()], connections=8, timeout=5.0))
+    errors = "\n".join(report["errors"])
+
+    assert not report["ok"]
+    assert "high_0002.ts: HTTP 404" in errors
+    assert "EXTINF 5.000s > TARGETDURATION 4" in errors
+    assert "> BANDWIDTH 800 kbps" in errors
+    assert "high vs low: segment 1 is 5.000s vs 4.000s" in errors
@@ -0,0 +1,312 @@
+import sys
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import mp4_parser
+
+# ==============================================================================
+#  TS PARSER: NATIVE MPEG-TS PACKET ANALYTICS (NUMPY, NO FFPROBE)
+# ==============================================================================
+#
+# A .ts file is a flat array of 188-byte packets, so it is memory-mapped and
+# viewed as an (N, 188) uint8 matrix: every header field of every packet is then
+# one vectorised NumPy expression instead of a Python loop or an ffprobe run.
+#
+# Byte accounting (per file, exact):
+#   video / audio  = elementary-stream bytes (TS payload minus PES headers)
+#   overhead       = everything else: TS headers, adaptation fields / stuffing,
+#                    PES headers, PAT/PMT/SI tables and null packets
+
+TS_PACKET = 188
+SYNC_BYTE = 0x47
+PAT_PID = 0x0000
+NULL_PID = 0x1FFF
+PCR_HZ = 27_000_000
+PTS_HZ = 90_000
+CBR_TOLERANCE = 0.01   # packet-rate spread between PCRs (relative) under which the mux counts as CBR
+
+# PMT stream_type -> kind
+STREAM_TYPES = {
+    0x01: "video", 0x02: "video", 0x10: "video", 0x1B: "video", 0x24: "video",
+    0x03: "audio", 0x04: "audio", 0x0F: "audio", 0x11: "audio", 0x81: "audio", 0x87: "audio",
+}
+
+
+def _sync_offset(buf):
+    """First offset where the sync byte repeats every 188 bytes (skips junk at the head)"""
+    for off in range(min(TS_PACKET, len(buf))):
+        probe = buf[off:off + TS_PACKET * 5:TS_PACKET]
+        if len(probe) and np.all(probe == SYNC_BYTE):
+            return off
+    return None
+
+
+def _section(packet, afc):
+    """Payload of a PSI packet starting at the table_id (pointer_field skipped)"""
+    start = 4 + (1 + int(packet[4]) if afc & 2 else 0)
+    if start >= TS_PACKET:
+        return None
+    start += 1 + int(packet[start])
+    return packet[start:] if start < TS_PACKET else None
+
+
+class TSFile:
+    """
+    One memory-mapped transport stream.
+
+    ts = TSFile.open("720p_004.ts")
+    ts.report()        # byte shares, PCR repetition, PID histogram, duration
+    """
+
+    def __init__(self, path, packets):
+        self.path = path
+        self.packets = packets        # (N, 188) uint8 view over the mapped file
+        hdr = packets[:, :4].astype(np.uint16)
+        self.pid = ((hdr[:, 1] & 0x1F) << 8) | hdr[:, 2]
+        self.pusi = (hdr[:, 1] & 0x40) != 0
+        self.afc = (hdr[:, 3] >> 4) & 0x3
+        self.cc = hdr[:, 3] & 0xF
+
+        # Payload start per packet: after the 4-byte header and the adaptation field
+        has_af = (self.afc & 2) != 0
+        af_len = np.where(has_af, packets[:, 4].astype(np.int32) + 1, 0)
+        self.payload_start = np.minimum(4 + af_len, TS_PACKET)
+        self.payload_len = np.where((self.afc & 1) != 0, TS_PACKET - self.payload_start, 0)
+        self._pids = None
+
+    @classmethod
+    def open(cls, path):
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        off = _sync_offset(raw) if len(raw) else None
+        if off is None:
+            return cls(path, np.empty((0, TS_PACKET), dtype=np.uint8))
+        n = (len(raw) - off) // TS_PACKET
+        return cls(path, raw[off:off + n * TS_PACKET].reshape(n, TS_PACKET))
+
+    @property
+    def size(self):
+        return len(self.packets) * TS_PACKET
+
+    # --- PID MAP ---
+    def pid_histogram(self):
+        pids, counts = np.unique(self.pid, return_counts=True)
+        return {int(p): int(c) for p, c in zip(pids, counts)}
+
+    def streams(self):
+        """pid -> {"kind", "stream_type"} from the first PAT + PMT (falls back to PES stream_id)"""
+        if self._pids is not None:
+            return self._pids
+        pids = {}
+        pmt_pids = set()
+        for i in np.flatnonzero((self.pid == PAT_PID) & self.pusi)[:1]:
+            sec = _section(self.packets[i], int(self.afc[i]))
+            if sec is not None and len(sec) >= 8:
+                length = ((int(sec[1]) & 0x0F) << 8) | int(sec[2])
+                entries = sec[8:min(3 + length - 4, len(sec))]
+                for k in range(0, len(entries) - 3, 4):
+                    program = (int(entries[k]) << 8) | int(entries[k + 1])
+                    if program:
+                        pmt_pids.add(((int(entries[k + 2]) & 0x1F) << 8) | int(entries[k + 3]))
+
+        for pmt_pid in pmt_pids:
+            for i in np.flatnonzero((self.pid == pmt_pid) & self.pusi)[:1]:
+                sec = _section(self.packets[i], int(self.afc[i]))
+                if sec is None or len(sec) < 12:
+                    continue
+                length = ((int(sec[1]) & 0x0F) << 8) | int(sec[2])
+                end = min(3 + length - 4, len(sec))
+                k = 12 + (((int(sec[10]) & 0x0F) << 8) | int(sec[11]))
+                while k + 5 <= end:
+                    stype = int(sec[k])
+                    es_pid = ((int(sec[k + 1]) & 0x1F) << 8) | int(sec[k + 2])
+                    info_len = ((int(sec[k + 3]) & 0x0F) << 8) | int(sec[k + 4])
+                    pids[es_pid] = {"kind": STREAM_TYPES.get(stype, "data"), "stream_type": stype}
+                    k += 5 + info_len
+
+        if not pids:
+            # No PSI in this chunk: classify PES by stream_id (0xE0-0xEF video, 0xC0-0xDF audio)
+            for p in np.unique(self.pid[self.pusi]):
+                i = np.flatnonzero((self.pid == p) & self.pusi)[0]
+                s = int(self.payload_start[i])
+                if s + 4 <= TS_PACKET and bytes(self.packets[i, s:s + 3]) == b"\x00\x00\x01":
+                    sid = int(self.packets[i, s + 3])
+                    kind = "video" if 0xE0 <= sid <= 0xEF else "audio" if 0xC0 <= sid <= 0xDF else "data"
+                    pids[int(p)] = {"kind": kind, "stream_type": None}
+        self._pids = pids
+        return pids
+
+    def pids_of(self, kind):
+        return [p for p, s in self.streams().items() if s["kind"] == kind]
+
+    # --- PES ---
+    def _pes_starts(self, pids):
+        mask = self.pusi & np.isin(self.pid, pids) & (self.payload_len >= 14)
+        rows = np.flatnonzero(mask)
+        s = self.payload_start[rows]
+        pkt = self.packets
+        ok = (pkt[rows, s] == 0) & (pkt[rows, s + 1] == 0) & (pkt[rows, s + 2] == 1)
+        return rows[ok], s[ok]
+
+    def es_bytes(self, pids):
+        """Elementary-stream bytes of the given PIDs (TS payload minus PES headers)"""
+        if not pids:
+            return 0
+        payload = int(self.payload_len[np.isin(self.pid, pids)].sum())
+        rows, s = self._pes_starts(pids)
+        pes_headers = int((9 + self.packets[rows, s + 8].astype(np.int64)).sum())
+        return payload - pes_headers
+
+    def pts(self, pids):
+        """PTS (seconds, 33-bit wrap unrolled) of every PES that carries one"""
+        rows, s = self._pes_starts(pids)
+        has_pts = (self.packets[rows, s + 7] & 0x80) != 0
+        rows, s = rows[has_pts], s[has_pts]
+        b = [self.packets[rows, s + 9 + k].astype(np.int64) for k in range(5)]
+        ticks = (((b[0] >> 1) & 0x7) << 30) | (b[1] << 22) | ((b[2] >> 1) << 15) | (b[3] << 7) | (b[4] >> 1)
+        return np.unwrap(ticks.astype(np.float64), period=2 ** 33) / PTS_HZ if len(ticks) else ticks
+
+    # --- PCR ---
+    def pcr(self):
+        """(packet index, PCR seconds) of every packet carrying a PCR"""
+        pkt = self.packets
+        mask = ((self.afc & 2) != 0) & (pkt[:, 4] >= 7) & ((pkt[:, 5] & 0x10) != 0)
+        rows = np.flatnonzero(mask)
+        b = [pkt[rows, 6 + k].astype(np.int64) for k in range(6)]
+        base = (b[0] << 25) | (b[1] << 17) | (b[2] << 9) | (b[3] << 1) | (b[4] >> 7)
+        ext = ((b[4] & 0x1) << 8) | b[5]
+        return rows, (base * 300 + ext) / PCR_HZ
+
+    def pcr_timing(self):
+        """
+        PCR repetition interval (ISO 13818-1 allows 100 ms, TR 101 290 flags > 40 ms)
+        and mean mux rate. PCR accuracy (each PCR against the time its byte position
+        implies at the fitted mux rate, TR 101 290 style) assumes a constant mux rate:
+        it is only computed for CBR files. ffmpeg's HLS TS output is VBR, where that
+        residual measures bitrate swings rather than a clock defect (None there).
+        """
+        rows, t = self.pcr()
+        out = {"pcr_count": int(len(rows)), "interval_max_ms": 0.0, "interval_mean_ms": 0.0,
+               "cbr": False, "accuracy_max_ms": None, "mux_rate_kbps": 0.0}
+        if len(rows) < 2:
+            return out
+        t = np.unwrap(t, period=(2 ** 33 * 300) / PCR_HZ)
+        gaps = np.diff(t)
+        out["interval_max_ms"] = float(gaps.max() * 1000)
+        out["interval_mean_ms"] = float(gaps.mean() * 1000)
+        if t[-1] > t[0]:
+            out["mux_rate_kbps"] = float((rows[-1] - rows[0]) * TS_PACKET * 8 / (t[-1] - t[0]) / 1000)
+        if len(rows) < 3 or not np.all(gaps > 0):
+            return out
+
+        rate = np.diff(rows) / gaps   # packets per second between consecutive PCRs
+        out["cbr"] = bool(rate.std() <= CBR_TOLERANCE * rate.mean())
+        if out["cbr"]:
+            slope, icpt = np.polyfit(rows.astype(np.float64), t, 1)
+            out["accuracy_max_ms"] = float(np.abs(t - (slope * rows + icpt)).max() * 1000)
+        return out
+
+    # --- REPORT ---
+    def duration(self):
+        """Presentation span of the video (frame-exact when video PTS exist, else PCR span)"""
+        video = self.pids_of("video")
+        pts = np.sort(self.pts(video)) if video else np.empty(0)
+        if len(pts) >= 2:
+            return float(pts[-1] - pts[0] + np.median(np.diff(pts)))
+        _, t = self.pcr()
+        return float(t.max() - t.min()) if len(t) >= 2 else 0.0
+
+    def report(self):
+        video, audio = self.pids_of("video"), self.pids_of("audio")
+        total = self.size
+        v_bytes, a_bytes = self.es_bytes(video), self.es_bytes(audio)
+        hist = self.pid_histogram()
+        es_pids = set(self.streams())
+        return {
+            "path": self.path,
+            "packets": len(self.packets),
+            "bytes": total,
+            "duration": self.duration(),
+            "video_bytes": v_bytes,
+            "audio_bytes": a_bytes,
+            "overhead_bytes": total - v_bytes - a_bytes,
+            "null_packets": hist.get(NULL_PID, 0),
+            "pat_packets": hist.get(PAT_PID, 0),
+            "psi_packets": sum(c for p, c in hist.items() if p not in es_pids and p != NULL_PID),
+            "pid_histogram": hist,
+            **self.pcr_timing(),
+        }
+
+
+# ==============================================================================
+#  RENDITION-LEVEL ANALYTICS
+# ==============================================================================
+
+def analyze_file(path):
+    """Segment report for MPEG-TS, or the same fields from mp4_parser for fMP4/CMAF segments"""
+    if mp4_parser.is_mp4(path):
+        return mp4_parser.analyze_file(path)
+    return TSFile.open(path).report()
+
+
+def analyze_files(paths, max_workers=8):
+    """Parses many segments concurrently (NumPy releases the GIL in the heavy reductions)"""
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return list(pool.map(analyze_file, paths))
+
+
+def summarize(reports, durations=None, bandwidth=None, indexes=None):
+    """
+    Byte shares over a whole rendition plus per-segment peak bitrate.
+    durations: EXTINF of each segment (falls back to the parsed PTS span)
+    (fMP4: the init section is fetched once per rendition, so it is reported, not summed)
+    bandwidth: advertised BANDWIDTH (bps) to check the peak against
+    indexes: playlist position of each report (when some segments are missing), so
+             peak_segment / over_bandwidth name playlist segments, not list positions
+    """
+    total = sum(r["bytes"] for r in reports) or 1
+    durs = list(durations) if durations else [r["duration"] for r in reports]
+    # (segment index, bitrate): segments without a duration are skipped, indexes stay the playlist's
+    indexes = range(len(reports)) if indexes is None else indexes
+    rates = [(i, r["bytes"] * 8 / d) for i, r, d in zip(indexes, reports, durs) if d > 0]
+    peak_segment, peak = max(rates, key=lambda ir: ir[1], default=(None, 0.0))
+    span = sum(durs)
+    out = {
+        "container": "fmp4" if any(r.get("container") == "fmp4" for r in reports) else "ts",
+        "segments": len(reports),
+        "bytes": total,
+        "init_bytes": max((r.get("init_bytes", 0) for r in reports), default=0),
+        "duration": span,
+        "avg_bitrate": total * 8 / span if span > 0 else 0.0,
+        "peak_bitrate": peak,
+        "peak_segment": peak_segment,
+        "video_pct": 100.0 * sum(r["video_bytes"] for r in reports) / total,
+        "audio_pct": 100.0 * sum(r["audio_bytes"] for r in reports) / total,
+        "overhead_pct": 100.0 * sum(r["overhead_bytes"] for r in reports) / total,
+        "null_pct": 100.0 * sum(r["null_packets"] for r in reports) * TS_PACKET / total,
+        "pcr_interval_max_ms": max((r["interval_max_ms"] for r in reports), default=0.0),
+        # PCR accuracy only means something when every segment is muxed CBR
+        "pcr_cbr": bool(reports) and all(r["cbr"] for r in reports),
+        "pcr_accuracy_max_ms": max(r["accuracy_max_ms"] for r in reports)
+        if reports and all(r["accuracy_max_ms"] is not None for r in reports) else None,
+    }
+    if bandwidth:
+        out["bandwidth"] = bandwidth
+        out["peak_vs_bandwidth"] = peak / bandwidth
+        out["over_bandwidth"] = [i for i, r in rates if r > bandwidth]
+    return out
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python ts_parser.py <segment.ts> [more.ts ...]")
+        sys.exit(1)
+    reports = analyze_files(sys.argv[1:])
+    for r in reports:
+        print(f"{r['path']}: {r['duration']:.2f}s | video {r['video_bytes']} B | audio {r['audio_bytes']} B"
+              f" | overhead {100.0 * r['overhead_bytes'] / max(r['bytes'], 1):.2f}%"
+              f" | PCR gap {r['interval_max_ms']:.0f} ms"
+              + (f" | PCR accuracy (CBR) {r['accuracy_max_ms']:.3f} ms" if r['accuracy_max_ms'] is not None else ""))
+    s = summarize(reports)
+    print(f"\nTOTAL: {s['segments']} segs | video {s['video_pct']:.2f}% | audio {s['audio_pct']:.2f}%"
+          f" | overhead {s['overhead_pct']:.2f}% | peak {s['peak_bitrate'] / 1000:.0f} kbps")
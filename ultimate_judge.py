@@ -1,78 +1,81 @@
 import os
 import sys
-import m3u8
-import requests
-import subprocess
 import json
+import argparse
+import subprocess
 import shutil
-from urllib.parse import urljoin
 from tabulate import tabulate
+from segment_fetcher import SegmentFetcher, resolve_uri
+from segment_cache import SegmentCache, derive_key, detach, DEFAULT_CACHE_DIR
+from scoring_engine import ScoringEngine, add_scoring_args, fmt, metric, parse_size, probe_size, scoring_size
+from core_budget import CoreBudget, add_budget_args
+from segment_sampler import plan_sampled_comparison, aggregate_windows
+from gop_forensics import analyze_segments, summarize
+import ts_parser
+from probe_service import ProbeService
+from reference_cache import make_reference_cache, add_reference_args
 
 # ==============================================================================
 #  THE ULTIMATE JUDGE V2: PERFECT SYNC + EFFICIENCY SCORE
 # ==============================================================================
 
 class UltimateAnalyzer:
-    def __init__(self, original_file, work_dir="ultimate_lab_v2"):
+    def __init__(self, original_file, work_dir="ultimate_lab_v2", cache_dir=DEFAULT_CACHE_DIR, use_cache=True, clean=True):
         self.original_file = original_file
         self.work_dir = work_dir
-        if os.path.exists(work_dir):
-            shutil.rmtree(work_dir)
-        os.makedirs(work_dir)
+        self.cache_dir = cache_dir
+        self.use_cache = use_cache
+        # The work dir is scratch space; anything worth keeping lives in the cache
+        self.cache = SegmentCache(cache_dir) if use_cache else None
+        self.fetcher = SegmentFetcher(cache=self.cache)
+        self.probes = ProbeService(cache_dir, persist=use_cache)
+        self.segment_durations = {}  # label -> EXTINF durations of the fetched segments
+        if clean:
+            if os.path.exists(work_dir):
+                shutil.rmtree(work_dir)
+            os.makedirs(work_dir)
+
+    # --- CACHE HELPERS ---
+    def _file_keys(self, paths):
+        return [self.cache.file_key(p) for p in paths] if self.cache else []
+
+    def _cached(self, key_parts, out_path, build):
+        """Reuses a cached artifact for out_path, or builds and stores it"""
+        if not self.cache:
+            build()
+            return out_path
+        key = derive_key(*key_parts)
+        if self.cache.fetch_into(key, out_path):
+            print(f"   ♻️  Cache hit: {os.path.basename(out_path)}")
+            return out_path
+        detach(out_path)   # build() writes with ffmpeg -y: never through a cache object's link
+        build()
+        self.cache.put(key, out_path)
+        return out_path
 
     # --- DOWNLOAD MANAGER ---
     def get_master_variants(self, master_path):
         variants = {}
         try:
-            m = m3u8.load(master_path)
+            m = self.fetcher.load_playlist(master_path)
             for p in m.playlists:
                 res = "N/A"
                 if p.stream_info.resolution:
                     res = f"{p.stream_info.resolution[0]}x{p.stream_info.resolution[1]}"
-                
-                uri = p.uri
-                if not uri.startswith("http") and master_path.startswith("http"):
-                    uri = urljoin(master_path, uri)
-                elif not os.path.isabs(uri) and not master_path.startswith("http"):
-                     uri = os.path.join(os.path.dirname(master_path), uri)
-                variants[res] = uri
+                variants[res] = resolve_uri(master_path, p.uri)
         except Exception as e:
             print(f"Error reading master {master_path}: {e}")
         return variants
 
     def download_segments(self, playlist_url, label, limit=10):
         folder = os.path.join(self.work_dir, label)
-        os.makedirs(folder, exist_ok=True)
         try:
-            m3u8_obj = m3u8.load(playlist_url)
-            base_uri = playlist_url
-            segments = m3u8_obj.segments[:limit]
-            ts_files = []
-            
-            def resolve(uri):
-                if uri.startswith("http"): return uri
-                if playlist_url.startswith("http"): return urljoin(base_uri, uri)
-                return os.path.join(os.path.dirname(playlist_url), uri)
-
-            print(f"   ⬇️  Fetching {len(segments)} segments for {label}...", end="\r")
-            for i, seg in enumerate(segments):
-                local_path = os.path.join(folder, f"seg_{i:03d}.ts")
-                seg_uri = resolve(seg.uri)
-                
-                if seg_uri.startswith("http"):
-                    try:
-                        r = requests.get(seg_uri, stream=True, timeout=15)
-                        if r.status_code == 200:
-                            with open(local_path, 'wb') as f:
-                                for chunk in r.iter_content(chunk_size=1024): f.write(chunk)
-                            ts_files.append(local_path)
-                    except: pass
-                else:
-                    if os.path.exists(seg_uri):
-                        shutil.copy(seg_uri, local_path)
-                        ts_files.append(local_path)
-            print(f"   ✅ Fetched {len(ts_files)} segments for {label}          ")
-            return ts_files
+            m3u8_obj = self.fetcher.load_playlist(playlist_url)
+            print(f"   ⬇️  Fetching {min(limit, len(m3u8_obj.segments))} segments for {label}...")
+            results = self.fetcher.fetch_playlist_segments(m3u8_obj, playlist_url, folder, limit)
+            self.fetcher.report(results, label)
+            self.segment_durations[label] = [r['duration'] for r in results if r]
+            return [r['path'] for r in results if r]
         except Exception as e:
             print(f"   ❌ Error fetching {label}: {e}")
             return []
@@ -81,19 +84,29 @@ class UltimateAnalyzer:
     def concat_and_trim(self, ts_files, output_name, duration=None):
         if not ts_files: return None
         
+        # fMP4 segments merge into .mp4 (remuxing them to TS would add the very overhead being measured)
+        ext = os.path.splitext(ts_files[0])[1] or ".ts"
+        final_name = f"{output_name}_final{ext}" if duration else f"{output_name}_merged{ext}"
+        key_parts = ["concat_and_trim", duration, *self._file_keys(ts_files)]
+        return self._cached(key_parts, os.path.join(self.work_dir, final_name),
+                            lambda: self._concat_and_trim(ts_files, output_name, duration))
+
+    def _concat_and_trim(self, ts_files, output_name, duration=None):
         # 1. Concat
         list_file = os.path.join(self.work_dir, f"{output_name}_list.txt")
         with open(list_file, 'w') as f:
             for ts in ts_files: f.write(f"file '{os.path.abspath(ts)}'\n")
         
-        merged_path = os.path.join(self.work_dir, f"{output_name}_merged.ts")
+        ext = os.path.splitext(ts_files[0])[1] or ".ts"
+        merged_path = os.path.join(self.work_dir, f"{output_name}_merged{ext}")
+        detach(merged_path)   # may be a cache hit of the untrimmed merge
         # Added -safe 0 and loglevel error
         subprocess.run(["ffmpeg", "-y", "-v", "error", "-f", "concat", "-safe", "0", "-i", list_file, "-c", "copy", merged_path])
         
         # 2. Trim (Force Exact Duration)
         final_path = merged_path
         if duration:
-            trimmed_path = os.path.join(self.work_dir, f"{output_name}_final.ts")
+            trimmed_path = os.path.join(self.work_dir, f"{output_name}_final{ext}")
             # Re-encoding usually safer for precise trim, but copy is okay if keyframes align (which they should now)
             subprocess.run(["ffmpeg", "-y", "-v", "error", "-i", merged_path, "-t", str(duration), "-c", "copy", trimmed_path])
             final_path = trimmed_path
@@ -101,113 +114,184 @@ class UltimateAnalyzer:
         return final_path
 
     def get_duration(self, file_path):
-        try:
-            cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", file_path]
-            return float(subprocess.check_output(cmd).strip())
-        except: return 0
-
-    def prepare_reference(self, duration_sec):
-        ref_path = os.path.join(self.work_dir, "reference_cut.mp4")
-        # Cut original exactly
-        cmd = [
-            "ffmpeg", "-y", "-v", "error",
-            "-i", self.original_file,
-            "-t", str(duration_sec),
-            "-c:v", "libx264", "-crf", "0", "-preset", "ultrafast", "-an",
-            ref_path
-        ]
-        subprocess.run(cmd)
-        return ref_path
+        return self.probes.duration(file_path)
 
     # --- FORENSICS (Fixed GOP Logic) ---
-    def get_forensics(self, file_path_for_metrics, file_path_for_gop):
+    def get_forensics(self, file_path_for_metrics, segments, stream_window=None, indexes=None):
         """
         file_path_for_metrics: The Full merged file (for bitrate/size)
-        file_path_for_gop: The FIRST individual segment (for accurate GOP/Profile)
+                               or, in streaming mode, the list of raw segments
+        segments: The individual segments (GOP/keyframe forensics run on all of them)
+        stream_window: (playlist_duration, test_duration) when segments are not merged
+        indexes: playlist position of each segment when they are not consecutive (sampling)
         """
-        # 1. Get Bitrate/Size from Merged
-        cmd_metrics = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", file_path_for_metrics]
-        res_metrics = subprocess.run(cmd_metrics, capture_output=True, text=True)
-        data_metrics = json.loads(res_metrics.stdout)
-        fmt = data_metrics['format']
-        size_mb = float(fmt['size']) / 1024 / 1024
-        bitrate_kbps = int(float(fmt['bit_rate'])) / 1000 if 'bit_rate' in fmt else 0
-
-        # 2. Get GOP/Profile from First Segment
-        cmd_gop = [
-            "ffprobe", "-v", "quiet", "-print_format", "json",
-            "-show_streams", "-show_frames",
-            "-select_streams", "v:0", 
-            "-read_intervals", "%+#50", # Read first 50 frames
-            file_path_for_gop
-        ]
-        res_gop = subprocess.run(cmd_gop, capture_output=True, text=True)
-        data_gop = json.loads(res_gop.stdout)
-        stream = next((s for s in data_gop['streams'] if s['codec_type'] == 'video'), {})
-        frames = data_gop.get('frames', [])
-        
-        profile = stream.get('profile', 'N/A')
-        
-        i_frames = [f for f in frames if f.get('pict_type') == 'I']
-        p_frames = [f for f in frames if f.get('pict_type') == 'P']
-        b_frames = [f for f in frames if f.get('pict_type') == 'B']
-        
-        gop_dur = 0
-        if len(i_frames) >= 2:
-            def get_ts(f): return float(f.get('pkt_pts_time') or f.get('pkt_dts_time') or 0)
-            gop_dur = get_ts(i_frames[1]) - get_ts(i_frames[0])
-        elif len(i_frames) == 1 and frames:
-             # Estimate if only 1 I-frame in sample
-             def get_ts(f): return float(f.get('pkt_pts_time') or f.get('pkt_dts_time') or 0)
-             gop_dur = get_ts(frames[-1]) - get_ts(frames[0])
+        # Exact mux overhead from the TS packets / fMP4 boxes themselves (no assumed audio bitrate)
+        ts = ts_parser.summarize(ts_parser.analyze_files(segments))
+
+        if stream_window:
+            # 1. Bitrate/Size straight from the segment files (nothing merged on disk;
+            #    fMP4 files carry their init section, which is counted once, not per segment)
+            playlist_dur, test_dur = stream_window
+            if file_path_for_metrics == segments:
+                total_bytes = ts['bytes']
+            else:
+                total_bytes = sum(ts_parser.analyze_file(p)['bytes'] for p in file_path_for_metrics)
+            bitrate_kbps = total_bytes * 8 / playlist_dur / 1000 if playlist_dur > 0 else 0
+            size_mb = bitrate_kbps * 1000 * test_dur / 8 / 1024 / 1024
+        else:
+            # 1. Get Bitrate/Size from Merged (probed once, shared with get_duration)
+            fmt = self.probes.format(file_path_for_metrics)
+            size_mb = float(fmt.get('size', 0)) / 1024 / 1024
+            bitrate_kbps = int(float(fmt['bit_rate'])) / 1000 if 'bit_rate' in fmt else 0
+
+        # 2. Profile from the first segment's stream header
+        profile = self.probes.video(segments[0]).get('profile', 'N/A')
+
+        # 3. GOP/Keyframes from packets of EVERY segment (no decode, no frame cap)
+        gop = summarize(analyze_segments(segments, probes=self.probes), indexes)
 
         return {
             "size_mb": size_mb,
             "bitrate": bitrate_kbps,
             "profile": profile,
-            "gop_str": f"I={len(i_frames)},P={len(p_frames)},B={len(b_frames)}",
-            "gop_dur": gop_dur
+            "gop_str": gop['gop_str'],
+            "gop_dur": gop['keyint_mean'],
+            "gop_range": (gop['keyint_min'], gop['keyint_max']),
+            "idr_start_pct": gop['idr_start_pct'],
+            "overhead_pct": ts['overhead_pct'],
+            "video_pct": ts['video_pct'],
         }
 
-    # --- QUALITY (VMAF) ---
-    def calc_vmaf(self, distorted, reference):
-        print(f"   🧪 Running VMAF Calculation...", end="\r")
-        log_path = distorted + "_vmaf.json"
-        
-        # Scale distorted to match reference
-        cmd = [
-            "ffmpeg", "-y", "-v", "error",
-            "-i", distorted, "-i", reference,
-            "-filter_complex", 
-            "[0:v]scale=1920:1080:flags=bicubic[dist];[dist][1:v]libvmaf=log_path={}:log_fmt=json:n_threads=4".format(log_path),
-            "-f", "null", "-"
-        ]
-        subprocess.run(cmd)
-        
-        try:
-            with open(log_path, 'r') as f:
-                data = json.load(f)
-                score = data['pooled_metrics']['vmaf']['mean']
-                print(f"   🧪 VMAF Complete: {score:.2f}          ")
-                return score
-        except: 
-            print("   ⚠️ VMAF Failed")
-            return 0.0
+# ==============================================================================
+#  PER-RESOLUTION PREPARATION (runs inside the process pool)
+# ==============================================================================
+
+def prepare_rendition(task):
+    """Download, merge, normalize and inspect one resolution of both sources"""
+    res, mux_url, loc_url, analyzer_args, stream = task
+    analyzer = UltimateAnalyzer(*analyzer_args, clean=False)
+    print(f"\n⚙️  PROCESSING RESOLUTION: {res} ⚙️")
+    
+    # 1. Download
+    # Download 12 segments (12*5 = 60s) for both since now SEG_TIME matches!
+    mux_ts = analyzer.download_segments(mux_url, f"mux_{res}", limit=12)
+    loc_ts = analyzer.download_segments(loc_url, f"loc_{res}", limit=12)
+    
+    if not mux_ts or not loc_ts: return None
+
+    if stream:
+        # Streaming mode: segments go straight into the scoring ffmpeg (concat protocol + -t)
+        d_mux = sum(analyzer.segment_durations[f"mux_{res}"])
+        d_loc = sum(analyzer.segment_durations[f"loc_{res}"])
+        common_dur = min(d_mux, d_loc)
+        print(f"   ⏱️  [{res}] Test Duration: {common_dur:.2f} sec (streamed, no intermediates)")
+        return {
+            "res": res,
+            "duration": common_dur,
+            "mux_final": mux_ts,
+            "loc_final": loc_ts,
+            "loc_seg_durs": analyzer.segment_durations[f"loc_{res}"],
+            "f_mux": analyzer.get_forensics(mux_ts, mux_ts, stream_window=(d_mux, common_dur)),
+            "f_loc": analyzer.get_forensics(loc_ts, loc_ts, stream_window=(d_loc, common_dur)),
+        }
+
+    # 2. Merge
+    mux_full = analyzer.concat_and_trim(mux_ts, f"mux_{res}")
+    loc_full = analyzer.concat_and_trim(loc_ts, f"loc_{res}")
+
+    # 3. Time Normalize
+    d_mux = analyzer.get_duration(mux_full)
+    d_loc = analyzer.get_duration(loc_full)
+    common_dur = min(d_mux, d_loc)
+    print(f"   ⏱️  [{res}] Test Duration: {common_dur:.2f} sec")
+
+    # 4. Final Trim
+    mux_final = analyzer.concat_and_trim([mux_full], f"mux_{res}_final", common_dur)
+    loc_final = analyzer.concat_and_trim([loc_full], f"loc_{res}_final", common_dur)
+
+    # 5. FORENSICS (GOP from the packets of every segment)
+    return {
+        "res": res,
+        "duration": common_dur,
+        "mux_final": mux_final,
+        "loc_final": loc_final,
+        "loc_seg_durs": analyzer.segment_durations[f"loc_{res}"],
+        "f_mux": analyzer.get_forensics(mux_final, mux_ts),
+        "f_loc": analyzer.get_forensics(loc_final, loc_ts),
+    }
+
+def prepare_sampled_rendition(task):
+    """Sampling mode: N windows spread over the whole playlist instead of the first 12 segments"""
+    res, mux_url, loc_url, analyzer_args, samples, weight_bitrate = task
+    analyzer = UltimateAnalyzer(*analyzer_args, clean=False)
+    print(f"\n⚙️  SAMPLING RESOLUTION: {res} ({samples} windows) ⚙️")
+
+    plan = plan_sampled_comparison(analyzer.fetcher, mux_url, loc_url,
+                                   os.path.join(analyzer.work_dir, f"sample_{res}"), samples, weight_bitrate)
+    if not plan["windows"]: return None
+
+    mux_files, mux_span = plan["mux_bytes_span"]
+    loc_files, loc_span = plan["loc_bytes_span"]
+    test_dur = sum(w["duration"] for w in plan["windows"])
+    print(f"   ⏱️  [{res}] {len(plan['windows'])} windows, {test_dur:.2f} sec scored")
+    return {
+        "res": res,
+        "windows": plan["windows"],
+        "population": plan["population"],
+        "f_mux": analyzer.get_forensics(mux_files, mux_files, stream_window=(mux_span, test_dur),
+                                        indexes=plan["mux_indexes"]),
+        "f_loc": analyzer.get_forensics(loc_files, loc_files, stream_window=(loc_span, test_dur),
+                                        indexes=plan["loc_indexes"]),
+    }
 
 # ==============================================================================
 #  MAIN EXECUTION
 # ==============================================================================
 
+# --- REPORT HELPERS (None = the metrics of that side failed) ---
+def efficiency(vmaf, size_mb):
+    if vmaf is None:
+        return None
+    return vmaf / size_mb if size_mb > 0 else 0
+
+
 def main():
-    if len(sys.argv) < 4:
-        print("Usage: python ultimate_judge_v2.py <ORIGINAL.mp4> <MUX_MASTER> <LOCAL_MASTER>")
+    parser = argparse.ArgumentParser(description="Ultimate Judge V2: Mux vs Local HLS comparison")
+    parser.add_argument("original", help="Original source file (ORIGINAL.mp4)")
+    parser.add_argument("mux_master", help="Mux master playlist URL/path")
+    parser.add_argument("local_master", help="Local master playlist URL/path")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and don't populate the artifact cache")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Artifact cache location")
+    parser.add_argument("--window", type=float, default=4.0,
+                        help="Window length (s) for worst-segment localisation")
+    parser.add_argument("--stream", action="store_true",
+                        help="Feed segments straight into the scorer (no merged/trimmed .ts on disk)")
+    parser.add_argument("--sample", type=int, default=0, metavar="N",
+                        help="Score N windows spread over the whole video and estimate full-video VMAF")
+    parser.add_argument("--weight-bitrate", action="store_true",
+                        help="With --sample: favour high-bitrate (complex) segments inside each stratum")
+    parser.add_argument("--work-dir", default="ultimate_lab_v2", help="Scratch directory (wiped on start)")
+    parser.add_argument("--json", metavar="PATH", help="Also write the per-rendition results as JSON (fleet_judge)")
+    add_budget_args(parser)
+    add_reference_args(parser)
+    add_scoring_args(parser)
+    args = parser.parse_args()
+    if args.display and not parse_size(args.display):
+        print(f"❌ --display expects WxH, got {args.display!r}")
         sys.exit(1)
 
-    analyzer = UltimateAnalyzer(sys.argv[1])
+    analyzer = UltimateAnalyzer(args.original, work_dir=args.work_dir, cache_dir=args.cache_dir,
+                                use_cache=not args.no_cache)
+    refs = make_reference_cache(analyzer.original_file, os.path.join(analyzer.work_dir, "refs"), analyzer.cache,
+                                args.ref_format, analyzer.probes)
+    source_size = probe_size(analyzer.original_file, analyzer.probes)
+    display_size = parse_size(args.display) or source_size
+    where = "each rendition's own size" if args.score_at == "native" else "{}x{}".format(*display_size)
+    print(f"📐 Scoring at {where} (source {source_size[0]}x{source_size[1]}, VMAF model {args.vmaf_model or 'auto'})")
     
     print("🔍 Parsing Playlists...")
-    mux_vars = analyzer.get_master_variants(sys.argv[2])
-    loc_vars = analyzer.get_master_variants(sys.argv[3])
+    mux_vars = analyzer.get_master_variants(args.mux_master)
+    loc_vars = analyzer.get_master_variants(args.local_master)
     
     common_res = set(mux_vars.keys()).intersection(set(loc_vars.keys()))
     if not common_res:
@@ -215,49 +299,83 @@ def main():
         sys.exit(1)
 
     table_data = []
+    weak_spots = []
+    estimates = []
+    results = []   # numeric per-rendition results for --json
+    budget = CoreBudget(cpus=args.cpus, jobs=args.jobs)
+    analyzer_args = (analyzer.original_file, analyzer.work_dir, analyzer.cache_dir, analyzer.use_cache)
+    if args.sample:
+        tasks = [(res, mux_vars[res], loc_vars[res], analyzer_args, args.sample, args.weight_bitrate)
+                 for res in sorted(common_res, reverse=True)]
+        prepare = prepare_sampled_rendition
+    else:
+        tasks = [(res, mux_vars[res], loc_vars[res], analyzer_args, args.stream)
+                 for res in sorted(common_res, reverse=True)]
+        prepare = prepare_rendition
+    jobs, _ = budget.plan(len(tasks))
+    print(f"🧮 Core budget: {budget.cpus} CPUs -> {jobs} parallel rendition job(s)")
+    rounds = [r for r in budget.map(prepare, tasks) if r]
 
-    for res in sorted(common_res, reverse=True):
-        print(f"\n⚙️  PROCESSING RESOLUTION: {res} ⚙️")
-        
-        # 1. Download
-        # Download 12 segments (12*5 = 60s) for both since now SEG_TIME matches!
-        mux_ts = analyzer.download_segments(mux_vars[res], f"mux_{res}", limit=12)
-        loc_ts = analyzer.download_segments(loc_vars[res], f"loc_{res}", limit=12)
-        
-        if not mux_ts or not loc_ts: continue
-
-        # 2. Merge
-        mux_full = analyzer.concat_and_trim(mux_ts, f"mux_{res}")
-        loc_full = analyzer.concat_and_trim(loc_ts, f"loc_{res}")
-
-        # 3. Time Normalize
-        d_mux = analyzer.get_duration(mux_full)
-        d_loc = analyzer.get_duration(loc_full)
-        common_dur = min(d_mux, d_loc)
-        print(f"   ⏱️  Test Duration: {common_dur:.2f} sec")
+    # 6. QUALITY: single pass over the original for every rendition of both sources
+    # Every branch runs its own libvmaf inside the same ffmpeg, so they share the budget
+    engine = ScoringEngine(analyzer.original_file, analyzer.work_dir, ref_size=source_size,
+                           n_threads=budget.threads_for(2 * len(rounds)), cache=analyzer.cache, ref_cache=refs,
+                           score_size=display_size, model=args.vmaf_model)
+    for r in rounds:
+        # Native mode: each rendition against the reference downscaled to its own size ("N/A" -> display)
+        size = scoring_size(args.score_at, display_size, parse_size(r['res']))
+        if args.sample:
+            # Each window: reference fast-seeked to its start, Mux trimmed to the same span
+            for k, w in enumerate(r['windows']):
+                engine.add(f"mux_{r['res']}_w{k}", w['mux'], w['duration'], w['start'], w['mux_offset'], size=size)
+                engine.add(f"loc_{r['res']}_w{k}", w['loc'], w['duration'], w['start'], size=size)
+        else:
+            engine.add(f"mux_{r['res']}", r['mux_final'], r['duration'], size=size)
+            engine.add(f"loc_{r['res']}", r['loc_final'], r['duration'], size=size)
 
-        # 4. Final Trim
-        mux_final = analyzer.concat_and_trim([mux_full], f"mux_{res}_final", common_dur)
-        loc_final = analyzer.concat_and_trim([loc_full], f"loc_{res}_final", common_dur)
-        ref_final = analyzer.prepare_reference(common_dur)
+    print(f"\n⚙️  SCORING {len(engine.items)} RENDITIONS ⚙️")
+    scores = engine.run()
+    print(f"   🧪 Scoring complete in {scores.elapsed:.1f}s ({scores.reference_decodes} reference decode(s))")
 
-        # 5. FORENSICS (Use First Segment for GOP accuracy)
-        f_mux = analyzer.get_forensics(mux_final, mux_ts[0])
-        f_loc = analyzer.get_forensics(loc_final, loc_ts[0])
+    for r in rounds:
+        res, f_mux, f_loc = r['res'], r['f_mux'], r['f_loc']
+        if args.sample:
+            weights = [w['weight'] for w in r['windows']]
+            s_mux, est_mux = aggregate_windows([scores.get(f"mux_{res}_w{k}") for k in range(len(weights))],
+                                               weights, r['population'])
+            s_loc, est_loc = aggregate_windows([scores.get(f"loc_{res}_w{k}") for k in range(len(weights))],
+                                               weights, r['population'])
+            if est_mux['failed'] or est_loc['failed']:
+                print(f"   ⚠️ {res}: metrics failed for {est_mux['failed']} Mux / {est_loc['failed']} Local window(s), "
+                      f"estimating from the rest")
+            estimates.append([
+                res, f"{est_mux['n']} / {est_loc['n']}",
+                f"{est_mux['mean']:.1f} ± {est_mux['half_width']:.1f}" if s_mux else "N/A",
+                f"{est_loc['mean']:.1f} ± {est_loc['half_width']:.1f}" if s_loc else "N/A",
+            ])
+        else:
+            s_mux = scores.get(f"mux_{res}")
+            s_loc = scores.get(f"loc_{res}")
 
-        # 6. QUALITY
-        vmaf_mux = analyzer.calc_vmaf(mux_final, ref_final)
-        vmaf_loc = analyzer.calc_vmaf(loc_final, ref_final)
+        # A side whose metrics failed is reported as missing (null in --json), never as VMAF 0:
+        # fleet_judge averages these numbers across the catalogue
+        unscored = [side for side, s in (("Mux", s_mux), ("Local", s_loc)) if s is None]
+        if unscored:
+            print(f"   ⚠️ {res}: no metrics for {' / '.join(unscored)}, rendition left out of the verdict")
+        vmaf_mux = s_mux.vmaf if s_mux else None
+        vmaf_loc = s_loc.vmaf if s_loc else None
 
         # 7. EFFICIENCY SCORE (VMAF per MB)
         # How much quality do I get for 1 MB of data? Higher is better engineering.
-        eff_mux = vmaf_mux / f_mux['size_mb'] if f_mux['size_mb'] > 0 else 0
-        eff_loc = vmaf_loc / f_loc['size_mb'] if f_loc['size_mb'] > 0 else 0
+        eff_mux = efficiency(vmaf_mux, f_mux['size_mb'])
+        eff_loc = efficiency(vmaf_loc, f_loc['size_mb'])
 
         # Verdict Logic
-        vmaf_diff = vmaf_loc - vmaf_mux
-        
-        if vmaf_diff > 0.5: 
+        vmaf_diff = vmaf_loc - vmaf_mux if not unscored else None
+
+        if vmaf_diff is None:
+            verdict = "NO SCORE ⚠️"
+        elif vmaf_diff > 0.5: 
             verdict = "LOCAL Wins (Quality) 🏆"
         elif vmaf_diff < -0.5: 
             if eff_loc > eff_mux: verdict = "MUX Quality / LOCAL Efficiency ⚖️"
@@ -266,28 +384,69 @@ def main():
             if eff_loc > eff_mux: verdict = "TIE (LOCAL More Efficient) 🚀"
             else: verdict = "TIE 🤝"
 
+        results.append({
+            "res": res,
+            "bitrate_kbps": {"mux": f_mux['bitrate'], "local": f_loc['bitrate']},
+            "size_mb": {"mux": f_mux['size_mb'], "local": f_loc['size_mb']},
+            "vmaf": {"mux": vmaf_mux, "local": vmaf_loc},
+            "vmaf_p1": {"mux": metric(s_mux, "vmaf_p1"), "local": metric(s_loc, "vmaf_p1")},
+            "ssim": {"mux": metric(s_mux, "ssim"), "local": metric(s_loc, "ssim")},
+            "psnr": {"mux": metric(s_mux, "psnr"), "local": metric(s_loc, "psnr")},
+            "efficiency": {"mux": eff_mux, "local": eff_loc},
+            "verdict": verdict,
+        })
         table_data.append([
             res,
             f"{f_mux['bitrate']:.0f} / {f_loc['bitrate']:.0f} k",
             f"{f_mux['size_mb']:.1f} / {f_loc['size_mb']:.1f} MB",
             f"{f_mux['gop_dur']:.1f} / {f_loc['gop_dur']:.1f} s",
-            f"{vmaf_mux:.1f} / {vmaf_loc:.1f}",
-            f"{eff_mux:.1f} / {eff_loc:.1f}",
+            f"{f_mux['idr_start_pct']:.0f} / {f_loc['idr_start_pct']:.0f} %",
+            f"{f_mux['overhead_pct']:.1f} / {f_loc['overhead_pct']:.1f} %",
+            f"{fmt(vmaf_mux, '.1f')} / {fmt(vmaf_loc, '.1f')}",
+            f"{fmt(metric(s_mux, 'vmaf_p1'), '.1f')} / {fmt(metric(s_loc, 'vmaf_p1'), '.1f')}",
+            f"{fmt(metric(s_mux, 'ssim'), '.4f')} / {fmt(metric(s_loc, 'ssim'), '.4f')}",
+            f"{fmt(metric(s_mux, 'psnr'), '.1f')} / {fmt(metric(s_loc, 'psnr'), '.1f')} dB",
+            f"{fmt(eff_mux, '.1f')} / {fmt(eff_loc, '.1f')}",
             verdict
         ])
 
+        # 8. WEAK SPOTS: lowest-VMAF windows of the local encode, mapped to segments
+        if s_loc and s_loc.frames and not args.sample:
+            for w in s_loc.frames.worst_windows("vmaf", args.window, count=3, segment_durations=r['loc_seg_durs']):
+                weak_spots.append([
+                    res,
+                    f"{w['start']:.1f}-{w['end']:.1f} s",
+                    ", ".join(f"seg_{i:03d}" for i in w.get('segments', [])),
+                    f"{w['mean']:.1f}",
+                ])
+
     print("\n\n" + "="*110)
     print("                              THE ULTIMATE COMPARISON REPORT (V2)")
     print("                              Format: (Mux Value / Local Value)")
     print("="*110)
     
-    headers = ["Res", "Bitrate", "Size", "GOP Dur", "VMAF Score", "Efficiency (VMAF/MB)", "Verdict"]
+    headers = ["Res", "Bitrate", "Size", "GOP Dur", "IDR Starts", "Container Overhead", "VMAF Score", "VMAF 1% Low", "SSIM", "PSNR (Y)", "Efficiency (VMAF/MB)", "Verdict"]
     print(tabulate(table_data, headers=headers, tablefmt="grid"))
+    if estimates:
+        print("\nSAMPLED FULL-VIDEO VMAF ESTIMATE (95% confidence interval):")
+        print(tabulate(estimates, headers=["Res", "Windows (Mux / Local)", "Mux VMAF", "Local VMAF"], tablefmt="grid"))
+    if weak_spots:
+        print(f"\nLOCAL WEAK SPOTS (worst {args.window:.0f}s VMAF windows -> candidates for more bitrate):")
+        print(tabulate(weak_spots, headers=["Res", "Window", "Segments", "Mean VMAF"], tablefmt="grid"))
     print("\nMETRICS GUIDE:")
     print("* VMAF Score: Higher is better visual quality (Max 100).")
+    print("* VMAF 1% Low: The 1st percentile frame score. Catches short drops the mean hides.")
     print("* Efficiency: Quality per Megabyte. Higher means smarter compression.")
-    print("* GOP Dur: Must be identical (e.g., 5.0 / 5.0).")
+    print("* GOP Dur: Mean keyframe interval over all segments. Must be identical (e.g., 5.0 / 5.0).")
+    print("* Container Overhead: Bytes that are neither video nor audio payload (TS: headers, PES, PSI, null stuffing;")
+    print("  fMP4: moof/mdat headers, the init section is fetched once and not counted).")
+    print("* IDR Starts: Share of segments whose first packet is a keyframe. Anything below 100% breaks ABR switching.")
     print("="*110)
 
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"original": args.original, "mux_master": args.mux_master, "local_master": args.local_master,
+                       "sampled": bool(args.sample), "renditions": results}, f, indent=2)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file